@@ -0,0 +1,133 @@
+"""
+Compare the single-pass tip parser with the steps it replaced on recorded tweets.
+
+    python -m benchmarks.tip_parser [file ...]
+
+The files are tweet logs written by the web app (logs/*-tweet.log, the default) or JSON lines files holding one tweet
+per line, either a tweet_create_events object or a plain JSON string.  The sample tweets below are only used when no
+recorded tweet is found, and do not give representative numbers.
+"""
+import ast
+import glob
+import json
+import os
+import sys
+import timeit
+from decimal import Decimal
+
+import modules.commands
+import modules.tip_parser
+
+SAMPLE_TWEETS = [
+    '@VeriTipBot !tip 5 @alice thanks for the help!',
+    'Great work today!  !tip 1.5 @bob @carol @dave, keep it up',
+    '!tip 0.25 @erin',
+    '@VeriTipBot !tip $2 @frank @grace for the stream',
+    'Nice thread, !t 10 @heidi @ivan @judy @mallory @oscar @peggy',
+    'Morning everyone, who is going to the meetup this weekend?',
+    '!tip lots @trent',
+    '@VeriTipBot ！賞 3 @victor @walter',
+    '!mancia 2 @alice @alice @bob.',
+    '@sybil @VeriTipBot !tip 1 @sybil @sybil',
+]
+
+
+def legacy_parse(text, language, sender_screen_name):
+    """
+    set_message_info, check_message_action, validate_tip_amount and set_tip_list as they parsed a tweet before the
+    parser, with the command index of modules.commands.
+    """
+    tokens = text.replace('\n', ' ').lower().split(" ")
+
+    action_index = None
+    for index, token in enumerate(tokens):
+        if modules.commands.is_tip_command(token, language):
+            action_index = index
+            break
+    if action_index is None:
+        return None
+    starting_point = action_index + 1
+
+    try:
+        if not tokens[starting_point][0].isdigit() and tokens[starting_point][0] != '.':
+            amount = (tokens[starting_point][0], Decimal(tokens[starting_point][1:]))
+        else:
+            amount = Decimal(tokens[starting_point])
+    except Exception:
+        return None
+
+    mentions = []
+    first_user_flag = False
+    for t_index in range(starting_point + 1, len(tokens)):
+        if first_user_flag and len(tokens[t_index]) > 0 and str(tokens[t_index][0]) != "@":
+            break
+        if len(tokens[t_index]) > 0 and (
+                str(tokens[t_index][0]) == "@" and str(tokens[t_index]).lower() != (
+                "@" + str(sender_screen_name).lower())):
+            first_user_flag = True
+            user = tokens[t_index]
+            if user[-1:] in ['.', '!', '?', ',']:
+                user = user[:-1]
+            mentions.append(user)
+    return amount, mentions
+
+
+def get_text(tweet):
+    return tweet.get('extended_tweet', {}).get('full_text') or tweet.get('text', '')
+
+
+def load_tweets(path):
+    """
+    Tweets of a JSON lines file, or of the deliveries recorded in a tweet log.
+    """
+    tweets = []
+    with open(path) as tweet_file:
+        for line in tweet_file:
+            line = line.strip()
+            if not line:
+                continue
+            if 'Message received from twitter: ' in line:
+                # "<time>: Message received from twitter: <repr of the webhook payload>"
+                try:
+                    payload = ast.literal_eval(line.split('Message received from twitter: ', 1)[1])
+                except (ValueError, SyntaxError):
+                    continue
+                tweets += [get_text(tweet) for tweet in payload.get('tweet_create_events', [])]
+                continue
+            tweet = json.loads(line)
+            tweets.append(get_text(tweet) if isinstance(tweet, dict) else tweet)
+    return [tweet for tweet in tweets if tweet]
+
+
+def best_time(func, number):
+    return min(timeit.repeat(func, number=number, repeat=5))
+
+
+def main():
+    paths = sys.argv[1:] or sorted(glob.glob('{}/logs/*-tweet.log'.format(os.getcwd())))
+    tweets = [tweet for path in paths for tweet in load_tweets(path)]
+    if not tweets:
+        print("No recorded tweets found, using the sample tweets")
+        tweets = SAMPLE_TWEETS
+    sender = 'sybil'
+    number = max(1, 2000 // len(tweets))
+    per_tweet = 1000000 / (number * len(tweets))
+    print("{} tweets x {} runs, best of 5".format(len(tweets), number))
+
+    for language in ['en', 'ru']:
+        def run_legacy():
+            for tweet in tweets:
+                legacy_parse(tweet, language, sender)
+
+        def run_parser():
+            for tweet in tweets:
+                modules.tip_parser.parse(tweet, language, sender)
+
+        legacy = best_time(run_legacy, number)
+        parser = best_time(run_parser, number)
+        print("{}: legacy {:.2f} us/tweet, parser {:.2f} us/tweet, speed-up {:.2f}x".format(
+            language, legacy * per_tweet, parser * per_tweet, legacy / parser))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+import configparser
+import json
+import os
+from decimal import Decimal
+
+import modules.jobs
+import modules.ledger
+import redis
+
+# Read config and parse constants
+config = configparser.ConfigParser()
+config.read('{}/webhookconfig.ini'.format(os.getcwd()))
+
+# Check the currency of the bot
+CURRENCY = config.get('main', 'currency')
+
+BALANCE_CACHE_TTL = config.getint('main', 'balance_cache_ttl', fallback=30)
+
+# Balances are kept in Redis, so every web process and job sees the invalidations of the others.  A cached balance
+# records the generation of its account read before the balance, and invalidate bumps the generation once the change
+# is committed, so a balance read before the commit and cached after it is never served.
+BALANCE_KEY = 'balances:{}:{}'
+GENERATION_KEY = 'balances:{}:{}:generation'
+
+stats = {
+    'hits': 0,
+    'misses': 0,
+    'invalidations': 0,
+    'errors': 0,
+}
+
+
+def get(account):
+    """
+    Get the balance of an account, from the cache unless the account changed since it was cached.
+    """
+    balance_key = BALANCE_KEY.format(CURRENCY, account)
+    try:
+        connection = modules.jobs.get_connection()
+        generation, stored = connection.mget(GENERATION_KEY.format(CURRENCY, account), balance_key)
+    except redis.RedisError:
+        stats['errors'] += 1
+        return modules.ledger.get_balance(account)
+
+    generation = int(generation or 0)
+    if stored is not None:
+        stored = json.loads(stored)
+        if stored['generation'] == generation:
+            stats['hits'] += 1
+            return {'balance': Decimal(stored['balance']), 'pending': Decimal(stored['pending'])}
+    stats['misses'] += 1
+
+    balance = modules.ledger.get_balance(account)
+    try:
+        connection.set(balance_key, json.dumps({'generation': generation, 'balance': str(balance['balance']),
+                                                'pending': str(balance['pending'])}), ex=BALANCE_CACHE_TTL)
+    except redis.RedisError:
+        stats['errors'] += 1
+    return balance
+
+
+def invalidate(*accounts):
+    """
+    Drop the cached balances of accounts whose funds moved.  Call it once the change is committed.
+    """
+    if not accounts:
+        return
+    try:
+        pipeline = modules.jobs.get_connection().pipeline()
+        for account in accounts:
+            generation_key = GENERATION_KEY.format(CURRENCY, account)
+            pipeline.incr(generation_key)
+            # Outlives every balance cached with an older generation
+            pipeline.expire(generation_key, BALANCE_CACHE_TTL * 2)
+        pipeline.execute()
+        stats['invalidations'] += len(accounts)
+    except redis.RedisError:
+        stats['errors'] += 1
+
+
+def get_stats():
+    cache_stats = dict(stats)
+    lookups = stats['hits'] + stats['misses']
+    cache_stats['hit_rate'] = round(stats['hits'] / lookups, 4) if lookups else 0
+    return cache_stats
@@ -0,0 +1,269 @@
+import atexit
+import configparser
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+from logging.handlers import TimedRotatingFileHandler
+
+import modules.db
+
+# Set logging info
+logger = logging.getLogger("chat_members_log")
+logger.setLevel(logging.INFO)
+handler = TimedRotatingFileHandler('{}/logs/{:%Y-%m-%d}-chat_members.log'.format(os.getcwd(), datetime.now()),
+                                   when="d",
+                                   interval=1,
+                                   backupCount=5)
+logger.addHandler(handler)
+
+# Read config and parse constants
+config = configparser.ConfigParser()
+config.read('{}/webhookconfig.ini'.format(os.getcwd()))
+
+# Seconds membership changes are buffered before they are written to telegram_chat_members
+MEMBERS_FLUSH_INTERVAL = config.getint('main', 'members_flush_interval', fallback=5)
+
+stats = {
+    'hits': 0,
+    'misses': 0,
+    'changes': 0,
+    'flushes': 0,
+    'flush_errors': 0,
+}
+
+# chat_id -> {'name': chat name, 'by_id': {member_id: member_name}, 'by_name': {lowercase member_name: member_id}}
+_chats = {}
+# member_id -> chat ids the member is in, to rename a member everywhere
+_member_chats = {}
+# (chat_id, member_id) -> (chat_name, member_name) to upsert, or None to delete
+_pending = {}
+_lock = threading.RLock()
+_thread = None
+_loaded = False
+
+
+def _after_fork():
+    global _lock
+    _lock = threading.RLock()
+
+
+os.register_at_fork(after_in_child=_after_fork)
+
+
+def _chat(chat_id, chat_name=None):
+    chat = _chats.get(chat_id)
+    if chat is None:
+        chat = _chats[chat_id] = {'name': chat_name, 'by_id': {}, 'by_name': {}}
+    elif chat_name is not None:
+        chat['name'] = chat_name
+    return chat
+
+
+def _index(chat_id, member_id, member_name, chat_name=None):
+    chat = _chat(chat_id, chat_name)
+    old_name = chat['by_id'].get(member_id)
+    if old_name is not None and chat['by_name'].get(old_name.lower()) == member_id:
+        del chat['by_name'][old_name.lower()]
+    chat['by_id'][member_id] = member_name
+    if member_name is not None:
+        chat['by_name'][member_name.lower()] = member_id
+    _member_chats.setdefault(member_id, set()).add(chat_id)
+
+
+def _unindex(chat_id, member_id):
+    chat = _chats.get(chat_id)
+    if chat is None:
+        return
+    member_name = chat['by_id'].pop(member_id, None)
+    if member_name is not None and chat['by_name'].get(member_name.lower()) == member_id:
+        del chat['by_name'][member_name.lower()]
+    _member_chats.get(member_id, set()).discard(chat_id)
+
+
+def load():
+    """
+    Rebuild the index from telegram_chat_members.
+    """
+    global _loaded
+    members_call = "SELECT chat_id, chat_name, member_id, member_name FROM telegram_chat_members"
+    members = modules.db.get_db_data(members_call)
+    with _lock:
+        _chats.clear()
+        _member_chats.clear()
+        for chat_id, chat_name, member_id, member_name in members:
+            _index(chat_id, member_id, member_name, chat_name)
+        # Changes made while the table was read are not in it yet
+        for (chat_id, member_id), change in _pending.items():
+            if change is None:
+                _unindex(chat_id, member_id)
+            else:
+                _index(chat_id, member_id, change[1], change[0])
+        _loaded = True
+    logger.info("{}: Loaded {} members of {} chats".format(datetime.now(), len(members), len(_chats)))
+
+
+def seen(chat_id, chat_name, member_id, member_name):
+    """
+    Record that a member posted in a chat under member_name.  Nothing is written unless the member is new to the chat
+    or was renamed, a rename applies to every chat of the member.
+    """
+    with _lock:
+        chat = _chats.get(chat_id)
+        if chat is not None and member_id in chat['by_id'] and chat['by_id'][member_id] == member_name:
+            return
+        if chat is None or member_id not in chat['by_id']:
+            logger.info("{}: User {}-{} not found in index, inserting".format(datetime.now(), chat_id, member_name))
+            add(chat_id, chat_name, member_id, member_name)
+            return
+        logger.info("Member ID {} name incorrect in index.  Stored value: {}  Updating to {}"
+                    .format(member_id, chat['by_id'][member_id], member_name))
+        for member_chat_id in list(_member_chats.get(member_id, ())):
+            add(member_chat_id, _chats[member_chat_id]['name'], member_id, member_name)
+
+
+def add(chat_id, chat_name, member_id, member_name):
+    with _lock:
+        _index(chat_id, member_id, member_name, chat_name)
+        if member_name is not None:
+            # telegram_chat_members has no room for members without a username, they are only indexed by id
+            _pending[(chat_id, member_id)] = (_chats[chat_id]['name'] or '', member_name)
+        stats['changes'] += 1
+
+
+def remove(chat_id, member_id):
+    with _lock:
+        _unindex(chat_id, member_id)
+        _pending[(chat_id, member_id)] = None
+        stats['changes'] += 1
+
+
+def resolve(chat_id, member_names=(), member_ids=()):
+    """
+    Get (member_id, member_name) of members of a chat by username or id, or None for the ones who are not members.
+    Returns a dict keyed by lowercase username or str member id.  Every lookup is confirmed against
+    telegram_chat_members with a single query, so the joins, leaves and renames handled by the other processes are
+    seen once they are flushed.  The changes of this process that are not written yet override the table.
+    """
+    member_names = [member_name.lower() for member_name in member_names]
+    member_ids = [int(member_id) for member_id in member_ids]
+    if not member_names and not member_ids:
+        return {}
+
+    members_call = ("SELECT member_id, member_name FROM telegram_chat_members "
+                    "WHERE chat_id = %s AND (member_name IN ({}) OR member_id IN ({}))"
+                    .format(', '.join(['%s'] * len(member_names)) or 'NULL',
+                            ', '.join(['%s'] * len(member_ids)) or 'NULL'))
+    members = dict(modules.db.get_db_data_new(members_call, [chat_id] + member_names + member_ids))
+
+    with _lock:
+        chat = _chats.get(chat_id, {'by_id': {}, 'by_name': {}})
+        # Bring the index up to date with the rows read, so seen writes a member another process removed again
+        for member_name in member_names:
+            member_id = chat['by_name'].get(member_name)
+            if member_id is not None and members.get(member_id, '').lower() != member_name:
+                if (chat_id, member_id) not in _pending:
+                    _unindex(chat_id, member_id)
+        for member_id in member_ids:
+            if member_id in chat['by_id'] and member_id not in members and (chat_id, member_id) not in _pending:
+                _unindex(chat_id, member_id)
+        for member_id, member_name in members.items():
+            if (chat_id, member_id) not in _pending:
+                _index(chat_id, member_id, member_name)
+
+        for (pending_chat_id, member_id), change in _pending.items():
+            if pending_chat_id != chat_id:
+                continue
+            if change is None:
+                members.pop(member_id, None)
+            else:
+                members[member_id] = change[1]
+
+    by_name = {member_name.lower(): (member_id, member_name) for member_id, member_name in members.items()}
+    resolved = {}
+    for member_name in member_names:
+        resolved[member_name] = by_name.get(member_name)
+    for member_id in member_ids:
+        resolved[str(member_id)] = (member_id, members[member_id]) if member_id in members else None
+    found = len([member for member in resolved.values() if member is not None])
+    stats['hits'] += found
+    stats['misses'] += len(resolved) - found
+    return resolved
+
+
+def flush():
+    """
+    Write the buffered changes with one upsert and one delete.  Changes that fail to be written are kept for the next
+    flush.
+    """
+    with _lock:
+        if not _pending:
+            return 0
+        changes = dict(_pending)
+        _pending.clear()
+
+    upserts = [(key, change) for key, change in changes.items() if change is not None]
+    deletes = [key for key, change in changes.items() if change is None]
+    try:
+        with modules.db.transaction() as db_cursor:
+            if upserts:
+                upsert_call = ("INSERT INTO telegram_chat_members (chat_id, chat_name, member_id, member_name) "
+                               "VALUES {} ON DUPLICATE KEY UPDATE chat_name = VALUES(chat_name), "
+                               "member_name = VALUES(member_name)"
+                               .format(', '.join(['(%s, %s, %s, %s)'] * len(upserts))))
+                upsert_values = []
+                for (chat_id, member_id), (chat_name, member_name) in upserts:
+                    upsert_values += [chat_id, chat_name, member_id, member_name]
+                db_cursor.execute(upsert_call, upsert_values)
+            if deletes:
+                delete_call = ("DELETE FROM telegram_chat_members WHERE (chat_id, member_id) IN ({})"
+                               .format(', '.join(['(%s, %s)'] * len(deletes))))
+                delete_values = []
+                for chat_id, member_id in deletes:
+                    delete_values += [chat_id, member_id]
+                db_cursor.execute(delete_call, delete_values)
+    except Exception as e:
+        stats['flush_errors'] += 1
+        logger.info("{}: Could not write {} membership changes: {}".format(datetime.now(), len(changes), e))
+        with _lock:
+            for key, change in changes.items():
+                _pending.setdefault(key, change)
+        return 0
+    stats['flushes'] += 1
+    return len(changes)
+
+
+def get_stats():
+    members_stats = dict(stats)
+    members_stats['chats'] = len(_chats)
+    members_stats['pending'] = len(_pending)
+    members_stats['loaded'] = _loaded
+    return members_stats
+
+
+def run_forever():
+    while True:
+        try:
+            if not _loaded:
+                load()
+            flush()
+        except Exception as e:
+            logger.info("{}: Error flushing membership changes: {}".format(datetime.now(), e))
+        time.sleep(MEMBERS_FLUSH_INTERVAL)
+
+
+def start():
+    """
+    Rebuild the index and start writing the changes of this process behind.
+    """
+    global _thread
+    if _thread is not None and _thread.is_alive():
+        return
+    try:
+        load()
+    except Exception as e:
+        logger.info("{}: Could not load the chat members, retrying in the background: {}".format(datetime.now(), e))
+    atexit.register(flush)
+    _thread = threading.Thread(target=run_forever, name='chat-members', daemon=True)
+    _thread.start()
@@ -0,0 +1,108 @@
+import unicodedata
+
+import modules.translations as translations
+
+# Actions, in the order parse_action used to check them.  A token that belongs to two actions resolves to the first.
+HELP = 'help'
+MUTE = 'mute'
+UNMUTE = 'unmute'
+BALANCE = 'balance'
+REGISTER = 'register'
+TIP = 'tip'
+WITHDRAW = 'withdraw'
+DONATE = 'donate'
+ACCOUNT = 'account'
+PRIVATE_TIP = 'private_tip'
+LANGUAGE = 'language'
+LANGUAGE_LIST = 'language_list'
+AUTO_DONATE = 'auto_donate'
+
+COMMAND_TABLES = [
+    (HELP, translations.help_commands),
+    (MUTE, translations.set_mute_commands),
+    (UNMUTE, translations.set_unmute_commands),
+    (BALANCE, translations.balance_commands),
+    (REGISTER, translations.register_commands),
+    (TIP, translations.coin_tip_commands),
+    (WITHDRAW, translations.withdraw_commands),
+    (DONATE, translations.donate_commands),
+    (ACCOUNT, translations.account_commands),
+    (PRIVATE_TIP, translations.private_tip_commands),
+    (LANGUAGE, translations.language_commands),
+    (LANGUAGE_LIST, translations.language_list_commands),
+    (AUTO_DONATE, translations.auto_donate_commands),
+]
+
+LANGUAGES = list(translations.coin_tip_commands.keys())
+
+
+def normalise(token):
+    """
+    Fold full-width characters and case, so '！賞' matches '!賞' and '!TIP' matches '!tip'.
+    """
+    return unicodedata.normalize('NFKC', token).strip().lower()
+
+
+def build_index():
+    """
+    Map (normalised token, user language) to (action, language of the command).  Users can always use the English
+    commands, plus the ones of their language.  Language-free commands have None as their language.
+    """
+    index = {}
+    for user_language in LANGUAGES:
+        for action, commands in COMMAND_TABLES:
+            if isinstance(commands, dict):
+                tokens = [(token, 'en') for token in commands['en']]
+                tokens += [(token, user_language) for token in commands.get(user_language, [])]
+            else:
+                tokens = [(token, None) for token in commands]
+            for token, command_language in tokens:
+                index.setdefault((normalise(token), user_language), (action, command_language))
+    return index
+
+
+INDEX = build_index()
+
+# First tip command of each language, falling back to English for languages without their own
+TIP_COMMAND = {
+    language: (translations.coin_tip_commands[language] or translations.coin_tip_commands['en'])[0]
+    for language in LANGUAGES
+}
+
+# Normalised tip commands available to each language, for parsers testing every token of a message
+TIP_TOKENS = {
+    language: frozenset(token for (token, user_language), (action, _) in INDEX.items()
+                        if user_language == language and action == TIP)
+    for language in LANGUAGES
+}
+
+
+def lookup(token, language):
+    """
+    Get the (action, command language) of a token for a user of the given language, or None.
+    """
+    if language not in TIP_COMMAND:
+        language = 'en'
+    return INDEX.get((normalise(token), language))
+
+
+def get_action(token, language):
+    match = lookup(token, language)
+    if match is None:
+        return None
+    return match[0]
+
+
+def is_tip_command(token, language):
+    return get_action(token, language) == TIP
+
+
+def tip_command(language):
+    """
+    The tip command to show a user in replies.
+    """
+    return TIP_COMMAND.get(language, TIP_COMMAND['en'])
+
+
+def tip_tokens(language):
+    return TIP_TOKENS.get(language, TIP_TOKENS['en'])
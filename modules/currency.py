@@ -1,15 +1,13 @@
 import configparser
-import json
 import logging
 import os
 import re
 from datetime import datetime
 from decimal import Decimal
-
-import requests
 from logging.handlers import TimedRotatingFileHandler
 
 import modules.db
+import modules.prices
 import modules.social
 import modules.translations as translations
 
@@ -37,14 +35,9 @@ def get_fiat_conversion(symbol, fiat_amount):
     fiat = convert_symbol_to_fiat(symbol)
     if fiat == 'UNSUPPORTED':
         return -1
-    crypto_currency = CURRENCY.lower()
-    fiat = fiat.lower()
-    post_url = 'https://api.coingecko.com/api/v3/coins/{}'.format(crypto_currency)
     try:
-        # Retrieve price conversion from API
-        response = requests.get(post_url)
-        response_json = json.loads(response.text)
-        price = Decimal(response_json['market_data']['current_price'][fiat])
+        # Prices are refreshed in the background, the tip never waits on the price API
+        price = modules.prices.get_price(fiat)
         # Find value of 0.01 in the retrieved crypto
         penny_value = Decimal(0.01) / price
         # Find precise amount of the fiat amount in crypto
@@ -79,17 +72,9 @@ def convert_symbol_to_fiat(symbol):
 
 
 def get_fiat_price(fiat):
-    fiat = fiat.upper()
-    crypto_currency = CURRENCY.upper()
-    post_url = 'https://min-api.cryptocompare.com/data/price?fsym={}&tsyms={}'.format(crypto_currency, fiat)
     try:
-        # Retrieve price conversion from API
-        response = requests.get(post_url)
-        response_json = json.loads(response.text)
-        price = response_json['{}'.format(fiat)]
-
-        return price
+        return modules.prices.get_price(fiat)
     except Exception as e:
         logger.info("{}: Exception converting fiat price to crypto price".format(datetime.now()))
         logger.info("{}: {}".format(datetime.now(), e))
-        raise e
\ No newline at end of file
+        raise e
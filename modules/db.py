@@ -1,11 +1,19 @@
 import configparser
 import logging
 import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
 from datetime import datetime
 from decimal import *
 from logging.handlers import TimedRotatingFileHandler
 
-import modules.rpc as rpc
+import modules.ledger
+import modules.migrations
+import modules.spare_pool
+import modules.tip_feed
+import modules.tip_stats
 import MySQLdb
 
 # Set logging info
@@ -30,32 +38,485 @@ DB_USER = config.get('main', 'user')
 DB_PW = config.get('main', 'password')
 DB_SCHEMA = config.get(CURRENCY, 'schema')
 
+# DB pool settings
+DB_POOL_SIZE = config.getint('main', 'db_pool_size', fallback=5)
+DB_POOL_TIMEOUT = config.getint('main', 'db_pool_timeout', fallback=30)
+DB_POOL_RECYCLE = config.getint('main', 'db_pool_recycle', fallback=3600)
+DB_POOL_PING_IDLE = config.getint('main', 'db_pool_ping_idle', fallback=60)
 
-def db_init():
-    if not check_db_exist():
-        logger.info("db didn't exist: {}".format(DB_SCHEMA))
-        create_db()
-    logger.info("db did exist: {}".format(DB_SCHEMA))
-    create_tables()
-    create_triggers()
 
+class PoolTimeout(Exception):
+    pass
 
-def check_db_exist():
-    db = MySQLdb.connect(host=DB_HOST, port=3306, user=DB_USER, passwd=DB_PW, use_unicode=True,
-                         charset="utf8mb4")
-    logger.info("Checking if schema exists: {}".format(DB_SCHEMA))
-    sql = "SHOW DATABASES LIKE '{}'".format(DB_SCHEMA)
-    db_cursor = db.cursor()
-    exists = db_cursor.execute(sql)
-    db_cursor.close()
-    db.close()
 
-    return exists == 1
+class PooledConnection(object):
+    """
+    A MySQL connection checked out of the pool, with the bookkeeping needed to recycle it.
+    """
+    def __init__(self, conn):
+        self.conn = conn
+        self.pid = os.getpid()
+        self.created = time.monotonic()
+        self.last_used = self.created
+
+
+class ConnectionPool(object):
+    """
+    Bounded pool of MySQL connections to DB_SCHEMA.
+
+    Idle connections are pinged before reuse once they have been idle for ping_idle seconds, and closed once they are
+    older than recycle seconds.  The pool is rebuilt in a child process after os.fork(): connections inherited from the
+    parent are kept referenced but never used or closed, as closing them would end the parent's session.
+    """
+    def __init__(self, size, timeout, recycle, ping_idle):
+        self.size = size
+        self.timeout = timeout
+        self.recycle = recycle
+        self.ping_idle = ping_idle
+        self._inherited = []
+        self._idle = []
+        self._reset()
+
+    def _reset(self):
+        self._inherited.extend(self._idle)
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(self.size)
+        self._idle = []
+
+    def after_fork(self):
+        if self._pid != os.getpid():
+            self._reset()
+
+    def _connect(self):
+        conn = MySQLdb.connect(host=DB_HOST, port=3306, user=DB_USER, passwd=DB_PW, db=DB_SCHEMA, use_unicode=True,
+                               charset="utf8mb4")
+        # Reads are not wrapped in transactions, so a pooled connection must not hold on to an old snapshot.
+        conn.autocommit(True)
+        return PooledConnection(conn)
+
+    def _discard(self, entry):
+        try:
+            entry.conn.close()
+        except Exception as e:
+            logger.info("{}: Error closing pooled connection: {}".format(datetime.now(), e))
+
+    def _usable(self, entry):
+        now = time.monotonic()
+        if now - entry.created > self.recycle:
+            return False
+        if now - entry.last_used > self.ping_idle:
+            try:
+                entry.conn.ping()
+            except MySQLdb.Error:
+                return False
+        return True
+
+    def acquire(self):
+        self.after_fork()
+        if not self._slots.acquire(timeout=self.timeout):
+            raise PoolTimeout("No DB connection available after {} seconds".format(self.timeout))
+        try:
+            while True:
+                with self._lock:
+                    entry = self._idle.pop() if self._idle else None
+                if entry is None:
+                    return self._connect()
+                if self._usable(entry):
+                    return entry
+                self._discard(entry)
+        except Exception:
+            self._slots.release()
+            raise
+
+    def release(self, entry, discard=False):
+        if entry.pid != os.getpid() or self._pid != os.getpid():
+            # Checked out before a fork, the slot belongs to the other process
+            return
+        if discard:
+            self._discard(entry)
+        else:
+            entry.last_used = time.monotonic()
+            with self._lock:
+                self._idle.append(entry)
+        self._slots.release()
+
+
+pool = ConnectionPool(DB_POOL_SIZE, DB_POOL_TIMEOUT, DB_POOL_RECYCLE, DB_POOL_PING_IDLE)
+os.register_at_fork(after_in_child=pool.after_fork)
+
+
+@contextmanager
+def connection():
+    """
+    Check a connection out of the pool for the duration of the with block.
+    """
+    entry = pool.acquire()
+    try:
+        yield entry.conn
+    except MySQLdb.OperationalError:
+        pool.release(entry, discard=True)
+        raise
+    except BaseException:
+        try:
+            entry.conn.rollback()
+        except MySQLdb.Error:
+            pool.release(entry, discard=True)
+            raise
+        pool.release(entry)
+        raise
+    else:
+        pool.release(entry)
+
+
+@contextmanager
+def transaction():
+    """
+    Run the statements executed on the yielded cursor in a single transaction, committed when the with block exits
+    cleanly and rolled back otherwise.
+    """
+    with connection() as db:
+        db_cursor = db.cursor()
+        db_cursor.execute("START TRANSACTION")
+        try:
+            yield db_cursor
+            db.commit()
+        except BaseException:
+            db.rollback()
+            raise
+        finally:
+            db_cursor.close()
+
+
+# Tables created by db_init, in creation order
+TABLES = [
+    ('users', """
+    CREATE TABLE IF NOT EXISTS `users` (
+      `user_id` bigint(255) NOT NULL,
+      `from_app` varchar(45) DEFAULT NULL,
+      `user_name` varchar(100) DEFAULT NULL,
+      `account` varchar(100) NOT NULL,
+      `address` varchar(100) DEFAULT NULL,
+      `register` tinyint(1) NOT NULL DEFAULT '0',
+      `created_ts` timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP,
+      `mute` tinyint(1) NOT NULL DEFAULT '0',
+      PRIMARY KEY (`user_id`),
+      UNIQUE KEY `user_id_UNIQUE` (`user_id`),
+      UNIQUE KEY `account_UNIQUE` (`account`),
+      UNIQUE KEY `address_UNIQUE` (`address`)
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+    """),
+    ('telegram_chat_members', """
+    CREATE TABLE IF NOT EXISTS `telegram_chat_members` (
+      `chat_id` bigint(100) NOT NULL,
+      `chat_name` varchar(100) CHARACTER SET utf8mb4 NOT NULL,
+      `member_id` bigint(100) NOT NULL,
+      `member_name` varchar(191) COLLATE utf8mb4_unicode_ci NOT NULL,
+      PRIMARY KEY (`chat_id`,`member_id`)
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+    """),
+    ('tip_list', """
+    CREATE TABLE IF NOT EXISTS `tip_list` (
+      `dm_id` bigint(255) NOT NULL,
+      `tx_id` varchar(255) DEFAULT NULL,
+      `processed` tinyint(1) DEFAULT NULL,
+      `sender_id` bigint(255) NOT NULL,
+      `receiver_id` bigint(255) NOT NULL,
+      `from_app` varchar(45) DEFAULT NULL,
+      `dm_text` text DEFAULT NULL,
+      `amount` decimal(10,5) DEFAULT NULL,
+      `timestamp` timestamp NULL DEFAULT CURRENT_TIMESTAMP,
+      PRIMARY KEY (`dm_id`,`sender_id`,`receiver_id`)
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+    """),
+    ('dm_list', """
+    CREATE TABLE IF NOT EXISTS `dm_list` (
+     `dm_id` bigint(255) NOT NULL,
+     `tx_id` varchar(100) GENERATED ALWAYS AS (concat('tip-',`dm_id`)) PERSISTENT,
+     `processed` tinyint(1) NOT NULL,
+     `sender_id` bigint(255) NOT NULL,
+     `receiver_id` bigint(255) DEFAULT NULL,
+     `dm_text` text DEFAULT NULL,
+     `from_app` varchar(45) DEFAULT NULL,
+     `amount` decimal(10,5) DEFAULT NULL,
+     `dm_response` text DEFAULT NULL,
+     `first_attempt` tinyint(1) DEFAULT '0',
+     `timestamp` timestamp NULL DEFAULT CURRENT_TIMESTAMP,
+     PRIMARY KEY (`dm_id`),
+     UNIQUE KEY `tx_id_UNIQUE` (`tx_id`)
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+    """),
+    ('donation_info', """
+    CREATE TABLE IF NOT EXISTS `donation_info` (
+      `user_id` bigint(255) NOT NULL,
+      `from_app` varchar(45) NOT NULL,
+      `donation_percent` int(3) DEFAULT '0',
+      PRIMARY KEY (`user_id`,`from_app`)
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+    """),
+    ('languages', """
+    CREATE TABLE IF NOT EXISTS `languages` (
+      `user_id` bigint(255) NOT NULL,
+      `language_code` varchar(2) CHARACTER SET utf8mb4 NOT NULL DEFAULT 'en',
+      `from_app` varchar(45) CHARACTER SET utf8mb4 NOT NULL,
+      PRIMARY KEY (`user_id`),
+      UNIQUE KEY `user_id_UNIQUE` (`user_id`),
+      CONSTRAINT `user_key` FOREIGN KEY (`user_id`) REFERENCES `users` (`user_id`) ON DELETE NO ACTION ON UPDATE NO ACTION
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+    """),
+    ('return_address', """
+    CREATE TABLE IF NOT EXISTS `return_address` (
+      `user_id` bigint(255) NOT NULL,
+      `from_app` varchar(45) NOT NULL,
+      `account` varchar(100) DEFAULT NULL,
+      `last_action` datetime DEFAULT CURRENT_TIMESTAMP,
+      PRIMARY KEY (`user_id`,`from_app`)
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+    """),
+    ('spare_accounts', """
+    CREATE TABLE IF NOT EXISTS `spare_accounts` (
+     `account` varchar(100) NOT NULL,
+     `address` varchar(100) NOT NULL,
+     PRIMARY KEY (`account`)
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+    """),
+    ('ledger_accounts', """
+    CREATE TABLE IF NOT EXISTS `ledger_accounts` (
+     `account` varchar(100) NOT NULL,
+     `balance` decimal(20,8) NOT NULL DEFAULT '0',
+     `pending` decimal(20,8) NOT NULL DEFAULT '0',
+     `opened_height` int(11) NOT NULL DEFAULT '0',
+     `updated_ts` timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+     PRIMARY KEY (`account`)
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+    """),
+    ('ledger_entries', """
+    CREATE TABLE IF NOT EXISTS `ledger_entries` (
+     `id` bigint(255) NOT NULL AUTO_INCREMENT,
+     `ref` varchar(255) NOT NULL,
+     `kind` varchar(45) NOT NULL,
+     `account` varchar(100) NOT NULL,
+     `amount` decimal(20,8) NOT NULL,
+     `created_ts` timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP,
+     PRIMARY KEY (`id`),
+     UNIQUE KEY `ref_account_UNIQUE` (`ref`, `account`),
+     KEY `account_idx` (`account`, `id`)
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+    """),
+    ('withdrawal_queue', """
+    CREATE TABLE IF NOT EXISTS `withdrawal_queue` (
+     `id` bigint(255) NOT NULL AUTO_INCREMENT,
+     `ref` varchar(255) NOT NULL,
+     `account` varchar(100) NOT NULL,
+     `address` varchar(100) NOT NULL,
+     `amount` decimal(20,8) NOT NULL,
+     `user_id` bigint(255) NOT NULL,
+     `from_app` varchar(45) NOT NULL,
+     `language` varchar(5) NOT NULL DEFAULT 'en',
+     `status` varchar(10) NOT NULL DEFAULT 'queued',
+     `tx_id` varchar(100) DEFAULT NULL,
+     `created_ts` timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP,
+     `settled_ts` timestamp NULL DEFAULT NULL,
+     PRIMARY KEY (`id`),
+     UNIQUE KEY `ref_UNIQUE` (`ref`),
+     KEY `status_idx` (`status`, `id`)
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+    """),
+    ('deposits', """
+    CREATE TABLE IF NOT EXISTS `deposits` (
+     `txid` varchar(100) NOT NULL,
+     `address` varchar(100) NOT NULL,
+     `account` varchar(100) NOT NULL,
+     `amount` decimal(20,8) NOT NULL,
+     `confirmations` int(11) NOT NULL DEFAULT '0',
+     `block_height` int(11) DEFAULT NULL,
+     `credited` tinyint(1) NOT NULL DEFAULT '0',
+     `created_ts` timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP,
+     PRIMARY KEY (`txid`, `address`),
+     KEY `account_credited_idx` (`account`, `credited`),
+     KEY `credited_idx` (`credited`, `confirmations`)
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+    """),
+    ('chain_checkpoint', """
+    CREATE TABLE IF NOT EXISTS `chain_checkpoint` (
+     `id` tinyint(1) NOT NULL,
+     `block_hash` varchar(100) NOT NULL,
+     `height` int(11) NOT NULL,
+     `updated_ts` timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+     PRIMARY KEY (`id`)
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+    """),
+    ('outbox', """
+    CREATE TABLE IF NOT EXISTS `outbox` (
+     `id` bigint(255) NOT NULL AUTO_INCREMENT,
+     `from_app` varchar(45) NOT NULL,
+     `kind` varchar(10) NOT NULL,
+     `receiver` varchar(100) NOT NULL,
+     `reply_to` varchar(100) DEFAULT NULL,
+     `text` text NOT NULL,
+     `status` varchar(10) NOT NULL DEFAULT 'pending',
+     `attempts` int(11) NOT NULL DEFAULT '0',
+     `next_attempt` datetime NOT NULL DEFAULT CURRENT_TIMESTAMP,
+     `last_error` text DEFAULT NULL,
+     `created_ts` timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP,
+     `sent_ts` timestamp NULL DEFAULT NULL,
+     PRIMARY KEY (`id`),
+     KEY `status_next_idx` (`status`, `next_attempt`, `id`)
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+    """),
+    ('tip_totals', """
+    CREATE TABLE IF NOT EXISTS `tip_totals` (
+     `from_app` varchar(45) NOT NULL,
+     `total_amount` decimal(20,5) NOT NULL DEFAULT '0.00000',
+     `tip_count` bigint(20) NOT NULL DEFAULT '0',
+     `largest_amount` decimal(20,5) NOT NULL DEFAULT '0.00000',
+     `largest_sender_id` bigint(255) DEFAULT NULL,
+     `largest_ts` timestamp NULL DEFAULT NULL,
+     PRIMARY KEY (`from_app`)
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+    """),
+    ('tipper_totals', """
+    CREATE TABLE IF NOT EXISTS `tipper_totals` (
+     `sender_id` bigint(255) NOT NULL,
+     `from_app` varchar(45) NOT NULL,
+     `total_amount` decimal(20,5) NOT NULL DEFAULT '0.00000',
+     `tip_count` bigint(20) NOT NULL DEFAULT '0',
+     PRIMARY KEY (`sender_id`, `from_app`),
+     KEY `total_amount_idx` (`total_amount`)
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+    """),
+    ('tip_buckets', """
+    CREATE TABLE IF NOT EXISTS `tip_buckets` (
+     `bucket` varchar(10) NOT NULL,
+     `bucket_start` datetime NOT NULL,
+     `from_app` varchar(45) NOT NULL,
+     `total_amount` decimal(20,5) NOT NULL DEFAULT '0.00000',
+     `tip_count` bigint(20) NOT NULL DEFAULT '0',
+     PRIMARY KEY (`bucket`, `bucket_start`, `from_app`)
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+    """),
+    ('tip_feed', """
+    CREATE TABLE IF NOT EXISTS `tip_feed` (
+     `id` bigint(255) NOT NULL AUTO_INCREMENT,
+     `tip_id` varchar(255) DEFAULT NULL,
+     `from_app` varchar(45) NOT NULL,
+     `sender_id` bigint(255) NOT NULL,
+     `sender_name` varchar(100) DEFAULT NULL,
+     `sender_address` varchar(100) DEFAULT NULL,
+     `receiver_id` bigint(255) NOT NULL,
+     `receiver_name` varchar(100) DEFAULT NULL,
+     `receiver_address` varchar(100) DEFAULT NULL,
+     `amount` decimal(10,5) NOT NULL,
+     `timestamp` timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP,
+     PRIMARY KEY (`id`),
+     UNIQUE KEY `tip_id_UNIQUE` (`tip_id`),
+     KEY `timestamp_id_idx` (`timestamp`, `id`)
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+    """),
+]
+
+# Triggers created by db_init: name -> (table, body)
+TRIGGERS = {
+    'users_AFTER_INSERT': ('users', """
+        BEGIN 
+            INSERT INTO `languages` (`user_id`, `from_app`) 
+            VALUES (NEW.`user_id`, NEW.`from_app`);
+            INSERT INTO `return_address` (`user_id`, `from_app`, `last_action`) 
+            VALUES (NEW.`user_id`, NEW.`from_app`, now());
+            INSERT INTO `donation_info` (`user_id`, `from_app`)
+            VALUES (NEW.`user_id`, NEW.`from_app`);
+        END
+        """),
+    'tip_list_AFTER_INSERT': ('tip_list', """
+        BEGIN 
+            UPDATE `return_address` SET `last_action` = now() 
+            WHERE `user_id` = new.`sender_id` 
+            AND `from_app` = new.`from_app`;
+        END
+        """),
+    'dm_list_AFTER_INSERT': ('dm_list', """
+        BEGIN 
+            UPDATE `return_address` SET `last_action` = now() 
+            WHERE `user_id` = new.`sender_id` 
+            AND `from_app` = new.`from_app`;
+        END
+        """),
+}
+
+# The schema, its tables with their comment and its triggers with their body, in one round trip
+SCHEMA_STATE_CALL = ("SELECT 'schema', SCHEMA_NAME, NULL FROM information_schema.SCHEMATA WHERE SCHEMA_NAME = %s "
+                     "UNION ALL "
+                     "SELECT 'table', TABLE_NAME, TABLE_COMMENT FROM information_schema.TABLES "
+                     "WHERE TABLE_SCHEMA = %s "
+                     "UNION ALL "
+                     "SELECT 'trigger', TRIGGER_NAME, ACTION_STATEMENT FROM information_schema.TRIGGERS "
+                     "WHERE TRIGGER_SCHEMA = %s")
+
+
+def server_connection():
+    """
+    Connection to the server without selecting the schema, which may not exist yet.
+    """
+    return MySQLdb.connect(host=DB_HOST, port=3306, user=DB_USER, passwd=DB_PW, use_unicode=True, charset="utf8mb4")
+
+
+def _normalise_sql(sql):
+    return ' '.join((sql or '').split()).rstrip(';').strip()
+
+
+def get_schema_state():
+    """
+    Read whether the schema exists, its tables and its triggers with a single information_schema query.
+    """
+    db = server_connection()
+    try:
+        db_cursor = db.cursor()
+        db_cursor.execute(SCHEMA_STATE_CALL, [DB_SCHEMA, DB_SCHEMA, DB_SCHEMA])
+        rows = db_cursor.fetchall()
+        db_cursor.close()
+    finally:
+        db.close()
+
+    state = {'exists': False, 'tables': {}, 'triggers': {}}
+    for kind, name, detail in rows:
+        if kind == 'schema':
+            state['exists'] = True
+        elif kind == 'table':
+            state['tables'][name] = detail
+        else:
+            state['triggers'][name] = detail
+    return state
+
+
+def db_init():
+    """
+    Bring the schema up to date.  Nothing but the state query runs when the schema is already current, so starting a
+    worker costs the same however many tables there are.
+    """
+    state = get_schema_state()
+    missing_tables = [name for name, _ in TABLES if name not in state['tables']]
+    stale_triggers = [name for name, (_, body) in TRIGGERS.items()
+                      if _normalise_sql(state['triggers'].get(name)) != _normalise_sql(body)]
+    version = modules.migrations.parse_version(state['tables'].get(modules.migrations.VERSION_TABLE))
+    if (state['exists'] and not missing_tables and not stale_triggers and
+            version == modules.migrations.latest_version()):
+        logger.info("Schema {} is up to date at version {}".format(DB_SCHEMA, version))
+        return
+
+    if not state['exists']:
+        logger.info("db didn't exist: {}".format(DB_SCHEMA))
+        create_db()
+    if missing_tables:
+        create_tables(missing_tables)
+    if stale_triggers:
+        create_triggers(stale_triggers)
+    if version != modules.migrations.latest_version():
+        version = modules.migrations.migrate()
+    logger.info("Schema {} updated to version {}".format(DB_SCHEMA, version))
 
 
 def create_db():
-    db = MySQLdb.connect(host=DB_HOST, port=3306, user=DB_USER, passwd=DB_PW, use_unicode=True,
-                         charset="utf8mb4")
+    db = server_connection()
     db_cursor = db.cursor()
     sql = 'CREATE DATABASE IF NOT EXISTS {}'.format(DB_SCHEMA)
     db_cursor.execute(sql)
@@ -65,230 +526,48 @@ def create_db():
     logger.info('Created database')
 
 
-def check_table_exists(table_name):
-    db = MySQLdb.connect(host=DB_HOST, port=3306, user=DB_USER, passwd=DB_PW, db=DB_SCHEMA, use_unicode=True,
-                         charset="utf8mb4")
-    db_cursor = db.cursor()
-    sql = "SHOW TABLES LIKE '{}'".format(table_name)
-    db_cursor.execute(sql)
-    result = db_cursor.fetchall()
-    return result
-
+def create_triggers(names=None):
+    """
+    Create the triggers, or replace the given ones.  CREATE OR REPLACE swaps a trigger without a moment where the
+    table has none.
+    """
+    if names is None:
+        names = list(TRIGGERS)
+    with connection() as db:
+        db_cursor = db.cursor()
+        for name in names:
+            table, body = TRIGGERS[name]
+            db_cursor.execute("CREATE OR REPLACE DEFINER = CURRENT_USER TRIGGER `{}` AFTER INSERT ON `{}` "
+                              "FOR EACH ROW {}".format(name, table, body))
+            logger.info("Trigger {} set.".format(name))
+        db_cursor.close()
 
-def create_triggers():
-    db = MySQLdb.connect(host=DB_HOST, port=3306, user=DB_USER, passwd=DB_PW, db=DB_SCHEMA, use_unicode=True,
-                         charset="utf8mb4")
-    db_cursor = db.cursor()
-    db_cursor.execute("DROP TRIGGER IF EXISTS users_AFTER_INSERT;")
-    db_cursor.execute("DROP TRIGGER IF EXISTS tip_list_AFTER_INSERT;")
-    db_cursor.execute("DROP TRIGGER IF EXISTS dm_list_AFTER_INSERT;")
-    user_trigger = """
-                   CREATE TRIGGER `users_AFTER_INSERT` AFTER INSERT ON `users` FOR EACH ROW 
-                   BEGIN 
-                       INSERT INTO `languages` (`user_id`, `from_app`) 
-                       VALUES (NEW.`user_id`, NEW.`from_app`);
-                       INSERT INTO `return_address` (`user_id`, `from_app`, `last_action`) 
-                       VALUES (NEW.`user_id`, NEW.`from_app`, now());
-                       INSERT INTO `donation_info` (`user_id`, `from_app`)
-                       VALUES (NEW.`user_id`, NEW.`from_app`);
-                   END
-                   """
-    tip_list_trigger = """
-                       CREATE DEFINER = CURRENT_USER TRIGGER `tip_list_AFTER_INSERT` AFTER INSERT ON `tip_list` FOR EACH ROW 
-                       BEGIN 
-                           UPDATE `return_address` SET `last_action` = now() 
-                           WHERE `user_id` = new.`sender_id` 
-                           AND `from_app` = new.`from_app`;
-                       END
-                       """
-    dm_list_trigger = """
-                      CREATE TRIGGER `dm_list_AFTER_INSERT` AFTER INSERT ON `dm_list` FOR EACH ROW 
-                      BEGIN 
-                          UPDATE `return_address` SET `last_action` = now() 
-                          WHERE `user_id` = new.`sender_id` 
-                          AND `from_app` = new.`from_app`;
-                      END;
-                      """
-
-
-    db_cursor.execute(user_trigger)
-    db_cursor.execute(tip_list_trigger)
-    db_cursor.execute(dm_list_trigger)
-    logger.info("Triggers set.")
-
-
-def create_tables():
-    db = MySQLdb.connect(host=DB_HOST, port=3306, user=DB_USER, passwd=DB_PW, db=DB_SCHEMA, use_unicode=True,
-                         charset="utf8mb4")
-    db_cursor = db.cursor()
-    try:
-        check_exists = check_table_exists('users')
-        if not check_exists:
-            # create users table
-            sql = """
-            CREATE TABLE IF NOT EXISTS `users` (
-              `user_id` bigint(255) NOT NULL,
-              `from_app` varchar(45) DEFAULT NULL,
-              `user_name` varchar(100) DEFAULT NULL,
-              `account` varchar(100) NOT NULL,
-              `address` varchar(100) NOT NULL,
-              `register` tinyint(1) NOT NULL DEFAULT '0',
-              `created_ts` timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP,
-              `mute` tinyint(1) NOT NULL DEFAULT '0',
-              PRIMARY KEY (`user_id`),
-              UNIQUE KEY `user_id_UNIQUE` (`user_id`),
-              UNIQUE KEY `account_UNIQUE` (`account`),
-              UNIQUE KEY `address_UNIQUE` (`address`)
-            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
-            """
-
-            db_cursor.execute(sql)
-            logger.info("Checking if users table was created: {}".format(
-                check_table_exists('users')))
-
-        check_exists = check_table_exists('telegram_chat_members')
-        if not check_exists:
-            # create telegram_chat_members table
-            sql = """
-            CREATE TABLE IF NOT EXISTS `telegram_chat_members` (
-              `chat_id` bigint(100) NOT NULL,
-              `chat_name` varchar(100) CHARACTER SET utf8mb4 NOT NULL,
-              `member_id` bigint(100) NOT NULL,
-              `member_name` varchar(191) COLLATE utf8mb4_unicode_ci NOT NULL,
-              PRIMARY KEY (`chat_id`,`member_id`)
-            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
-            """
-
-            db_cursor.execute(sql)
-            logger.info("Checking if telegram_chat_members table was created: {}".format(
-                check_table_exists('telegram_chat_members')))
-
-        check_exists = check_table_exists('tip_list')
-        if not check_exists:
-            # create tip_list table
-            sql = """
-            CREATE TABLE IF NOT EXISTS `tip_list` (
-              `dm_id` bigint(255) NOT NULL,
-              `tx_id` varchar(255) DEFAULT NULL,
-              `processed` tinyint(1) DEFAULT NULL,
-              `sender_id` bigint(255) NOT NULL,
-              `receiver_id` bigint(255) NOT NULL,
-              `from_app` varchar(45) DEFAULT NULL,
-              `dm_text` text DEFAULT NULL,
-              `amount` decimal(10,5) DEFAULT NULL,
-              `timestamp` timestamp NULL DEFAULT CURRENT_TIMESTAMP,
-              PRIMARY KEY (`dm_id`,`sender_id`,`receiver_id`)
-            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
-            """
-
-            db_cursor.execute(sql)
-            logger.info("Checking if tip_list table was created: {}".format(
-                check_table_exists('tip_list')))
-
-        check_exists = check_table_exists('dm_list')
-        if not check_exists:
-            # create dm_list table
-            sql = """
-            CREATE TABLE IF NOT EXISTS `dm_list` (
-             `dm_id` bigint(255) NOT NULL,
-             `tx_id` varchar(100) GENERATED ALWAYS AS (concat('tip-',`dm_id`)) PERSISTENT,
-             `processed` tinyint(1) NOT NULL,
-             `sender_id` bigint(255) NOT NULL,
-             `receiver_id` bigint(255) DEFAULT NULL,
-             `dm_text` text DEFAULT NULL,
-             `from_app` varchar(45) DEFAULT NULL,
-             `amount` decimal(10,5) DEFAULT NULL,
-             `dm_response` text DEFAULT NULL,
-             `first_attempt` tinyint(1) DEFAULT '0',
-             `timestamp` timestamp NULL DEFAULT CURRENT_TIMESTAMP,
-             PRIMARY KEY (`dm_id`),
-             UNIQUE KEY `tx_id_UNIQUE` (`tx_id`)
-            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
-            """
-            db_cursor.execute(sql)
-            logger.info("Checking if dm_list table was created: {}".format(
-                check_table_exists('dm_list')))
-
-        check_exists = check_table_exists('donation_info')
-        if not check_exists:
-            # create donation_info table
-            sql = """
-                  CREATE TABLE IF NOT EXISTS `donation_info` (
-                    `user_id` bigint(255) NOT NULL,
-                    `from_app` varchar(45) NOT NULL,
-                    `donation_percent` int(3) DEFAULT '0',
-                    PRIMARY KEY (`user_id`,`from_app`)
-                  ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
-                   """
-            db_cursor.execute(sql)
-            logger.info("Checking if donation_info table was created: {}".format(
-                check_table_exists('donation_info')))
-
-        check_exists = check_table_exists('languages')
-        if not check_exists:
-            # create languages table
-            sql = """
-                   CREATE TABLE IF NOT EXISTS `languages` (
-                     `user_id` bigint(255) NOT NULL,
-                     `language_code` varchar(2) CHARACTER SET utf8mb4 NOT NULL DEFAULT 'en',
-                     `from_app` varchar(45) CHARACTER SET utf8mb4 NOT NULL,
-                     PRIMARY KEY (`user_id`),
-                     UNIQUE KEY `user_id_UNIQUE` (`user_id`),
-                     CONSTRAINT `user_key` FOREIGN KEY (`user_id`) REFERENCES `users` (`user_id`) ON DELETE NO ACTION ON UPDATE NO ACTION
-                   ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
-                   """
-            db_cursor.execute(sql)
-            logger.info("Checking if languages table was created: {}".format(
-                check_table_exists('languages')))
-
-        check_exists = check_table_exists('return_address')
-        if not check_exists:
-            # create return_address table
-            sql = """
-                  CREATE TABLE IF NOT EXISTS `return_address` (
-                    `user_id` bigint(255) NOT NULL,
-                    `from_app` varchar(45) NOT NULL,
-                    `account` varchar(100) DEFAULT NULL,
-                    `last_action` datetime DEFAULT CURRENT_TIMESTAMP,
-                    PRIMARY KEY (`user_id`,`from_app`)
-                  ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
-                   """
-            db_cursor.execute(sql)
-            logger.info("Checking if return_address table was created: {}".format(
-                check_table_exists('return_address')))
-
-        check_exists = check_table_exists('spare_accounts')
-        if not check_exists:
-            # create spare_accounts table
-            sql= """
-            CREATE TABLE IF NOT EXISTS `spare_accounts` (
-             `account` varchar(100) NOT NULL,
-             `address` varchar(100) NOT NULL,
-             PRIMARY KEY (`account`)
-            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
-            """
-            db_cursor.execute(sql)
-            logger.info("Checking if spare_accounts table was created: {}".format(
-                check_table_exists('spare_accounts')))
 
+def create_tables(names=None):
+    """
+    Create the tables, or the given ones, in the order of TABLES.
+    """
+    if names is None:
+        names = [name for name, _ in TABLES]
+    with connection() as db:
+        db_cursor = db.cursor()
+        for name, sql in TABLES:
+            if name in names:
+                db_cursor.execute(sql)
+                logger.info("Created {} table".format(name))
         db.commit()
         db_cursor.close()
-        db.close()
-    except Exception as e:
-        logger.info("Error creating tables for DB: {}".format(e))
 
 
 def get_db_data(db_call):
     """
     Retrieve data from DB
     """
-    db = MySQLdb.connect(host=DB_HOST, port=3306, user=DB_USER, passwd=DB_PW, db=DB_SCHEMA, use_unicode=True,
-                         charset="utf8mb4")
-    db_cursor = db.cursor()
-    db_cursor.execute(db_call)
-    db_data = db_cursor.fetchall()
-    db_cursor.close()
-    db.close()
+    with connection() as db:
+        db_cursor = db.cursor()
+        db_cursor.execute(db_call)
+        db_data = db_cursor.fetchall()
+        db_cursor.close()
     return db_data
 
 
@@ -296,13 +575,11 @@ def get_db_data_new(db_call, values):
     """
     Retrieve data from DB
     """
-    db = MySQLdb.connect(host=DB_HOST, port=3306, user=DB_USER, passwd=DB_PW, db=DB_SCHEMA, use_unicode=True,
-                         charset="utf8mb4")
-    db_cursor = db.cursor()
-    db_cursor.execute(db_call, values)
-    db_data = db_cursor.fetchall()
-    db_cursor.close()
-    db.close()
+    with connection() as db:
+        db_cursor = db.cursor()
+        db_cursor.execute(db_call, values)
+        db_data = db_cursor.fetchall()
+        db_cursor.close()
     return db_data
 
 
@@ -310,14 +587,12 @@ def set_db_data(db_call, values):
     """
     Enter data into DB
     """
-    db = MySQLdb.connect(host=DB_HOST, port=3306, user=DB_USER, passwd=DB_PW, db=DB_SCHEMA, use_unicode=True,
-                         charset="utf8mb4")
     try:
-        db_cursor = db.cursor()
-        db_cursor.execute(db_call, values)
-        db.commit()
-        db_cursor.close()
-        db.close()
+        with connection() as db:
+            db_cursor = db.cursor()
+            db_cursor.execute(db_call, values)
+            db.commit()
+            db_cursor.close()
         logger.info("{}: record inserted into DB".format(datetime.now()))
         return None
     except MySQLdb.ProgrammingError as e:
@@ -326,24 +601,54 @@ def set_db_data(db_call, values):
         return e
 
 
+def record_dms(dm_rows, from_app):
+    """
+    Insert (dm_id, sender_id, dm_text) rows into dm_list in one statement.  Returns the ids of the DMs that were not
+    recorded yet, redelivered DMs are left out.
+    """
+    if not dm_rows:
+        return set()
+    dm_insert_call = ("INSERT IGNORE INTO dm_list (dm_id, processed, sender_id, dm_text, from_app) VALUES {} "
+                      "RETURNING dm_id".format(', '.join(['(%s, 0, %s, %s, %s)'] * len(dm_rows))))
+    dm_insert_values = []
+    for dm_id, sender_id, dm_text in dm_rows:
+        dm_insert_values += [dm_id, sender_id, dm_text, from_app]
+    with transaction() as db_cursor:
+        db_cursor.execute(dm_insert_call, dm_insert_values)
+        return {str(row[0]) for row in db_cursor.fetchall()}
+
+
+TIP_LIST_INSERT = ("INSERT INTO tip_list (dm_id, tx_id, processed, sender_id, receiver_id, from_app, dm_text, amount)"
+                   " VALUES (%s, %s, 2, %s, %s, %s, %s, %s)")
+
+
+def get_tip_list_values(message, users_to_tip, t_index):
+    """
+    Values for TIP_LIST_INSERT
+    """
+    return (message['id'], message['tip_id'], message['sender_id'],
+            users_to_tip[t_index]['receiver_id'], message['from_app'], message['text'],
+            Decimal(message['tip_amount']))
+
+
+def get_tip_statements(message, users_to_tip, t_index):
+    """
+    (sql, values) pairs recording a tip in tip_list, the tip feed and the tip statistics, to run in a single transaction
+    """
+    tip_list_values = get_tip_list_values(message, users_to_tip, t_index)
+    return ([(TIP_LIST_INSERT, tip_list_values), modules.tip_feed.get_statement(message, users_to_tip, t_index)]
+            + modules.tip_stats.get_statements(tip_list_values))
+
+
 def set_db_data_tip(message, users_to_tip, t_index):
     """
     Special case to update DB information to include tip data
     """
     logger.info("{}: inserting tip into DB.".format(datetime.now()))
-    db = MySQLdb.connect(host=DB_HOST, port=3306, user=DB_USER, passwd=DB_PW, db=DB_SCHEMA, use_unicode=True,
-                         charset="utf8mb4")
     try:
-        db_cursor = db.cursor()
-        db_cursor.execute(
-            "INSERT INTO tip_list (dm_id, tx_id, processed, sender_id, receiver_id, from_app, dm_text, amount)"
-            " VALUES (%s, %s, 2, %s, %s, %s, %s, %s)",
-            (message['id'], message['tip_id'], message['sender_id'],
-             users_to_tip[t_index]['receiver_id'], message['from_app'], message['text'],
-             Decimal(message['tip_amount'])))
-        db.commit()
-        db_cursor.close()
-        db.close()
+        with transaction() as db_cursor:
+            for statement, values in get_tip_statements(message, users_to_tip, t_index):
+                db_cursor.execute(statement, values)
     except Exception as e:
         logger.info("{}: Exception in set_db_data_tip".format(datetime.now()))
         logger.info("{}: {}".format(datetime.now(), e))
@@ -366,36 +671,66 @@ def set_spare_account(account):
 
 def get_spare_account():
     """
-    Retrieve an account from the database.
+    Retrieve an account from the spare account pool.
     """
-    while True:
-        check_accounts_call = "SELECT count(account) FROM {}.spare_accounts;".format(DB_SCHEMA)
-        check_accounts_return = get_db_data(check_accounts_call)
-        if int(check_accounts_return[0][0]) <= 5:
-            account = rpc.generate_new_account()
-            set_spare_account(account)
-        else:
-            break
+    return modules.spare_pool.claim()
 
-    get_account_call = "SELECT account, address FROM {}.spare_accounts LIMIT 1;".format(DB_SCHEMA)
-    spare_account_return = get_db_data(get_account_call)
 
-    remove_account_call = "DELETE FROM {}.spare_accounts WHERE account = %s".format(DB_SCHEMA)
-    set_db_data(remove_account_call, [spare_account_return[0][0]])
+# MySQL error raised when NULL is written to a NOT NULL column
+ER_BAD_NULL_ERROR = 1048
 
-    return {
-        "account": spare_account_return[0][0],
-        "address": spare_account_return[0][1],
-    }
 
-def create_account(user_id, from_app, username, register =1, mute =0):
+def create_account(user_id, from_app, username, register =1, mute =0, with_address =True):
     """
-    Create an account.
+    Create an account.  Without an address, the account only exists in the ledger until bind_address is called, so
+    users who never register do not use up wallet addresses.
     """
-    sender_account = get_spare_account()
+    if with_address:
+        sender_account = get_spare_account()
+    else:
+        sender_account = {
+            "account": str(uuid.uuid1()).replace("-", ""),
+            "address": None,
+        }
     account_create_call = ("INSERT INTO users (user_id, from_app, user_name, account, address, register, mute) "
                             "VALUES(%s, %s, %s, %s, %s, %s, %s)")
     account_create_values = [user_id, from_app, username, sender_account["account"], sender_account["address"], register, mute]
-    set_db_data(account_create_call, account_create_values)
+    try:
+        set_db_data(account_create_call, account_create_values)
+    except MySQLdb.IntegrityError as e:
+        # users.address only accepts NULL once migration 3 is applied, until then accounts get an address right away
+        if with_address or e.args[0] != ER_BAD_NULL_ERROR:
+            raise
+        logger.info("{}: users.address cannot be NULL, run flask initdb.  Creating {} with an address"
+                    .format(datetime.now(), user_id))
+        return create_account(user_id, from_app, username, register, mute, with_address=True)
+    modules.ledger.open_new_account(sender_account["account"])
     # Return the account, that's weird but impossible to refacto all in one time
-    return sender_account
\ No newline at end of file
+    return sender_account
+
+
+def bind_address(user_id, from_app):
+    """
+    Give a wallet address to an account created without one, and return the address of the account.
+    """
+    address_call = "SELECT address FROM users WHERE user_id = %s AND from_app = %s"
+    address_return = get_db_data_new(address_call, [user_id, from_app])
+    if address_return[0][0] is not None:
+        return address_return[0][0]
+
+    spare_account = get_spare_account()
+    bind_call = "UPDATE users SET address = %s WHERE user_id = %s AND from_app = %s AND address IS NULL"
+    with connection() as db:
+        db_cursor = db.cursor()
+        db_cursor.execute(bind_call, [spare_account["address"], user_id, from_app])
+        bound = db_cursor.rowcount == 1
+        db_cursor.close()
+
+    if not bound:
+        # Another process bound an address first, put ours back in the pool
+        set_spare_account(spare_account)
+        return get_db_data_new(address_call, [user_id, from_app])[0][0]
+
+    logger.info("{}: Bound address {} to user {} on {}".format(datetime.now(), spare_account["address"], user_id,
+                                                              from_app))
+    return spare_account["address"]
@@ -0,0 +1,107 @@
+import configparser
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+from logging.handlers import TimedRotatingFileHandler
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Set logging info
+logger = logging.getLogger("http_log")
+logger.setLevel(logging.INFO)
+handler = TimedRotatingFileHandler('{}/logs/{:%Y-%m-%d}-http.log'.format(os.getcwd(), datetime.now()),
+                                   when="d",
+                                   interval=1,
+                                   backupCount=5)
+logger.addHandler(handler)
+
+# Read config and parse constants
+config = configparser.ConfigParser()
+config.read('{}/webhookconfig.ini'.format(os.getcwd()))
+
+HTTP_CONNECT_TIMEOUT = config.getfloat('main', 'http_connect_timeout', fallback=3.05)
+HTTP_READ_TIMEOUT = config.getfloat('main', 'http_read_timeout', fallback=10)
+HTTP_RETRIES = config.getint('main', 'http_retries', fallback=2)
+HTTP_POOL_SIZE = config.getint('main', 'http_pool_size', fallback=10)
+
+# Statuses retried for idempotent methods.  Connection errors are retried for every method, nothing was sent yet.
+RETRY_STATUSES = (502, 503, 504)
+
+# host -> counters and latency of the calls made to it by this process
+stats = {}
+_stats_lock = threading.Lock()
+_local = threading.local()
+
+
+def _new_session():
+    retry = Retry(total=HTTP_RETRIES, connect=HTTP_RETRIES, read=HTTP_RETRIES, status=HTTP_RETRIES,
+                  backoff_factor=0.3, status_forcelist=RETRY_STATUSES, raise_on_status=False)
+    adapter = HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE, max_retries=retry)
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def get_session():
+    """
+    Session of the current thread.  Connections are kept alive per host, and a forked process gets new ones.
+    """
+    if getattr(_local, 'pid', None) != os.getpid():
+        _local.session = _new_session()
+        _local.pid = os.getpid()
+    return _local.session
+
+
+def _record(host, elapsed, error):
+    with _stats_lock:
+        host_stats = stats.get(host)
+        if host_stats is None:
+            host_stats = stats[host] = {'calls': 0, 'errors': 0, 'total_ms': 0, 'max_ms': 0}
+        host_stats['calls'] += 1
+        host_stats['total_ms'] += elapsed
+        host_stats['max_ms'] = max(host_stats['max_ms'], elapsed)
+        if error:
+            host_stats['errors'] += 1
+
+
+def request(method, url, timeout=None, **kwargs):
+    """
+    Make a call with the shared session.  Calls time out after HTTP_CONNECT_TIMEOUT seconds to connect and
+    HTTP_READ_TIMEOUT seconds between bytes of the response, unless another timeout is given.
+    """
+    if timeout is None:
+        timeout = (HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT)
+    host = urlsplit(url).netloc
+    started = time.monotonic()
+    error = True
+    try:
+        response = get_session().request(method, url, timeout=timeout, **kwargs)
+        error = response.status_code >= 500
+        return response
+    except requests.RequestException as e:
+        logger.info("{}: {} {} failed: {}".format(datetime.now(), method, host, e))
+        raise
+    finally:
+        _record(host, round((time.monotonic() - started) * 1000), error)
+
+
+def get(url, **kwargs):
+    return request('GET', url, **kwargs)
+
+
+def post(url, **kwargs):
+    return request('POST', url, **kwargs)
+
+
+def get_stats():
+    with _stats_lock:
+        http_stats = {host: dict(host_stats) for host, host_stats in stats.items()}
+    for host_stats in http_stats.values():
+        host_stats['avg_ms'] = round(host_stats['total_ms'] / host_stats['calls']) if host_stats['calls'] else 0
+    return http_stats
@@ -0,0 +1,186 @@
+import configparser
+import json
+import logging
+import os
+from datetime import datetime
+from logging.handlers import TimedRotatingFileHandler
+
+import redis
+import tweepy
+
+import modules.db
+import modules.jobs
+import modules.social
+
+# Set logging info
+logger = logging.getLogger("identity_log")
+logger.setLevel(logging.INFO)
+handler = TimedRotatingFileHandler('{}/logs/{:%Y-%m-%d}-identity.log'.format(os.getcwd(), datetime.now()),
+                                   when="d",
+                                   interval=1,
+                                   backupCount=5)
+logger.addHandler(handler)
+
+# Read config and parse constants
+config = configparser.ConfigParser()
+config.read('{}/webhookconfig.ini'.format(os.getcwd()))
+
+IDENTITY_CACHE_TTL = config.getint('main', 'identity_cache_ttl', fallback=3600)
+# Handles that do not exist are remembered for a shorter time, they may be registered later
+IDENTITY_NEGATIVE_TTL = config.getint('main', 'identity_negative_ttl', fallback=300)
+
+# users/lookup accepts up to 100 users per call
+LOOKUP_BATCH_SIZE = 100
+# No user of the lookup exists
+USER_NOT_FOUND_CODE = 17
+
+# Users are kept in Redis, so the lookups of the web processes and of every job share them.  A handle that does not
+# exist is stored as null.  The counters are kept there too, so /stats covers the jobs as well.
+IDENTITY_KEY = 'identities:{}:{}'
+STATS_KEY = 'identities:stats'
+STATS = ('hits', 'negative_hits', 'misses', 'upstream_calls', 'upstream_users', 'upstream_errors', 'errors')
+
+
+def _key(screen_name=None, user_id=None):
+    if screen_name is not None:
+        return 'screen_name', screen_name.lstrip('@').lower()
+    return 'user_id', str(user_id)
+
+
+def _count(counts):
+    try:
+        pipeline = modules.jobs.get_connection().pipeline()
+        for name, count in counts.items():
+            if count:
+                pipeline.hincrby(STATS_KEY, name, count)
+        pipeline.execute()
+    except redis.RedisError:
+        pass
+
+
+def _lookup(keys, counts):
+    """
+    Resolve up to LOOKUP_BATCH_SIZE keys with one users/lookup call.  Returns the users by key, None for the keys
+    Twitter did not return, or None if the call failed.
+    """
+    screen_names = [value for kind, value in keys if kind == 'screen_name']
+    user_ids = [value for kind, value in keys if kind == 'user_id']
+    counts['upstream_calls'] += 1
+    try:
+        users = modules.social.api.lookup_users(user_ids=user_ids or None, screen_names=screen_names or None)
+    except tweepy.TweepError as e:
+        if getattr(e, 'api_code', None) != USER_NOT_FOUND_CODE:
+            counts['upstream_errors'] += 1
+            logger.info("{}: users/lookup failed for {} users: {}".format(datetime.now(), len(keys), e))
+            return None
+        users = []
+
+    counts['upstream_users'] += len(users)
+    found = {}
+    for user in users:
+        user_dict = {'id': user.id, 'id_str': user.id_str, 'screen_name': user.screen_name, 'name': user.name}
+        found[_key(screen_name=user.screen_name)] = user_dict
+        found[_key(user_id=user.id_str)] = user_dict
+    return {key: found.get(key) for key in set(keys) | set(found)}
+
+
+def resolve(keys):
+    """
+    Resolve (kind, value) keys to user dicts, or None for users that do not exist or could not be looked up.
+    The keys missing from the cache are looked up with users/lookup calls of up to 100 users.
+    """
+    keys = list(dict.fromkeys(keys))
+    counts = dict.fromkeys(STATS, 0)
+    resolved = {}
+    missing = []
+    try:
+        connection = modules.jobs.get_connection()
+        stored = connection.mget([IDENTITY_KEY.format(*key) for key in keys]) if keys else []
+    except redis.RedisError:
+        connection = None
+        counts['errors'] += 1
+        stored = [None] * len(keys)
+
+    for key, value in zip(keys, stored):
+        if value is None:
+            counts['misses'] += 1
+            missing.append(key)
+            continue
+        resolved[key] = json.loads(value)
+        if resolved[key] is None:
+            counts['negative_hits'] += 1
+        else:
+            counts['hits'] += 1
+
+    for index in range(0, len(missing), LOOKUP_BATCH_SIZE):
+        batch = missing[index:index + LOOKUP_BATCH_SIZE]
+        looked_up = _lookup(batch, counts)
+        if looked_up is None:
+            # Nothing is cached when the call failed, the next lookup asks Twitter again
+            resolved.update(dict.fromkeys(batch))
+            continue
+        resolved.update({key: looked_up[key] for key in batch})
+        if connection is None:
+            continue
+        try:
+            pipeline = connection.pipeline()
+            for key, user in looked_up.items():
+                pipeline.set(IDENTITY_KEY.format(*key), json.dumps(user),
+                             ex=IDENTITY_CACHE_TTL if user is not None else IDENTITY_NEGATIVE_TTL)
+            pipeline.execute()
+        except redis.RedisError:
+            counts['errors'] += 1
+
+    _count(counts)
+    return resolved
+
+
+def get_user(screen_name=None, user_id=None):
+    """
+    Get {'id', 'id_str', 'screen_name', 'name'} of a Twitter user by screen name or id, or None if there is no such
+    user.
+    """
+    key = _key(screen_name, user_id)
+    return resolve([key])[key]
+
+
+def get_users(screen_names=(), user_ids=()):
+    """
+    Resolve several users at once.  Returns a dict keyed by lowercase screen name or str user id.
+    """
+    keys = [_key(screen_name=screen_name) for screen_name in screen_names]
+    keys += [_key(user_id=user_id) for user_id in user_ids]
+    return {value: user for (_, value), user in resolve(keys).items()}
+
+
+def refresh_screen_names():
+    """
+    Update users.user_name for the Twitter users who changed their screen name.
+    """
+    users_call = "SELECT user_id, user_name FROM users WHERE from_app = 'twitter'"
+    users_return = modules.db.get_db_data(users_call)
+    stored_names = {str(row[0]): row[1] for row in users_return}
+
+    updated = 0
+    user_ids = list(stored_names)
+    for index in range(0, len(user_ids), LOOKUP_BATCH_SIZE):
+        users = get_users(user_ids=user_ids[index:index + LOOKUP_BATCH_SIZE])
+        for user_id, user in users.items():
+            if user is not None and user['screen_name'] != stored_names[user_id]:
+                update_call = "UPDATE users SET user_name = %s WHERE user_id = %s AND from_app = 'twitter'"
+                modules.db.set_db_data(update_call, [user['screen_name'], user_id])
+                updated += 1
+    logger.info("{}: Refreshed {} screen names of {} users".format(datetime.now(), updated, len(user_ids)))
+    return updated
+
+
+def get_stats():
+    try:
+        stored = modules.jobs.get_connection().hgetall(STATS_KEY)
+    except redis.RedisError:
+        stored = {}
+    identity_stats = {name: int(stored.get(name.encode('utf-8'), 0)) for name in STATS}
+    lookups = identity_stats['hits'] + identity_stats['negative_hits'] + identity_stats['misses']
+    hits = identity_stats['hits'] + identity_stats['negative_hits']
+    identity_stats['hit_rate'] = round(hits / lookups, 4) if lookups else 0
+    return identity_stats
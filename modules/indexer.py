@@ -0,0 +1,246 @@
+import configparser
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime
+from decimal import Decimal
+from logging.handlers import TimedRotatingFileHandler
+
+import modules.balance_cache
+import modules.db
+import modules.jobs
+import modules.ledger
+import modules.rpc as rpc
+import modules.social
+import modules.translations as translations
+
+# Set logging info
+logger = logging.getLogger("indexer_log")
+logger.setLevel(logging.INFO)
+handler = TimedRotatingFileHandler('{}/logs/{:%Y-%m-%d}-indexer.log'.format(os.getcwd(), datetime.now()),
+                                   when="d",
+                                   interval=1,
+                                   backupCount=5)
+logger.addHandler(handler)
+
+# Read config and parse constants
+config = configparser.ConfigParser()
+config.read('{}/webhookconfig.ini'.format(os.getcwd()))
+
+# Check the currency of the bot
+CURRENCY = config.get('main', 'currency')
+CURRENCY_SYMBOL = config.get(CURRENCY, 'currency_symbol')
+MIN_TX_CONFIRMATION = config.get(CURRENCY, 'min_tx_confirmation')
+
+INDEXER_INTERVAL = config.getint('main', 'indexer_interval', fallback=15)
+DEPOSIT_NOTIFICATIONS = config.getboolean('main', 'deposit_notifications', fallback=False)
+
+INDEXER_LOCK = 'wallet_indexer'
+
+stats = {
+    'height': None,
+    'block_hash': None,
+    'last_run_at': None,
+    'last_run_seconds': 0,
+    'deposits_seen': 0,
+    'deposits_credited': 0,
+}
+
+_thread = None
+
+
+def get_checkpoint():
+    checkpoint_call = "SELECT block_hash, height FROM chain_checkpoint WHERE id = 1"
+    checkpoint_return = modules.db.get_db_data(checkpoint_call)
+    if not checkpoint_return:
+        return None, None
+    return checkpoint_return[0][0], checkpoint_return[0][1]
+
+
+def set_checkpoint(block_hash, height):
+    checkpoint_call = ("INSERT INTO chain_checkpoint (id, block_hash, height) VALUES (1, %s, %s) "
+                       "ON DUPLICATE KEY UPDATE block_hash = VALUES(block_hash), height = VALUES(height)")
+    modules.db.set_db_data(checkpoint_call, [block_hash, height])
+
+
+def bootstrap_checkpoint(height):
+    """
+    Start following the chain just below the confirmation window, older deposits are covered by opening balances.
+    """
+    start_height = max(height - int(MIN_TX_CONFIRMATION), 0)
+    return rpc.get_block_hash(start_height)
+
+
+def get_address_accounts(addresses):
+    """
+    Map wallet addresses to the bot accounts that own them, registered users or unclaimed spare accounts.
+    """
+    if not addresses:
+        return {}
+    placeholders = ', '.join(['%s'] * len(addresses))
+    address_call = ("SELECT address, account FROM users WHERE address IN ({0}) "
+                    "UNION ALL "
+                    "SELECT address, account FROM spare_accounts WHERE address IN ({0})".format(placeholders))
+    address_return = modules.db.get_db_data_new(address_call, list(addresses) * 2)
+    return {row[0]: row[1] for row in address_return}
+
+
+def store_deposits(transactions, height):
+    """
+    Upsert the incoming transactions of the wallet that pay one of our addresses.  Returns the touched accounts.
+    """
+    outputs = defaultdict(Decimal)
+    confirmations = {}
+    for transaction in transactions:
+        if transaction.get('category') != 'receive' or 'address' not in transaction:
+            continue
+        key = (transaction['txid'], transaction['address'])
+        outputs[key] += Decimal(transaction['amount'])
+        confirmations[key] = int(transaction.get('confirmations', 0))
+
+    address_accounts = get_address_accounts({address for _, address in outputs})
+    deposit_values = []
+    for (txid, address), amount in outputs.items():
+        if address not in address_accounts:
+            continue
+        tx_confirmations = confirmations[(txid, address)]
+        block_height = height - tx_confirmations + 1 if tx_confirmations > 0 else None
+        deposit_values.append((txid, address, address_accounts[address], amount, tx_confirmations, block_height))
+
+    if deposit_values:
+        deposit_call = ("INSERT INTO deposits (txid, address, account, amount, confirmations, block_height) "
+                        "VALUES (%s, %s, %s, %s, %s, %s) "
+                        "ON DUPLICATE KEY UPDATE confirmations = VALUES(confirmations), "
+                        "block_height = VALUES(block_height)")
+        with modules.db.connection() as db:
+            db_cursor = db.cursor()
+            db_cursor.executemany(deposit_call, deposit_values)
+            db_cursor.close()
+        stats['deposits_seen'] += len(deposit_values)
+
+    return {deposit[2] for deposit in deposit_values}
+
+
+def credit_deposits():
+    """
+    Credit every deposit that reached MIN_TX_CONFIRMATION to the ledger, exactly once.
+    """
+    ready_call = ("SELECT txid, address, account, amount, block_height FROM deposits "
+                  "WHERE credited = 0 AND confirmations >= %s")
+    ready = modules.db.get_db_data_new(ready_call, [int(MIN_TX_CONFIRMATION)])
+
+    credited = []
+    for txid, address, account, amount, block_height in ready:
+        modules.ledger.open_account(account)
+        with modules.db.transaction() as db_cursor:
+            db_cursor.execute("SELECT credited FROM deposits WHERE txid = %s AND address = %s FOR UPDATE",
+                              [txid, address])
+            if db_cursor.fetchall()[0][0] != 0:
+                continue
+            db_cursor.execute("SELECT opened_height FROM ledger_accounts WHERE account = %s", [account])
+            opened_height = db_cursor.fetchall()[0][0]
+            if not modules.ledger.in_opening_balance(opened_height, block_height):
+                modules.ledger.post(db_cursor, 'deposit:{}:{}'.format(txid, address), 'deposit',
+                                    modules.ledger.WALLET_ACCOUNT, account, amount, check_funds=False)
+                credited.append((account, amount))
+            db_cursor.execute("UPDATE deposits SET credited = 1 WHERE txid = %s AND address = %s", [txid, address])
+        logger.info("{}: Deposit {} of {} to {} credited".format(datetime.now(), txid, amount, account))
+
+    modules.balance_cache.invalidate(*{account for account, amount in credited})
+    stats['deposits_credited'] += len(credited)
+    return credited
+
+
+def update_pending(accounts):
+    """
+    Refresh the pending amount of the accounts from their deposits waiting for confirmations.
+    """
+    if not accounts:
+        return
+    placeholders = ', '.join(['%s'] * len(accounts))
+    pending_call = ("UPDATE ledger_accounts SET pending = ("
+                    "SELECT COALESCE(SUM(amount), 0) FROM deposits "
+                    "WHERE deposits.account = ledger_accounts.account AND credited = 0 AND confirmations >= 1) "
+                    "WHERE account IN ({})".format(placeholders))
+    modules.db.set_db_data(pending_call, list(accounts))
+    modules.balance_cache.invalidate(*accounts)
+
+
+def notify_deposits(credited):
+    """
+    Let users know their deposit is available.
+    """
+    for account, amount in credited:
+        user_call = ("SELECT users.user_id, users.from_app, languages.language_code FROM users "
+                     "LEFT JOIN languages ON languages.user_id = users.user_id "
+                     "WHERE users.account = %s")
+        user_return = modules.db.get_db_data_new(user_call, [account])
+        if not user_return:
+            continue
+        user_id, from_app, language = user_return[0]
+        deposit_text = translations.deposit_received_text.get(language or 'en', translations.deposit_received_text['en'])
+        try:
+            modules.jobs.enqueue(modules.social.send_dm, user_id, deposit_text.format(amount, CURRENCY_SYMBOL), from_app)
+        except Exception as e:
+            logger.info("{}: Error queueing deposit notification: {}".format(datetime.now(), e))
+
+
+def index_once():
+    """
+    Follow the chain from the persisted checkpoint, store new deposits and credit the confirmed ones.
+    Only one process indexes at a time.
+    """
+    with modules.db.connection() as db:
+        db_cursor = db.cursor()
+        db_cursor.execute("SELECT GET_LOCK(%s, 0)", [INDEXER_LOCK])
+        locked = db_cursor.fetchall()[0][0] == 1
+        if not locked:
+            db_cursor.close()
+            return
+        try:
+            start = time.monotonic()
+            block_hash, _ = get_checkpoint()
+            if block_hash is None:
+                block_hash = bootstrap_checkpoint(rpc.get_block_count())
+                logger.info("{}: No checkpoint, starting to index after block {}".format(datetime.now(), block_hash))
+
+            since_block, height = rpc.list_since_block(block_hash, int(MIN_TX_CONFIRMATION))
+            touched_accounts = store_deposits(since_block.get('transactions', []), height)
+            credited = credit_deposits()
+            touched_accounts.update(account for account, _ in credited)
+            update_pending(touched_accounts)
+            set_checkpoint(since_block['lastblock'], height)
+
+            stats['height'] = height
+            stats['block_hash'] = since_block['lastblock']
+            stats['last_run_at'] = datetime.now().isoformat()
+            stats['last_run_seconds'] = round(time.monotonic() - start, 3)
+        finally:
+            db_cursor.execute("SELECT RELEASE_LOCK(%s)", [INDEXER_LOCK])
+            db_cursor.fetchall()
+            db_cursor.close()
+
+    if DEPOSIT_NOTIFICATIONS and credited:
+        notify_deposits(credited)
+
+
+def run_forever():
+    while True:
+        try:
+            index_once()
+        except Exception as e:
+            logger.info("{}: Error indexing the wallet: {}".format(datetime.now(), e))
+        time.sleep(INDEXER_INTERVAL)
+
+
+def start():
+    """
+    Start the background indexer for this process.
+    """
+    global _thread
+    if _thread is not None and _thread.is_alive():
+        return
+    _thread = threading.Thread(target=run_forever, name='wallet-indexer', daemon=True)
+    _thread.start()
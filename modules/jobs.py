@@ -0,0 +1,165 @@
+import configparser
+import logging
+import multiprocessing
+import os
+import time
+import uuid
+from datetime import datetime
+from logging.handlers import TimedRotatingFileHandler
+
+import redis
+from rq import Queue, Retry, Worker
+from rq.registry import FailedJobRegistry
+
+# Set logging info
+logger = logging.getLogger("jobs_log")
+logger.setLevel(logging.INFO)
+handler = TimedRotatingFileHandler('{}/logs/{:%Y-%m-%d}-jobs.log'.format(os.getcwd(), datetime.now()),
+                                   when="d",
+                                   interval=1,
+                                   backupCount=5)
+logger.addHandler(handler)
+
+# Read config and parse constants
+config = configparser.ConfigParser()
+config.read('{}/webhookconfig.ini'.format(os.getcwd()))
+
+REDIS_URL = config.get('main', 'redis_url', fallback='redis://localhost:6379/0')
+JOB_QUEUE = config.get('main', 'job_queue', fallback='tipbot')
+JOB_WORKERS = config.getint('main', 'job_workers', fallback=4)
+JOB_TIMEOUT = config.getint('main', 'job_timeout', fallback=120)
+JOB_RETRIES = config.getint('main', 'job_retries', fallback=2)
+# Seconds before each retry, the last value is reused for further retries
+JOB_RETRY_INTERVALS = [10, 60, 300]
+
+# Deletes a lock only while it still holds the token of its owner
+RELEASE_LOCK_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+_connection = None
+
+
+def get_connection():
+    global _connection
+    if _connection is None:
+        _connection = redis.Redis.from_url(REDIS_URL)
+    return _connection
+
+
+def set_connection(connection):
+    """
+    Use another Redis connection for the queue, e.g. a fakeredis instance in tests.
+    """
+    global _connection
+    _connection = connection
+
+
+def acquire_lock(key, timeout):
+    """
+    Take a lock shared by every process that expires after timeout seconds.  Returns the token to release it with, or
+    None if another process holds it.
+    """
+    token = uuid.uuid4().hex
+    if get_connection().set(key, token, nx=True, ex=timeout):
+        return token
+    return None
+
+
+def release_lock(key, token):
+    """
+    Release a lock taken with acquire_lock, unless it expired and another process has taken it since.
+    """
+    get_connection().eval(RELEASE_LOCK_SCRIPT, 1, key, token)
+
+
+def get_queue():
+    return Queue(JOB_QUEUE, connection=get_connection(), default_timeout=JOB_TIMEOUT)
+
+
+def enqueue(func, *args, retries=None):
+    """
+    Queue func(*args) for the worker pool.  The job is retried on failure and moved to the dead-letter list once
+    its retries are exhausted.  func must be importable by the workers, so no lambdas or nested functions.
+    """
+    job = get_queue().enqueue(func, *args, retry=_retry(retries))
+    logger.info("{}: Queued job {} - {}".format(datetime.now(), job.id, job.func_name))
+    return job
+
+
+def _retry(retries):
+    if retries is None:
+        retries = JOB_RETRIES
+    return Retry(max=retries, interval=JOB_RETRY_INTERVALS[:retries]) if retries > 0 else None
+
+
+def enqueue_many(calls, retries=None):
+    """
+    Queue several (func, args) calls with a single round trip to Redis.
+    """
+    if not calls:
+        return []
+    retry = _retry(retries)
+    queue = get_queue()
+    jobs = queue.enqueue_many([Queue.prepare_data(func, args, retry=retry) for func, args in calls])
+    logger.info("{}: Queued {} jobs - {}".format(datetime.now(), len(jobs), [job.func_name for job in jobs]))
+    return jobs
+
+
+def get_dead_letters():
+    """
+    Jobs that failed all their attempts.
+    """
+    queue = get_queue()
+    return FailedJobRegistry(queue=queue).get_job_ids()
+
+
+def requeue_dead_letters():
+    """
+    Put every dead-letter job back on the queue, once whatever made them fail is fixed.
+    """
+    registry = FailedJobRegistry(queue=get_queue())
+    job_ids = registry.get_job_ids()
+    for job_id in job_ids:
+        registry.requeue(job_id)
+    logger.info("{}: Requeued {} dead-letter jobs".format(datetime.now(), len(job_ids)))
+    return len(job_ids)
+
+
+def get_stats():
+    queue = get_queue()
+    return {
+        'queued': queue.count,
+        'dead_letters': FailedJobRegistry(queue=queue).count,
+        'workers': Worker.count(queue=queue),
+    }
+
+
+def work(burst=False):
+    """
+    Run one worker.  Each job runs in a child of the worker that is killed once the job timeout expires.
+    With burst, the worker exits when the queue is empty.
+    """
+    worker = Worker([get_queue()], connection=get_connection())
+    worker.work(burst=burst, with_scheduler=True)
+
+
+def run_workers(count=None):
+    """
+    Keep a fixed number of workers running, replacing any worker that dies.
+    """
+    if count is None:
+        count = JOB_WORKERS
+    workers = [None] * count
+    while True:
+        for index, process in enumerate(workers):
+            if process is None or not process.is_alive():
+                if process is not None:
+                    logger.info("{}: Worker {} exited with code {}, restarting it".format(datetime.now(), index,
+                                                                                         process.exitcode))
+                workers[index] = multiprocessing.Process(target=work, name='job-worker-{}'.format(index))
+                workers[index].start()
+        time.sleep(5)
@@ -0,0 +1,177 @@
+import configparser
+import logging
+import os
+from datetime import datetime
+from decimal import Decimal
+from logging.handlers import TimedRotatingFileHandler
+
+import MySQLdb
+
+import modules.balance_cache
+import modules.db
+import modules.rpc as rpc
+
+# Set logging info
+logger = logging.getLogger("ledger_log")
+logger.setLevel(logging.INFO)
+handler = TimedRotatingFileHandler('{}/logs/{:%Y-%m-%d}-ledger.log'.format(os.getcwd(), datetime.now()),
+                                   when="d",
+                                   interval=1,
+                                   backupCount=5)
+logger.addHandler(handler)
+
+# Read config and parse constants
+config = configparser.ConfigParser()
+config.read('{}/webhookconfig.ini'.format(os.getcwd()))
+
+# Check the currency of the bot
+CURRENCY = config.get('main', 'currency')
+MIN_TX_CONFIRMATION = config.get(CURRENCY, 'min_tx_confirmation')
+
+# System accounts on the other side of every entry that enters or leaves the ledger
+WALLET_ACCOUNT = 'ledger:wallet'
+OPENING_ACCOUNT = 'ledger:opening'
+FEES_ACCOUNT = 'ledger:fees'
+
+PRECISION = Decimal('0.00000001')
+
+
+class InsufficientFunds(Exception):
+    pass
+
+
+class DuplicateEntry(Exception):
+    pass
+
+
+def to_amount(amount):
+    return Decimal(amount).quantize(PRECISION)
+
+
+def post(db_cursor, ref, kind, from_account, to_account, amount, check_funds=True):
+    """
+    Write both sides of a transfer on the provided cursor.  The caller owns the transaction, and drops the cached
+    balances of both accounts once it is committed.
+    """
+    amount = to_amount(amount)
+    if check_funds:
+        db_cursor.execute("UPDATE ledger_accounts SET balance = balance - %s WHERE account = %s AND balance >= %s",
+                          [amount, from_account, amount])
+        if db_cursor.rowcount != 1:
+            raise InsufficientFunds("{} cannot cover {}".format(from_account, amount))
+    else:
+        db_cursor.execute("INSERT INTO ledger_accounts (account, balance) VALUES (%s, %s) "
+                          "ON DUPLICATE KEY UPDATE balance = balance + VALUES(balance)",
+                          [from_account, -amount])
+    db_cursor.execute("INSERT INTO ledger_accounts (account, balance) VALUES (%s, %s) "
+                      "ON DUPLICATE KEY UPDATE balance = balance + VALUES(balance)",
+                      [to_account, amount])
+    try:
+        db_cursor.executemany("INSERT INTO ledger_entries (ref, kind, account, amount) VALUES (%s, %s, %s, %s)",
+                              [(ref, kind, from_account, -amount), (ref, kind, to_account, amount)])
+    except MySQLdb.IntegrityError as e:
+        raise DuplicateEntry("Entry {} was already posted: {}".format(ref, e))
+
+
+def transfer(ref, kind, from_account, to_account, amount, statements=None):
+    """
+    Move amount between two ledger accounts in one DB transaction.  Any (sql, values) pairs in statements are executed
+    in the same transaction, so the records describing the transfer are committed or rolled back with it.
+    """
+    open_account(from_account)
+    open_account(to_account)
+    with modules.db.transaction() as db_cursor:
+        post(db_cursor, ref, kind, from_account, to_account, amount)
+        for sql, values in statements or []:
+            db_cursor.execute(sql, values)
+    modules.balance_cache.invalidate(from_account, to_account)
+    logger.info("{}: {} {} - {} -> {}: {}".format(datetime.now(), kind, ref, from_account, to_account, amount))
+
+
+def open_new_account(account):
+    """
+    Open a ledger account for an address that has never received funds.  Does not touch the wallet.
+    """
+    modules.db.set_db_data("INSERT IGNORE INTO ledger_accounts (account) VALUES (%s)", [account])
+
+
+def open_account(account):
+    """
+    Open a ledger account for a wallet account created before the ledger existed, carrying its wallet balance over as
+    the opening balance.  This only talks to the wallet the first time an account is seen.
+
+    The block height is recorded so the indexer does not credit deposits already included in the opening balance.
+    """
+    if modules.db.get_db_data_new("SELECT 1 FROM ledger_accounts WHERE account = %s", [account]):
+        return
+
+    opened_height = None
+    while opened_height is None:
+        opening_balance, opened_height = rpc.get_wallet_balance_at_height(account, int(MIN_TX_CONFIRMATION))
+    opening_balance = to_amount(opening_balance)
+
+    with modules.db.transaction() as db_cursor:
+        db_cursor.execute("INSERT IGNORE INTO ledger_accounts (account, opened_height) VALUES (%s, %s)",
+                          [account, opened_height])
+        if db_cursor.rowcount == 1 and opening_balance != 0:
+            post(db_cursor, 'opening:{}'.format(account), 'opening', OPENING_ACCOUNT, account, opening_balance,
+                 check_funds=False)
+    modules.balance_cache.invalidate(account)
+    logger.info("{}: Opened ledger account {} at height {} with balance {}".format(datetime.now(), account,
+                                                                                 opened_height, opening_balance))
+
+
+def in_opening_balance(opened_height, block_height):
+    """
+    Check if a deposit mined at block_height was already confirmed when the account was opened at opened_height.
+    """
+    return block_height is not None and block_height <= opened_height - int(MIN_TX_CONFIRMATION) + 1
+
+
+def get_balance(account):
+    """
+    Get the ledger balance of an account without asking the wallet.  Pending holds deposits the indexer has seen that
+    do not have enough confirmations yet.
+    """
+    open_account(account)
+    balance_call = "SELECT balance, pending FROM ledger_accounts WHERE account = %s"
+    balance_return = modules.db.get_db_data_new(balance_call, [account])
+    return {
+        "balance": balance_return[0][0],
+        "pending": balance_return[0][1],
+    }
+
+
+def withdraw(ref, account, address, amount):
+    """
+    Debit the ledger and send the funds on-chain.  The debit is reversed if the wallet refuses the send, and the
+    network fee is charged to the account as sendfrom used to do.  If the outcome of the send is unknown, e.g. the
+    call timed out after the wallet broadcast the transaction, the debit is kept and the withdraw has to be reconciled
+    by hand.
+    """
+    amount = to_amount(amount)
+    transfer(ref, 'withdraw', account, WALLET_ACCOUNT, amount)
+    try:
+        send_hash = rpc.send_to_address(address, amount)
+    except Exception as e:
+        if not rpc.is_rejected(e):
+            logger.error("{}: ALERT: outcome of withdraw {} of {} from {} to {} is unknown, not refunding.  "
+                         "Reconcile it with the wallet: {}".format(datetime.now(), ref, amount, account, address, e))
+            raise
+        logger.info("{}: Withdraw {} failed, refunding {}: {}".format(datetime.now(), ref, account, e))
+        with modules.db.transaction() as db_cursor:
+            post(db_cursor, '{}:refund'.format(ref), 'withdraw-refund', WALLET_ACCOUNT, account, amount,
+                 check_funds=False)
+        modules.balance_cache.invalidate(account)
+        raise
+
+    try:
+        fee = to_amount(rpc.get_transaction_fee(send_hash))
+        if fee > 0:
+            with modules.db.transaction() as db_cursor:
+                post(db_cursor, '{}:fee'.format(ref), 'fee', account, FEES_ACCOUNT, fee, check_funds=False)
+            modules.balance_cache.invalidate(account)
+    except Exception as e:
+        logger.info("{}: Could not record the fee of withdraw {}: {}".format(datetime.now(), ref, e))
+
+    return send_hash
@@ -0,0 +1,181 @@
+import logging
+import os
+from datetime import datetime
+from logging.handlers import TimedRotatingFileHandler
+
+import modules.db
+
+# Set logging info
+logger = logging.getLogger("migrations_log")
+logger.setLevel(logging.INFO)
+handler = TimedRotatingFileHandler('{}/logs/{:%Y-%m-%d}-migrations.log'.format(os.getcwd(), datetime.now()),
+                                   when="d",
+                                   interval=1,
+                                   backupCount=5)
+logger.addHandler(handler)
+
+MIGRATION_LOCK = 'schema_migrations'
+VERSION_TABLE = 'schema_migrations'
+# The version is also kept in the comment of the version table, so db_init reads it from information_schema
+VERSION_COMMENT = 'version {}'
+
+# Primary key of a table that already covers from_app, so migration 2 skips a table it changed before
+PRIMARY_KEY_HAS_FROM_APP = ("SELECT COUNT(*) FROM information_schema.statistics WHERE table_schema = DATABASE() "
+                            "AND table_name = '{}' AND index_name = 'PRIMARY' AND column_name = 'from_app'")
+
+
+def get_migrations():
+    """
+    Forward migrations, applied in order and recorded in schema_migrations.  A step is a statement, or a (check,
+    statement) pair whose statement is skipped when the check counts any rows.  LOCK=NONE makes the server refuse an
+    ALTER that would block writes instead of running it.
+
+    DDL commits implicitly, so the ALTERs of a migration that failed halfway stay applied.  Every DDL step can be run
+    again and the next run finishes the migration.  Only the data changes are committed together with the version.
+    Built on demand because the statements come from modules that import modules.db.
+    """
+    import modules.tip_feed
+    import modules.tip_stats
+
+    return [
+        (1, 'Indexes for the hot tip_list, users and telegram_chat_members queries', [
+            "ALTER TABLE tip_list ADD INDEX IF NOT EXISTS sender_idx (sender_id), "
+            "ADD INDEX IF NOT EXISTS timestamp_idx (timestamp), "
+            "ADD INDEX IF NOT EXISTS processed_amount_idx (processed, amount), LOCK=NONE",
+            "ALTER TABLE users ADD INDEX IF NOT EXISTS user_name_app_idx (user_name, from_app), LOCK=NONE",
+            "ALTER TABLE telegram_chat_members ADD INDEX IF NOT EXISTS chat_member_name_idx (chat_id, member_name), "
+            "LOCK=NONE",
+        ]),
+        (2, 'Key users and languages on (user_id, from_app)', [
+            (PRIMARY_KEY_HAS_FROM_APP.format('users'),
+             "ALTER TABLE users MODIFY from_app varchar(45) NOT NULL, DROP PRIMARY KEY, "
+             "ADD PRIMARY KEY (user_id, from_app), DROP INDEX IF EXISTS user_id_UNIQUE, LOCK=NONE"),
+            (PRIMARY_KEY_HAS_FROM_APP.format('languages'),
+             "ALTER TABLE languages DROP PRIMARY KEY, ADD PRIMARY KEY (user_id, from_app), "
+             "DROP INDEX IF EXISTS user_id_UNIQUE, LOCK=NONE"),
+        ]),
+        (3, 'Accounts can be created without an address', [
+            "ALTER TABLE users MODIFY address varchar(100) DEFAULT NULL, LOCK=NONE",
+        ]),
+        (4, 'Backfill the tip statistics rollups from tip_list', modules.tip_stats.REBUILD_STATEMENTS),
+        (5, 'Backfill the tip feed from tip_list', [modules.tip_feed.FEED_BACKFILL]),
+    ]
+
+
+def get_hot_queries():
+    """
+    Queries run on every request or tip, as (name, query, values).  check_hot_queries fails if one of them reads a
+    whole table.
+    """
+    import modules.users
+
+    return [
+        ('user context', modules.users.USER_CONTEXT_SELECT.format('%s'), ['twitter', 0]),
+        ('user by name', "SELECT address FROM users WHERE user_name = %s AND from_app = 'twitter'", ['']),
+        ('tips by sender', "SELECT amount, timestamp FROM tip_list WHERE sender_id = %s", [0]),
+        ('recent tips', "SELECT sender_name, receiver_name, amount FROM tip_feed "
+                        "ORDER BY timestamp DESC, id DESC LIMIT 50", []),
+        ('older tips', "SELECT sender_name, receiver_name, amount FROM tip_feed WHERE timestamp < %s "
+                       "OR (timestamp = %s AND id < %s) ORDER BY timestamp DESC, id DESC LIMIT 50",
+         ['2020-01-01 00:00:00', '2020-01-01 00:00:00', 0]),
+        ('largest tips', "SELECT sender_id, amount FROM tip_list WHERE processed = 2 ORDER BY amount DESC LIMIT 1",
+         []),
+        ('chat member by name', "SELECT member_id, member_name FROM telegram_chat_members "
+                                "WHERE chat_id = %s AND member_name IN (%s)", [0, '']),
+        ('top tippers', "SELECT sender_id, from_app FROM tipper_totals ORDER BY total_amount DESC LIMIT 50", []),
+        ('due outbox messages', "SELECT id FROM outbox WHERE status = 'pending' AND next_attempt <= now() "
+                                "ORDER BY id LIMIT 100", []),
+    ]
+
+
+def create_version_table(db_cursor):
+    db_cursor.execute("""
+        CREATE TABLE IF NOT EXISTS `schema_migrations` (
+         `version` int(11) NOT NULL,
+         `description` varchar(255) NOT NULL,
+         `applied_ts` timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP,
+         PRIMARY KEY (`version`)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+        """)
+
+
+def get_version(db_cursor):
+    db_cursor.execute("SELECT COALESCE(MAX(version), 0) FROM schema_migrations")
+    return db_cursor.fetchall()[0][0]
+
+
+def latest_version():
+    return get_migrations()[-1][0]
+
+
+def parse_version(comment):
+    """
+    Version kept in the comment of the version table, or None if it is missing.
+    """
+    try:
+        return int((comment or '').replace('version', '').strip())
+    except ValueError:
+        return None
+
+
+def run_step(db_cursor, step):
+    if isinstance(step, tuple):
+        check, step = step
+        db_cursor.execute(check)
+        if db_cursor.fetchall()[0][0]:
+            return
+    db_cursor.execute(step)
+
+
+def migrate():
+    """
+    Apply the migrations newer than the version of the schema.  Only one process migrates at a time, and the run
+    stops at the first migration that fails so it can be fixed and run again.  Returns the version of the schema.
+    """
+    with modules.db.connection() as db:
+        db_cursor = db.cursor()
+        db_cursor.execute("SELECT GET_LOCK(%s, 60)", [MIGRATION_LOCK])
+        if db_cursor.fetchall()[0][0] != 1:
+            db_cursor.close()
+            raise RuntimeError('Another process is migrating the schema')
+        try:
+            create_version_table(db_cursor)
+            version = get_version(db_cursor)
+            for migration_version, description, steps in get_migrations():
+                if migration_version <= version:
+                    continue
+                logger.info("{}: Applying migration {}: {}".format(datetime.now(), migration_version, description))
+                db_cursor.execute("START TRANSACTION")
+                for step in steps:
+                    run_step(db_cursor, step)
+                db_cursor.execute("INSERT INTO schema_migrations (version, description) VALUES (%s, %s)",
+                                  [migration_version, description])
+                db.commit()
+                version = migration_version
+            db_cursor.execute("ALTER TABLE schema_migrations COMMENT = %s", [VERSION_COMMENT.format(version)])
+            return version
+        finally:
+            db_cursor.execute("SELECT RELEASE_LOCK(%s)", [MIGRATION_LOCK])
+            db_cursor.fetchall()
+            db_cursor.close()
+
+
+def check_hot_queries():
+    """
+    EXPLAIN every hot query and return the ones that read a whole table, as (name, table) pairs.  Run it against a
+    database with production-like data, the optimizer scans small tables whatever their indexes.
+    """
+    full_scans = []
+    with modules.db.connection() as db:
+        db_cursor = db.cursor()
+        for name, query, values in get_hot_queries():
+            db_cursor.execute("EXPLAIN " + query, values)
+            columns = [column[0] for column in db_cursor.description]
+            for row in db_cursor.fetchall():
+                plan = dict(zip(columns, row))
+                if plan.get('type') == 'ALL':
+                    full_scans.append((name, plan.get('table')))
+                    logger.info("{}: Hot query '{}' scans all of {}: {}".format(datetime.now(), name,
+                                                                               plan.get('table'), plan))
+        db_cursor.close()
+    return full_scans
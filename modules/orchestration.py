@@ -8,11 +8,16 @@ from decimal import Decimal
 from http import HTTPStatus
 from logging.handlers import TimedRotatingFileHandler
 
+import modules.commands
 import modules.currency
 import modules.db
+import modules.jobs
+import modules.ledger
 import modules.social
 import modules.translations as translations
+import modules.users
 import modules.rpc as rpc
+import modules.withdrawals
 
 # Set logging info
 logger = logging.getLogger("orchestration_log")
@@ -43,234 +48,85 @@ MIN_TIP = config.get(CURRENCY, 'min_tip')
 EXPLORER = config.get('routes', '{}_explorer'.format(CURRENCY))
 
 def parse_action(message):
-    # If the bot is in maintenance status, send a message and return.
-    bot_status = config.get('main', 'bot_status')
-    if bot_status == 'maintenance':
-        modules.social.send_dm(message['sender_id'],
-                               translations.maintenance_text[message['language']].format(BOT_NAME_TWITTER),
-                               message['from_app'])
-        return ''
-
-    tip_commands = modules.translations.coin_tip_commands[message['language']]
-    logger.info("language: {}".format(message['language']))
-    if message['language'] != 'en':
-        english_commands = modules.translations.coin_tip_commands['en']
-        for command in english_commands:
-            logger.info("commad: {}".format(command))
-            tip_commands.append(command)
-
-    logger.info('tip commands: {}'.format(tip_commands))
-
-    if message['dm_action'] in translations.help_commands['en'] or \
-            message['dm_action'] in translations.help_commands[message['language']]:
-        new_pid = os.fork()
-        if new_pid == 0:
-            try:
-                help_process(message)
-            except Exception as e:
-                logger.info("Exception: {}".format(e))
-                raise e
-            os._exit(0)
-        else:
-            return '', HTTPStatus.OK
+    modules.jobs.enqueue(*get_action_job(message))
+    return '', HTTPStatus.OK
 
-    if message['dm_action'] in translations.set_mute_commands['en'] or \
-            message['dm_action'] in translations.set_mute_commands[message['language']]:
-        new_pid = os.fork()
-        if new_pid == 0:
-            try:
-                mute_process(message, 1)
-            except Exception as e:
-                logger.info("Exception: {}".format(e))
-                raise e
-            os._exit(0)
-        else:
-            return '', HTTPStatus.OK
 
-    if message['dm_action'] in translations.set_unmute_commands['en'] or \
-            message['dm_action'] in translations.set_unmute_commands[message['language']]:
-        new_pid = os.fork()
-        if new_pid == 0:
-            try:
-                mute_process(message, 0)
-            except Exception as e:
-                logger.info("Exception: {}".format(e))
-                raise e
-            os._exit(0)
-        else:
-            return '', HTTPStatus.OK
+def get_action_job(message):
+    """
+    Get the (func, args) job handling the command of a DM.
+    """
+    # If the bot is in maintenance status, reply with the maintenance message.
+    bot_status = config.get('main', 'bot_status')
+    if bot_status == 'maintenance':
+        return maintenance_process, (message,)
 
-    elif message['dm_action'] in translations.balance_commands['en'] or \
-            message['dm_action'] in translations.balance_commands[message['language']]:
-        new_pid = os.fork()
-        if new_pid == 0:
-            try:
-                balance_process(message)
-            except Exception as e:
-                logger.info("Exception: {}".format(e))
-                raise e
-            os._exit(0)
-        else:
-            return '', HTTPStatus.OK
+    action = modules.commands.get_action(message['dm_action'], message['language'])
+    logger.info("{}: language: {} - action: {}".format(datetime.now(), message['language'], action))
 
-    elif message['dm_action'] in translations.register_commands['en'] or \
-            message['dm_action'] in translations.register_commands[message['language']]:
-        new_pid = os.fork()
-        if new_pid == 0:
-            try:
-                register_process(message)
-            except Exception as e:
-                logger.info("Exception: {}".format(e))
-                raise e
-            os._exit(0)
-        else:
-            return '', HTTPStatus.OK
+    job = DM_JOBS.get(action, (wrong_format_process,))
+    return job[0], (message,) + job[1:]
 
-    elif message['dm_action'] in tip_commands:
-        new_pid = os.fork()
-        if new_pid == 0:
-            try:
-                modules.social.send_dm(message['sender_id'],
-                                       translations.redirect_tip_text[message['language']].format(BOT_NAME_TWITTER,
-                                                                                                  tip_commands[0]),
-                                       message['from_app'])
-            except Exception as e:
-                logger.info("Exception: {}".format(e))
-                raise e
-            os._exit(0)
-        else:
-            return '', HTTPStatus.OK
 
-    elif message['dm_action'] in translations.withdraw_commands['en'] or \
-            message['dm_action'] in translations.withdraw_commands[message['language']]:
-        new_pid = os.fork()
-        if new_pid == 0:
-            try:
-                withdraw_process(message)
-            except Exception as e:
-                logger.info("Exception: {}".format(e))
-                raise e
-            os._exit(0)
-        else:
-            return '', HTTPStatus.OK
+def maintenance_process(message):
+    """
+    Let the sender know the bot is in maintenance
+    """
+    modules.social.send_dm(message['sender_id'],
+                           translations.maintenance_text[message['language']].format(BOT_NAME_TWITTER),
+                           message['from_app'])
 
-    elif message['dm_action'] in translations.donate_commands['en'] or \
-            message['dm_action'] in translations.donate_commands[message['language']]:
-        new_pid = os.fork()
-        if new_pid == 0:
-            try:
-                donate_process(message)
-            except Exception as e:
-                logger.info("Exception: {}".format(e))
-                raise e
-            os._exit(0)
-        else:
-            return '', HTTPStatus.OK
 
-    elif message['dm_action'] in translations.account_commands['en'] or \
-            message['dm_action'] in translations.account_commands[message['language']]:
-        new_pid = os.fork()
-        if new_pid == 0:
-            try:
-                account_process(message)
-            except Exception as e:
-                logger.info("Exception: {}".format(e))
-                raise e
-            os._exit(0)
-        else:
-            return '', HTTPStatus.OK
+def redirect_tip_process(message):
+    """
+    Reply to a tip sent by DM with the public tip syntax
+    """
+    tip_command = modules.commands.tip_command(message['language'])
+    modules.social.send_dm(message['sender_id'],
+                           translations.redirect_tip_text[message['language']].format(BOT_NAME_TWITTER, tip_command),
+                           message['from_app'])
 
-    elif message['dm_action'] in translations.private_tip_commands['en'] or \
-            message['dm_action'] in translations.private_tip_commands[message['language']]:
-        new_pid = os.fork()
-        if new_pid == 0:
-            try:
-                if len(modules.translations.coin_tip_commands[message['language']]) > 0:
-                    tip_command = modules.translations.coin_tip_commands[message['language']][0]
-                else:
-                    tip_command = modules.translations.coin_tip_commands['en'][0]
 
-                modules.social.send_dm(message['sender_id'],
-                                       translations.private_tip_text[message['language']].format(tip_command),
-                                       message['from_app'])
-            except Exception as e:
-                logger.info("Exception: {}".format(e))
-                raise e
-            os._exit(0)
-        else:
-            return '', HTTPStatus.OK
+def private_tip_process(message):
+    """
+    Reply to a private tip command with the public tip syntax
+    """
+    tip_command = modules.commands.tip_command(message['language'])
 
-    elif message['dm_action'] in translations.language_commands:
-        new_pid = os.fork()
-        if new_pid == 0:
-            try:
-                try:
-                    new_language = message['text'].split(' ')[1].lower()
-                    if new_language == 'chinese':
-                        new_language += ' ' + message['text'].split(' ')[2].lower()
-                    language_process(message, new_language)
-                except Exception as f:
-                    logger.info("{}: Error in language process: {}".format(datetime.now(), f))
-                    modules.social.send_dm(message['sender_id'], translations.missing_language[message['language']],
-                                           message['from_app'])
-            except Exception as e:
-                logger.info("Exception: {}".format(e))
-                raise e
-            os._exit(0)
-        else:
-            return '', HTTPStatus.OK
+    modules.social.send_dm(message['sender_id'],
+                           translations.private_tip_text[message['language']].format(tip_command),
+                           message['from_app'])
 
-    elif message['dm_action'] in translations.language_list_commands:
-        new_pid = os.fork()
-        if new_pid == 0:
-            try:
-                language_list_process(message)
-            except Exception as e:
-                logger.info("Exception: {}".format(e))
-                raise e
-            os._exit(0)
-        else:
-            return '', HTTPStatus.OK
 
-    elif message['dm_action'] in translations.auto_donate_commands['en'] or \
-            message['dm_action'] in translations.auto_donate_commands[message['language']]:
-        logger.info("auto donate command identified")
-        new_pid = os.fork()
-        if new_pid == 0:
-            try:
-                auto_donation_process(message)
-            except Exception as e:
-                logger.info(
-                    "{}: Exception in auto_donate_commands section of parse_action: {}".format(datetime.now(), e))
-            os._exit(0)
-        else:
-            return '', HTTPStatus.OK
+def language_command_process(message):
+    """
+    Parse the requested language out of the DM and switch to it
+    """
+    try:
+        new_language = message['text'].split(' ')[1].lower()
+        if new_language == 'chinese':
+            new_language += ' ' + message['text'].split(' ')[2].lower()
+        language_process(message, new_language)
+    except Exception as f:
+        logger.info("{}: Error in language process: {}".format(datetime.now(), f))
+        modules.social.send_dm(message['sender_id'], translations.missing_language[message['language']],
+                               message['from_app'])
 
-    else:
-        new_pid = os.fork()
-        if new_pid == 0:
-            try:
-                modules.social.send_dm(message['sender_id'], translations.wrong_format_text[message['language']],
-                                       message['from_app'])
-                logger.info('unrecognized syntax')
-            except Exception as e:
-                logger.info("Exception: {}".format(e))
-                raise e
-            os._exit(0)
-        else:
-            return '', HTTPStatus.OK
 
-    return '', HTTPStatus.OK
+def wrong_format_process(message):
+    """
+    Reply to an unrecognized command
+    """
+    modules.social.send_dm(message['sender_id'], translations.wrong_format_text[message['language']],
+                           message['from_app'])
+    logger.info('unrecognized syntax')
 
 
 def help_process(message):
     """
     Reply to the sender with help commands
     """
-    if len(modules.translations.coin_tip_commands[message['language']]) > 0:
-        tip_command = modules.translations.coin_tip_commands[message['language']][0]
-    else:
-        tip_command = modules.translations.coin_tip_commands['en'][0]
+    tip_command = modules.commands.tip_command(message['language'])
 
     modules.social.send_dm(message['sender_id'],
                            translations.help_message[message['language']].format(CURRENCY_NAME,
@@ -307,6 +163,7 @@ def auto_donation_process(message):
                                 "WHERE user_id = %s AND from_app = %s ")
             auto_donate_values = [int(new_percent), message['sender_id'], message['from_app']]
             modules.db.set_db_data(auto_donate_call, auto_donate_values)
+            modules.users.for_sender(message).donation_percent = int(new_percent)
             modules.social.send_dm(message['sender_id'],
                                    translations.auto_donate_success[message['language']].format(int(new_percent)),
                                    message['from_app'])
@@ -329,16 +186,16 @@ def mute_process(message, mute_value):
     Update user's mute preferences to prevent or resume messaging / replies.
     """
     logger.info("{}: in mute process".format(datetime.now()))
-    account_check_call = ("SELECT mute FROM users WHERE user_id = {} AND users.from_app = '{}'"
-                          .format(message['sender_id'], message['from_app']))
-    data = modules.db.get_db_data(account_check_call)
-    if not data:
+    sender_context = modules.users.for_sender(message)
+    if not sender_context.exists:
         # Create an account for the user
-        modules.db.create_account(message['sender_id'], message['from_app'], message['sender_screen_name'], 1, mute_value)
+        modules.users.create_account(sender_context, message['sender_screen_name'], 1, mute_value,
+                                     with_address=False)
     else:
         mute_call = ("UPDATE users SET mute = %s WHERE user_id = %s AND from_app = %s")
         mute_values = [mute_value, message['sender_id'], message['from_app']]
         modules.db.set_db_data(mute_call, mute_values)
+        sender_context.mute = mute_value
     
     if mute_value == 1:
         modules.social.send_dm(message['sender_id'], translations.mute[message['language']], message['from_app'])
@@ -351,36 +208,25 @@ def balance_process(message):
     When the user sends a DM containing !balance, reply with the balance of the account linked with their Twitter ID
     """
     logger.info("{}: In balance process".format(datetime.now()))
-    balance_call = ("SELECT account, register FROM users WHERE user_id = {} "
-                    "AND users.from_app = '{}'".format(message['sender_id'], message['from_app']))
-    data = modules.db.get_db_data(balance_call)
-    if not data:
+    sender_context = modules.users.for_sender(message)
+    if not sender_context.exists:
         logger.info("{}: User tried to check balance without an account".format(datetime.now()))
         modules.social.send_dm(message['sender_id'], translations.no_account_text['language'], message['from_app'])
     else:
-        message['sender_account'] = data[0][0]
-        sender_register = data[0][1]
-
-        if sender_register == 0:
-            set_register_call = "UPDATE users SET register = 1 WHERE user_id = %s AND users.from_app = %s AND register = 0"
-            set_register_values = [message['sender_id'], message['from_app']]
-            modules.db.set_db_data(set_register_call, set_register_values)
-        new_pid = os.fork()
-        if new_pid == 0:
-            os._exit(0)
-        else:
-            balance_return = rpc.get_account_balance(message['sender_account'])
-            message['sender_balance'] = balance_return['balance']
-            message['sender_pending'] = balance_return['pending']
-
-            modules.social.send_dm(message['sender_id'], translations.balance_text[message['language']]
-                                   .format(message['sender_balance'],
-                                           CURRENCY_SYMBOL,
-                                           message['sender_pending'],
-                                           CURRENCY_SYMBOL),
-                                   message['from_app'])
-            logger.info("{}: Balance Message Sent!".format(datetime.now()))
-            return ''
+        message['sender_account'] = sender_context.account
+        modules.users.mark_registered(sender_context)
+        balance_return = rpc.get_account_balance(message['sender_account'])
+        message['sender_balance'] = balance_return['balance']
+        message['sender_pending'] = balance_return['pending']
+
+        modules.social.send_dm(message['sender_id'], translations.balance_text[message['language']]
+                               .format(message['sender_balance'],
+                                       CURRENCY_SYMBOL,
+                                       message['sender_pending'],
+                                       CURRENCY_SYMBOL),
+                               message['from_app'])
+        logger.info("{}: Balance Message Sent!".format(datetime.now()))
+        return ''
 
 
 def register_process(message):
@@ -389,13 +235,11 @@ def register_process(message):
     reply with their account number.
     """
     logger.info("{}: In register process.".format(datetime.now()))
-    register_call = ("SELECT address, register FROM users WHERE user_id = {} AND users.from_app = '{}'"
-                     .format(message['sender_id'], message['from_app']))
-    data = modules.db.get_db_data(register_call)
+    sender_context = modules.users.for_sender(message)
 
-    if not data:
+    if not sender_context.exists:
         # Create an account for the user
-        sender_data = modules.db.create_account(message['sender_id'], message['from_app'], message['sender_screen_name'])
+        sender_data = modules.users.create_account(sender_context, message['sender_screen_name'])
         sender_address = sender_data["address"]
         try:
             account_register_text = translations.account_register_text[message['language']]
@@ -407,12 +251,10 @@ def register_process(message):
 
         logger.info("{}: Register successful!".format(datetime.now()))
 
-    elif data[0][1] == 0:
+    elif sender_context.register == 0:
         # The user has an account, but needed to register, so send a message to the user with their account
-        sender_address = data[0][0]
-        account_registration_update = "UPDATE users SET register = 1 WHERE user_id = %s AND register = 0"
-        account_registration_values = [message['sender_id']]
-        modules.db.set_db_data(account_registration_update, account_registration_values)
+        sender_address = modules.users.bind_address(sender_context)
+        modules.users.mark_registered(sender_context)
 
         account_register_text = translations.account_register_text[message['language']]
         modules.social.send_account_message(account_register_text, message, sender_address)
@@ -421,7 +263,7 @@ def register_process(message):
 
     else:
         # The user had an account and already registered, so let them know their account.
-        sender_address = data[0][0]
+        sender_address = modules.users.bind_address(sender_context)
         account_already_registered = translations.account_already_registered[message['language']]
         modules.social.send_account_message(account_already_registered, message, sender_address)
 
@@ -434,13 +276,10 @@ def account_process(message):
     and reply to the user.
     """
     logger.info("{}: In account process.".format(datetime.now()))
-    sender_account_call = (
-        "SELECT address, register FROM users WHERE user_id = {} AND users.from_app = '{}'".format(message['sender_id'],
-                                                                                                message['from_app']))
-    account_data = modules.db.get_db_data(sender_account_call)
-    if not account_data:
+    sender_context = modules.users.for_sender(message)
+    if not sender_context.exists:
         # Create an account for the user
-        sender_info = modules.db.create_account(message['sender_id'], message['from_app'], message['sender_screen_name'])
+        sender_info = modules.users.create_account(sender_context, message['sender_screen_name'])
         sender_address = sender_info["address"]
         account_create_text = translations.account_create_text[message['language']]
         modules.social.send_account_message(account_create_text, message, sender_address)
@@ -448,14 +287,8 @@ def account_process(message):
         logger.info("{}: Created an account for the user!".format(datetime.now()))
 
     else:
-        sender_address = account_data[0][0]
-        sender_register = account_data[0][1]
-
-        if sender_register == 0:
-            set_register_call = (
-                "UPDATE users SET register = 1 WHERE user_id = %s AND users.from_app = %s AND register = 0")
-            set_register_values = [message['sender_id'], message['from_app']]
-            modules.db.set_db_data(set_register_call, set_register_values)
+        sender_address = modules.users.bind_address(sender_context)
+        modules.users.mark_registered(sender_context)
 
         account_text = translations.account_text[message['language']]
         modules.social.send_account_message(account_text, message, sender_address)
@@ -472,26 +305,17 @@ def withdraw_process(message):
     # check if there is a 2nd argument
     if 3 >= len(message['dm_array']) >= 2:
         # if there is, retrieve the sender's account and wallet
-        withdraw_account_call = ("SELECT account, address, register FROM users WHERE user_id = {} AND users.from_app = '{}'"
-                                 .format(message['sender_id'], message['from_app']))
-        withdraw_data = modules.db.get_db_data(withdraw_account_call)
+        sender_context = modules.users.for_sender(message)
 
-        if not withdraw_data:
+        if not sender_context.exists:
 
             modules.social.send_dm(message['sender_id'], translations.no_account_text[message['language']],
                                    message['from_app'])
             logger.info("{}: User tried to withdraw with no account".format(datetime.now()))
 
         else:
-            sender_account = withdraw_data[0][0]
-            sender_address = withdraw_data[0][1]
-            sender_register = withdraw_data[0][2]
-
-            if sender_register == 0:
-                set_register_call = (
-                    "UPDATE users SET register = 1 WHERE user_id = %s AND users.from_app = %s AND register = 0")
-                set_register_values = [message['sender_id'], message['from_app']]
-                modules.db.set_db_data(set_register_call, set_register_values)
+            sender_account = sender_context.account
+            modules.users.mark_registered(sender_context)
 
             balance_return = rpc.get_account_balance(sender_account)
 
@@ -506,6 +330,7 @@ def withdraw_process(message):
                 logger.info("{}: The address is invalid: {}".format(datetime.now(), receiver_address))
 
             elif balance_return['balance'] == 0:
+                sender_address = modules.users.bind_address(sender_context)
                 modules.social.send_dm(message['sender_id'], translations.no_balance_text[message['language']]
                                        .format(sender_address), message['from_app'])
                 logger.info("{}: The user tried to withdraw with 0 balance".format(datetime.now()))
@@ -531,9 +356,21 @@ def withdraw_process(message):
                     withdraw_amount_raw = balance_return['balance']
                     withdraw_amount = balance_return['balance']
                 
-                # XXX - Send balance to account
-                #
-                send_hash = rpc.send_from(sender_account, receiver_address, withdraw_amount_raw)
+                withdraw_ref = 'withdraw-{}-{}'.format(message['from_app'], message['dm_id'])
+                try:
+                    if modules.withdrawals.is_enabled():
+                        # The withdrawal is settled with the next batch, which sends the confirmation
+                        modules.withdrawals.enqueue(withdraw_ref, message, sender_account, receiver_address,
+                                                    withdraw_amount_raw)
+                        return
+                    send_hash = modules.ledger.withdraw(withdraw_ref, sender_account, receiver_address,
+                                                        withdraw_amount_raw)
+                except modules.ledger.InsufficientFunds:
+                    modules.social.send_dm(message['sender_id'],
+                                           translations.not_enough_balance_text[message['language']].format(
+                                               CURRENCY_SYMBOL),
+                                           message['from_app'])
+                    return
 
                 logger.info("{}: send_hash = {}".format(datetime.now(), send_hash))
                 # respond that the withdraw has been processed
@@ -556,11 +393,7 @@ def donate_process(message):
     logger.info("{}: in donate_process.".format(datetime.now()))
 
     if len(message['dm_array']) >= 2:
-        sender_account_call = (
-            "SELECT account FROM users where user_id = {} and users.from_app = '{}'".format(message['sender_id'],
-                                                                                          message['from_app']))
-        donate_data = modules.db.get_db_data(sender_account_call)
-        sender_account = donate_data[0][0]
+        sender_account = modules.users.for_sender(message).account
         send_amount = message['dm_array'][1]
 
         balance_return = rpc.get_account_balance(sender_account)
@@ -600,7 +433,17 @@ def donate_process(message):
                 send_amount_raw = Decimal(send_amount)
             logger.info(('{}; send_amount_raw: {}'.format(datetime.now(), int(send_amount_raw))))
 
-            rpc.move(sender_account, receiver_account, send_amount_raw)
+            try:
+                modules.ledger.transfer('donate-{}-{}'.format(message['from_app'], message['dm_id']), 'donation',
+                                        sender_account, receiver_account, send_amount_raw)
+            except modules.ledger.InsufficientFunds:
+                modules.social.send_dm(message['sender_id'],
+                                       translations.large_donate_text[message['language']]
+                                       .format(balance,
+                                               CURRENCY_NAME,
+                                               Decimal(send_amount)),
+                                       message['from_app'])
+                return ''
             modules.social.send_dm(message['sender_id'], translations.donate_text[message['language']]
                                    .format(send_amount, CURRENCY_SYMBOL), message['from_app'])
             logger.info("{}: {} coin donation processed.  ".format(datetime.now(), Decimal(send_amount)))
@@ -617,18 +460,11 @@ def tip_process(message, users_to_tip, request_json):
     """
     logger.info("{}: in tip_process".format(datetime.now()))
 
-    # Set tip commands
-    tip_commands = modules.translations.coin_tip_commands[message['language']]
-    if message['language'] != 'en':
-        english_commands = modules.translations.coin_tip_commands['en']
-        for command in english_commands:
-            logger.info("commad: {}".format(command))
-            tip_commands.append(command)
-
     message, users_to_tip = modules.social.set_tip_list(message, users_to_tip, request_json)
     if len(users_to_tip) < 1 and message['from_app'] != 'telegram':
+        tip_command = modules.commands.tip_command(message['language'])
         modules.social.send_reply(message, translations.no_users_text[message['language']].format(BOT_NAME_TWITTER,
-                                                                                                  tip_commands[0]))
+                                                                                                  tip_command))
         return
 
     message = modules.social.validate_sender(message)
@@ -680,6 +516,18 @@ def tip_process(message, users_to_tip, request_json):
                                        .format(message['tip_amount_text'], CURRENCY_SYMBOL), message['from_app'])
 
 
+def tip_job(message, users_to_tip, request_json):
+    """
+    Process the tips of a message from the job queue, unless the bot went into maintenance in the meantime
+    """
+    bot_status = config.get('main', 'bot_status')
+    if bot_status == 'maintenance':
+        modules.social.send_dm(message['sender_id'], translations.maintenance_text[message['language']],
+                               message['from_app'])
+    else:
+        tip_process(message, users_to_tip, request_json)
+
+
 def language_process(message, new_language):
     """
     Let user set the language they want the tip bot translated to.
@@ -694,6 +542,7 @@ def language_process(message, new_language):
         set_language_call = "UPDATE languages SET language_code = %s WHERE user_id = %s AND from_app = %s"
         set_language_values = [translations.language_dict[new_language], message['sender_id'], message['from_app']]
         modules.db.set_db_data(set_language_call, set_language_values)
+        modules.users.for_sender(message).language = translations.language_dict[new_language]
         modules.social.send_dm(message['sender_id'],
                                translations.language_change_success[translations.language_dict[new_language]],
                                message['from_app'])
@@ -704,3 +553,21 @@ def language_list_process(message):
     Send a list of languages available for translation.
     """
     modules.social.send_dm(message['sender_id'], translations.language_list, message['from_app'])
+
+
+# Job queued for each DM action, with the arguments to pass after the message
+DM_JOBS = {
+    modules.commands.HELP: (help_process,),
+    modules.commands.MUTE: (mute_process, 1),
+    modules.commands.UNMUTE: (mute_process, 0),
+    modules.commands.BALANCE: (balance_process,),
+    modules.commands.REGISTER: (register_process,),
+    modules.commands.TIP: (redirect_tip_process,),
+    modules.commands.WITHDRAW: (withdraw_process,),
+    modules.commands.DONATE: (donate_process,),
+    modules.commands.ACCOUNT: (account_process,),
+    modules.commands.PRIVATE_TIP: (private_tip_process,),
+    modules.commands.LANGUAGE: (language_command_process,),
+    modules.commands.LANGUAGE_LIST: (language_list_process,),
+    modules.commands.AUTO_DONATE: (auto_donation_process,),
+}
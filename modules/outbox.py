@@ -0,0 +1,333 @@
+import configparser
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from logging.handlers import TimedRotatingFileHandler
+
+import modules.db
+import modules.social
+
+# Set logging info
+logger = logging.getLogger("outbox_log")
+logger.setLevel(logging.INFO)
+handler = TimedRotatingFileHandler('{}/logs/{:%Y-%m-%d}-outbox.log'.format(os.getcwd(), datetime.now()),
+                                   when="d",
+                                   interval=1,
+                                   backupCount=5)
+logger.addHandler(handler)
+
+# Read config and parse constants
+config = configparser.ConfigParser()
+config.read('{}/webhookconfig.ini'.format(os.getcwd()))
+
+OUTBOX_WORKERS = config.getint('main', 'outbox_workers', fallback=4)
+OUTBOX_INTERVAL = config.getint('main', 'outbox_interval', fallback=1)
+OUTBOX_BATCH = config.getint('main', 'outbox_batch', fallback=100)
+OUTBOX_MAX_ATTEMPTS = config.getint('main', 'outbox_max_attempts', fallback=6)
+# Seconds before the first retry, doubled for each further retry up to the max
+OUTBOX_BACKOFF = config.getint('main', 'outbox_backoff', fallback=5)
+OUTBOX_BACKOFF_MAX = config.getint('main', 'outbox_backoff_max', fallback=3600)
+# Twitter calls per second, the x-rate-limit-* headers close the bucket earlier when a limit is used up
+OUTBOX_TWITTER_RATE = config.getfloat('main', 'outbox_twitter_rate', fallback=1)
+
+# Limits of the Telegram Bot API
+TELEGRAM_RATE = 30
+TELEGRAM_GROUP_RATE = 20 / 60
+TELEGRAM_GROUP_BURST = 20
+
+# Seconds sent messages are kept before they are deleted
+SENT_RETENTION = 86400
+DELIVERY_LOCK = 'outbox_delivery'
+
+# Kinds of message
+DM = 'dm'
+REPLY = 'reply'
+
+# Outcomes of a delivery
+SENT = 'sent'
+RETRY = 'retry'
+RATE_LIMITED = 'rate_limited'
+FAILED = 'failed'
+
+stats = {
+    'queued': 0,
+    'sent': 0,
+    'retried': 0,
+    'rate_limited': 0,
+    'deferred': 0,
+    'dead': 0,
+}
+
+_thread = None
+
+
+class TokenBucket:
+    """
+    Allow rate calls per second with bursts of up to capacity calls.  The bucket can also be closed for some time,
+    when the API says its limit is used up.
+    """
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.closed_until = 0
+
+    def wait_time(self):
+        """
+        Seconds until a call is allowed.
+        """
+        now = time.monotonic()
+        if now < self.closed_until:
+            return self.closed_until - now
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            return 0
+        return (1 - self.tokens) / self.rate
+
+    def take(self):
+        self.tokens -= 1
+
+    def close(self, seconds):
+        self.closed_until = max(self.closed_until, time.monotonic() + seconds)
+
+    def is_full(self):
+        return self.wait_time() == 0 and self.tokens >= self.capacity
+
+
+# Buckets are only used by the delivery loop, which runs in the process holding the delivery lock
+_buckets = {
+    'twitter:dm': TokenBucket(OUTBOX_TWITTER_RATE, max(1, OUTBOX_TWITTER_RATE)),
+    'twitter:reply': TokenBucket(OUTBOX_TWITTER_RATE, max(1, OUTBOX_TWITTER_RATE)),
+    'telegram': TokenBucket(TELEGRAM_RATE, TELEGRAM_RATE),
+}
+_group_buckets = {}
+
+
+def add(from_app, kind, receiver, text, reply_to=None):
+    """
+    Queue a message for the delivery workers.
+    """
+    outbox_call = "INSERT INTO outbox (from_app, kind, receiver, reply_to, text) VALUES (%s, %s, %s, %s, %s)"
+    outbox_values = [from_app, kind, str(receiver), None if reply_to is None else str(reply_to), text]
+    err = modules.db.set_db_data(outbox_call, outbox_values)
+    if err is None:
+        stats['queued'] += 1
+    return err
+
+
+def get_buckets(from_app, kind, receiver):
+    """
+    Buckets a message has to take a token from, the most specific last.
+    """
+    if from_app == 'twitter':
+        return [_buckets['twitter:{}'.format(kind)]]
+    buckets = [_buckets['telegram']]
+    # Telegram group chats have negative ids
+    if receiver.startswith('-'):
+        if receiver not in _group_buckets:
+            _group_buckets[receiver] = TokenBucket(TELEGRAM_GROUP_RATE, TELEGRAM_GROUP_BURST)
+        buckets.append(_group_buckets[receiver])
+    return buckets
+
+
+def get_twitter_reset(response):
+    """
+    Seconds until the limit of a Twitter endpoint resets, if the x-rate-limit-* headers say it is used up.
+    """
+    headers = getattr(response, 'headers', None) or {}
+    try:
+        remaining = int(headers.get('x-rate-limit-remaining'))
+        reset = int(headers.get('x-rate-limit-reset'))
+    except (TypeError, ValueError):
+        return None
+    if remaining > 0:
+        return None
+    return max(1, reset - time.time())
+
+
+def get_telegram_retry_after(response):
+    try:
+        return int(response.json()['parameters']['retry_after'])
+    except (ValueError, KeyError, TypeError):
+        return None
+
+
+def deliver(row):
+    """
+    Send one message.  Returns (outcome, error, seconds the bucket of the message has to stay closed).
+    """
+    outbox_id, from_app, kind, receiver, reply_to, text = row[:6]
+    try:
+        if kind == DM:
+            response = modules.social.post_dm(receiver, text, from_app)
+        else:
+            response = modules.social.post_reply(receiver, reply_to, text, from_app)
+    except Exception as e:
+        return RETRY, str(e), None
+
+    if from_app == 'twitter':
+        close_for = get_twitter_reset(response)
+    else:
+        close_for = get_telegram_retry_after(response)
+    if response.status_code in (200, 201):
+        return SENT, None, close_for
+    error = '{}: {}'.format(response.status_code, response.text)
+    if response.status_code == 429:
+        return RATE_LIMITED, error, close_for or 60
+    if response.status_code >= 500:
+        return RETRY, error, close_for
+    return FAILED, error, close_for
+
+
+def get_backoff(attempts):
+    return min(OUTBOX_BACKOFF_MAX, OUTBOX_BACKOFF * 2 ** (attempts - 1))
+
+
+def deliver_due(executor):
+    """
+    Deliver the messages that are due and whose buckets have a token, and record the outcomes.
+    Returns the number of messages sent out.
+    """
+    due_call = ("SELECT id, from_app, kind, receiver, reply_to, text, attempts FROM outbox "
+                "WHERE status = 'pending' AND next_attempt <= now() ORDER BY id LIMIT %s")
+    due = modules.db.get_db_data_new(due_call, [OUTBOX_BATCH])
+    if not due:
+        return 0
+
+    futures = []
+    deferred = []
+    for row in due:
+        buckets = get_buckets(row[1], row[2], row[3])
+        wait = max(bucket.wait_time() for bucket in buckets)
+        if wait > 0:
+            deferred.append((row[0], wait))
+            continue
+        for bucket in buckets:
+            bucket.take()
+        futures.append((row, buckets, executor.submit(deliver, row)))
+
+    # Wait for the sends before opening the transaction, so it does not hold a connection and row locks while they run
+    outcomes = []
+    for row, buckets, future in futures:
+        outcome, error, close_for = future.result()
+        if close_for:
+            buckets[-1].close(close_for)
+        outcomes.append((row, outcome, error, close_for))
+
+    with modules.db.transaction() as db_cursor:
+        # Push back the messages waiting for a token, so they do not hide the messages behind them
+        for outbox_id, wait in deferred:
+            db_cursor.execute("UPDATE outbox SET next_attempt = now() + INTERVAL %s SECOND WHERE id = %s",
+                              [int(wait) + 1, outbox_id])
+        stats['deferred'] += len(deferred)
+
+        for row, outcome, error, close_for in outcomes:
+            attempts = row[6] + 1
+            if outcome == SENT:
+                db_cursor.execute("UPDATE outbox SET status = 'sent', attempts = %s, sent_ts = now() WHERE id = %s",
+                                  [attempts, row[0]])
+                stats['sent'] += 1
+            elif outcome == RATE_LIMITED:
+                db_cursor.execute("UPDATE outbox SET next_attempt = now() + INTERVAL %s SECOND, last_error = %s "
+                                  "WHERE id = %s", [int(close_for) + 1, error, row[0]])
+                stats['rate_limited'] += 1
+            elif outcome == RETRY and attempts < OUTBOX_MAX_ATTEMPTS:
+                db_cursor.execute("UPDATE outbox SET attempts = %s, next_attempt = now() + INTERVAL %s SECOND, "
+                                  "last_error = %s WHERE id = %s", [attempts, get_backoff(attempts), error, row[0]])
+                stats['retried'] += 1
+            else:
+                db_cursor.execute("UPDATE outbox SET status = 'dead', attempts = %s, last_error = %s WHERE id = %s",
+                                  [attempts, error, row[0]])
+                stats['dead'] += 1
+                logger.info("{}: Outbox message {} to {} moved to the dead-letter list: {}".format(
+                    datetime.now(), row[0], row[3], error))
+
+        db_cursor.execute("DELETE FROM outbox WHERE status = 'sent' AND sent_ts < now() - INTERVAL %s SECOND "
+                          "LIMIT 1000", [SENT_RETENTION])
+
+    for chat_id in [chat_id for chat_id, bucket in _group_buckets.items() if bucket.is_full()]:
+        del _group_buckets[chat_id]
+    return len(futures)
+
+
+def deliver_while_locked():
+    """
+    Deliver the outbox for as long as this process holds the delivery lock.  Only one process delivers, so its token
+    buckets see every message sent by the bot.
+    """
+    with modules.db.connection() as db:
+        db_cursor = db.cursor()
+        db_cursor.execute("SELECT GET_LOCK(%s, 0)", [DELIVERY_LOCK])
+        locked = db_cursor.fetchall()[0][0] == 1
+        if not locked:
+            db_cursor.close()
+            return
+        logger.info("{}: Delivering the outbox".format(datetime.now()))
+        try:
+            with ThreadPoolExecutor(max_workers=OUTBOX_WORKERS, thread_name_prefix='outbox') as executor:
+                while True:
+                    # Keeps the lock connection alive, and stops if the lock was lost with it
+                    db_cursor.execute("SELECT IS_USED_LOCK(%s) = CONNECTION_ID()", [DELIVERY_LOCK])
+                    if db_cursor.fetchall()[0][0] != 1:
+                        return
+                    if not deliver_due(executor):
+                        time.sleep(OUTBOX_INTERVAL)
+        finally:
+            db_cursor.execute("SELECT RELEASE_LOCK(%s)", [DELIVERY_LOCK])
+            db_cursor.fetchall()
+            db_cursor.close()
+
+
+def get_dead_letters(limit=100):
+    """
+    Messages that could not be delivered.
+    """
+    dead_call = ("SELECT id, from_app, kind, receiver, text, attempts, last_error, created_ts FROM outbox "
+                 "WHERE status = 'dead' ORDER BY id DESC LIMIT %s")
+    return modules.db.get_db_data_new(dead_call, [limit])
+
+
+def requeue_dead_letters():
+    """
+    Queue the dead-letter messages again, once whatever made them fail is fixed.
+    """
+    with modules.db.transaction() as db_cursor:
+        db_cursor.execute("UPDATE outbox SET status = 'pending', attempts = 0, next_attempt = now() "
+                          "WHERE status = 'dead'")
+        requeued = db_cursor.rowcount
+    logger.info("{}: Requeued {} dead-letter messages".format(datetime.now(), requeued))
+    return requeued
+
+
+def get_stats():
+    outbox_stats = dict(stats)
+    status_call = "SELECT status, COUNT(*) FROM outbox GROUP BY status"
+    for status, count in modules.db.get_db_data(status_call):
+        outbox_stats['status_{}'.format(status)] = count
+    return outbox_stats
+
+
+def run_forever():
+    while True:
+        try:
+            deliver_while_locked()
+        except Exception as e:
+            logger.info("{}: Error delivering the outbox: {}".format(datetime.now(), e))
+        time.sleep(OUTBOX_INTERVAL)
+
+
+def start():
+    """
+    Start the delivery loop for this process.  It waits for the delivery lock while another process holds it.
+    """
+    global _thread
+    if _thread is not None and _thread.is_alive():
+        return
+    _thread = threading.Thread(target=run_forever, name='outbox', daemon=True)
+    _thread.start()
@@ -0,0 +1,167 @@
+import configparser
+import functools
+import hashlib
+import json
+import logging
+import os
+import time
+from datetime import datetime
+from logging.handlers import TimedRotatingFileHandler
+
+from flask import Response, make_response, request
+
+import modules.jobs
+import redis
+
+# Set logging info
+logger = logging.getLogger("page_cache_log")
+logger.setLevel(logging.INFO)
+handler = TimedRotatingFileHandler('{}/logs/{:%Y-%m-%d}-page_cache.log'.format(os.getcwd(), datetime.now()),
+                                   when="d",
+                                   interval=1,
+                                   backupCount=5)
+logger.addHandler(handler)
+
+# Read config and parse constants
+config = configparser.ConfigParser()
+config.read('{}/webhookconfig.ini'.format(os.getcwd()))
+
+# Check the currency of the bot
+CURRENCY = config.get('main', 'currency')
+
+# Cached pages: name -> (seconds a render is served, whether a new tip makes it stale)
+PAGES = {
+    'index': (config.getint('main', 'page_cache_ttl_index', fallback=30), True),
+    'tippers': (config.getint('main', 'page_cache_ttl_tippers', fallback=60), True),
+    'tiplist': (config.getint('main', 'page_cache_ttl_tiplist', fallback=15), True),
+    'tutorial': (config.getint('main', 'page_cache_ttl_tutorial', fallback=3600), False),
+}
+# Seconds a render may take before the requests waiting on it render the page themselves
+RENDER_TIMEOUT = 10
+RENDER_POLL = 0.05
+
+# Pages are kept in Redis, so every web process serves the render of the first one.  Bumping the generation makes the
+# pages that depend on the tips stale at once.
+PAGE_KEY = 'pages:{}:{}:{}:{}'
+GENERATION_KEY = 'pages:{}:generation'.format(CURRENCY)
+
+stats = {
+    'hits': 0,
+    'misses': 0,
+    'coalesced': 0,
+    'not_modified': 0,
+    'invalidations': 0,
+    'errors': 0,
+}
+
+
+def get_key(connection, name, query_string):
+    depends_on_tips = PAGES[name][1]
+    generation = int(connection.get(GENERATION_KEY) or 0) if depends_on_tips else 0
+    return PAGE_KEY.format(CURRENCY, name, generation, query_string)
+
+
+def render(view, args, kwargs):
+    """
+    Run the view and keep what is needed to serve its response again.
+    """
+    response = make_response(view(*args, **kwargs))
+    body = response.get_data(as_text=True)
+    return {
+        'status': response.status_code,
+        'mimetype': response.mimetype,
+        'body': body,
+        'etag': hashlib.sha1(body.encode('utf-8')).hexdigest(),
+        'last_modified': int(time.time()),
+    }
+
+
+def get_page(name, view, args, kwargs):
+    """
+    Cached render of a page.  Only one request renders a missing page, the others wait for its render and render the
+    page themselves only if it takes longer than RENDER_TIMEOUT.
+    """
+    ttl = PAGES[name][0]
+    connection = modules.jobs.get_connection()
+    key = get_key(connection, name, request.query_string.decode('utf-8'))
+    stored = connection.get(key)
+    if stored is not None:
+        stats['hits'] += 1
+        return json.loads(stored)
+
+    lock_key = key + ':render'
+    token = modules.jobs.acquire_lock(lock_key, RENDER_TIMEOUT)
+    if token is None:
+        deadline = time.monotonic() + RENDER_TIMEOUT
+        while time.monotonic() < deadline:
+            time.sleep(RENDER_POLL)
+            stored = connection.get(key)
+            if stored is not None:
+                stats['coalesced'] += 1
+                return json.loads(stored)
+
+    stats['misses'] += 1
+    try:
+        page = render(view, args, kwargs)
+        if page['status'] == 200:
+            connection.set(key, json.dumps(page), ex=ttl)
+        return page
+    finally:
+        # A request that gave up waiting leaves the lock to the request still rendering, and a render that outlasted
+        # the lock leaves it to the request that took it over
+        if token is not None:
+            modules.jobs.release_lock(lock_key, token)
+
+
+def to_response(name, page):
+    response = Response(page['body'], status=page['status'], mimetype=page['mimetype'])
+    if page['status'] != 200:
+        return response
+    response.set_etag(page['etag'])
+    response.last_modified = page['last_modified']
+    response.cache_control.public = True
+    if PAGES[name][1]:
+        # Browsers and proxies cannot be told about a new tip, they revalidate every time and mostly get a 304
+        response.cache_control.no_cache = True
+    else:
+        response.cache_control.max_age = PAGES[name][0]
+    response = response.make_conditional(request)
+    if response.status_code == 304:
+        stats['not_modified'] += 1
+    return response
+
+
+def cached(name):
+    """
+    Serve a GET route from the page cache, answering conditional requests with 304.  The route is rendered as usual
+    when Redis cannot be reached.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            if request.method != 'GET':
+                return view(*args, **kwargs)
+            try:
+                page = get_page(name, view, args, kwargs)
+            except redis.RedisError as e:
+                stats['errors'] += 1
+                logger.info("{}: Could not serve {} from the page cache: {}".format(datetime.now(), name, e))
+                return view(*args, **kwargs)
+            return to_response(name, page)
+        return wrapper
+    return decorator
+
+
+def invalidate():
+    """
+    Make the pages that show tips stale, after a tip was recorded.
+    """
+    try:
+        modules.jobs.get_connection().incr(GENERATION_KEY)
+        stats['invalidations'] += 1
+    except Exception as e:
+        logger.info("{}: Could not invalidate the page cache: {}".format(datetime.now(), e))
+
+
+def get_stats():
+    return dict(stats)
@@ -0,0 +1,108 @@
+import configparser
+import os
+import re
+
+import modules.commands
+
+# Read config and parse constants
+config = configparser.ConfigParser()
+config.read('{}/webhookconfig.ini'.format(os.getcwd()))
+
+# Check the currency of the bot
+CURRENCY = config.get('main', 'currency')
+
+BOT_ID_TWITTER = config.get(CURRENCY, 'bot_id_twitter')
+BOT_NAME_TWITTER = config.get(CURRENCY, 'bot_name_twitter')
+BOT_NAME_TELEGRAM = config.get(CURRENCY, 'bot_name_telegram')
+
+stats = {
+    'tweets_seen': 0,
+    'tweets_passed': 0,
+    'telegram_seen': 0,
+    'telegram_passed': 0,
+    'dropped_retweet': 0,
+    'dropped_from_bot': 0,
+    'dropped_no_mention': 0,
+    'dropped_no_command': 0,
+}
+
+
+def _token_pattern(tokens):
+    """
+    Match any of the tokens as a whole word of a lowercase text.
+    """
+    alternatives = '|'.join(re.escape(token) for token in sorted(tokens, key=len, reverse=True))
+    return re.compile(r'(?:^|\s)(?:{})(?=\s|$)'.format(alternatives))
+
+
+# Tip commands of every language, the language of the sender is not known yet at this stage
+TIP_PATTERN = _token_pattern(frozenset().union(*modules.commands.TIP_TOKENS.values()))
+TELEGRAM_BOT_PATTERN = _token_pattern([BOT_NAME_TELEGRAM.lower()]) if BOT_NAME_TELEGRAM.strip() else None
+TWITTER_BOT_MENTION = '@' + BOT_NAME_TWITTER.strip().lstrip('@').lower()
+
+
+def _normalise(text):
+    return text.replace('！', '!').lower()
+
+
+def has_tip_command(text):
+    return TIP_PATTERN.search(_normalise(text)) is not None
+
+
+def _drop(reason):
+    stats['dropped_{}'.format(reason)] += 1
+    return False
+
+
+def accept_tweet(status):
+    """
+    Check, without any I/O, that a tweet event can be a tip: an original tweet, not from the bot, mentioning or
+    replying to the bot, with a tip command.
+    """
+    stats['tweets_seen'] += 1
+    if status.get('retweeted_status'):
+        return _drop('retweet')
+    if str(status.get('user', {}).get('id_str')) == str(BOT_ID_TWITTER):
+        return _drop('from_bot')
+
+    if status.get('truncated') is False:
+        text = status.get('text') or ''
+        entities = status.get('entities', {})
+    else:
+        text = status.get('extended_tweet', {}).get('full_text') or ''
+        entities = status.get('extended_tweet', {}).get('entities', status.get('entities', {}))
+
+    mentioned = (str(status.get('in_reply_to_user_id_str')) == str(BOT_ID_TWITTER) or
+                 any(str(mention.get('id_str')) == str(BOT_ID_TWITTER)
+                     for mention in entities.get('user_mentions', [])) or
+                 TWITTER_BOT_MENTION in text.lower())
+    if not mentioned:
+        return _drop('no_mention')
+    if not has_tip_command(text):
+        return _drop('no_command')
+
+    stats['tweets_passed'] += 1
+    return True
+
+
+def accept_telegram_group(text):
+    """
+    Check, without any I/O, that a Telegram group message mentions the bot and has a tip command.
+    """
+    stats['telegram_seen'] += 1
+    normalised = _normalise(text)
+    if TELEGRAM_BOT_PATTERN is None or TELEGRAM_BOT_PATTERN.search(normalised) is None:
+        return _drop('no_mention')
+    if TIP_PATTERN.search(normalised) is None:
+        return _drop('no_command')
+
+    stats['telegram_passed'] += 1
+    return True
+
+
+def get_stats():
+    prefilter_stats = dict(stats)
+    seen = stats['tweets_seen'] + stats['telegram_seen']
+    passed = stats['tweets_passed'] + stats['telegram_passed']
+    prefilter_stats['drop_rate'] = round((seen - passed) / seen, 4) if seen else 0
+    return prefilter_stats
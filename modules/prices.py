@@ -0,0 +1,172 @@
+import configparser
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+from decimal import Decimal
+from logging.handlers import TimedRotatingFileHandler
+
+import modules.http
+import modules.jobs
+
+# Set logging info
+logger = logging.getLogger("prices_log")
+logger.setLevel(logging.INFO)
+handler = TimedRotatingFileHandler('{}/logs/{:%Y-%m-%d}-prices.log'.format(os.getcwd(), datetime.now()),
+                                   when="d",
+                                   interval=1,
+                                   backupCount=5)
+logger.addHandler(handler)
+
+# Read config and parse constants
+config = configparser.ConfigParser()
+config.read('{}/webhookconfig.ini'.format(os.getcwd()))
+
+# Check the currency of the bot
+CURRENCY = config.get('main', 'currency')
+
+# Prices younger than the refresh interval are served as they are, older ones are served while they are refreshed and
+# prices older than the max age are refused.
+PRICE_REFRESH_INTERVAL = config.getint('main', 'price_refresh_interval', fallback=60)
+PRICE_MAX_AGE = config.getint('main', 'price_max_age', fallback=900)
+
+# Fiat currencies of the fiat tips and the dashboard
+FIATS = ['usd', 'eur', 'gbp']
+PRICE_URL = 'https://api.coingecko.com/api/v3/simple/price?ids={}&vs_currencies={}'.format(CURRENCY, ','.join(FIATS))
+# Prices are kept in Redis, so the web app and every job worker share them
+PRICE_KEY = 'prices:{}'.format(CURRENCY)
+REFRESH_LOCK_KEY = 'prices:{}:refresh'.format(CURRENCY)
+# Seconds before the refresh lock of a process that died expires
+REFRESH_LOCK_TIMEOUT = 30
+
+stats = {
+    'hits': 0,
+    'stale_hits': 0,
+    'misses': 0,
+    'refreshes': 0,
+    'refresh_errors': 0,
+}
+
+# Last prices read from Redis by this process: (fetched_at, {fiat: Decimal})
+_latest = (0, {})
+_thread = None
+# Held while this process refreshes in the background, so a burst of stale reads starts a single refresh
+_refreshing = threading.Lock()
+
+
+class PriceUnavailable(Exception):
+    pass
+
+
+def refresh():
+    """
+    Fetch the price of every supported fiat with one call and store it for every process.  Only one process refreshes
+    at a time.
+    """
+    global _latest
+    connection = modules.jobs.get_connection()
+    token = modules.jobs.acquire_lock(REFRESH_LOCK_KEY, REFRESH_LOCK_TIMEOUT)
+    if token is None:
+        return False
+    try:
+        response = modules.http.get(PRICE_URL)
+        response.raise_for_status()
+        price_json = response.json()[CURRENCY]
+        prices = {fiat: str(price_json[fiat]) for fiat in FIATS if fiat in price_json}
+        if not prices:
+            raise ValueError('no prices in {}'.format(response.text))
+        fetched_at = time.time()
+        connection.set(PRICE_KEY, json.dumps({'fetched_at': fetched_at, 'prices': prices}))
+        _latest = (fetched_at, {fiat: Decimal(price) for fiat, price in prices.items()})
+        stats['refreshes'] += 1
+        return True
+    except Exception as e:
+        stats['refresh_errors'] += 1
+        logger.info("{}: Could not refresh the prices: {}".format(datetime.now(), e))
+        return False
+    finally:
+        # A refresh slowed down by retries can outlast the lock, which then belongs to the next refresher
+        modules.jobs.release_lock(REFRESH_LOCK_KEY, token)
+
+
+def _refresh_in_background():
+    if not _refreshing.acquire(blocking=False):
+        return
+
+    def run():
+        try:
+            refresh()
+        finally:
+            _refreshing.release()
+
+    threading.Thread(target=run, name='price-refresh', daemon=True).start()
+
+
+def _load():
+    """
+    Latest prices, read again from Redis once the copy of this process is due for a refresh.
+    """
+    global _latest
+    if time.time() - _latest[0] < PRICE_REFRESH_INTERVAL:
+        return _latest
+    try:
+        stored = modules.jobs.get_connection().get(PRICE_KEY)
+    except Exception as e:
+        logger.info("{}: Could not read the prices: {}".format(datetime.now(), e))
+        return _latest
+    if stored is not None:
+        stored = json.loads(stored)
+        if stored['fetched_at'] > _latest[0]:
+            _latest = (stored['fetched_at'], {fiat: Decimal(price) for fiat, price in stored['prices'].items()})
+    return _latest
+
+
+def get_price(fiat):
+    """
+    Price of the bot currency in the fiat, without waiting on the price API.  A stale price is served while it is
+    refreshed in the background, PriceUnavailable is raised if there is no price younger than PRICE_MAX_AGE.
+    """
+    fetched_at, prices = _load()
+    age = time.time() - fetched_at
+    price = prices.get(fiat.lower())
+    if price is None or age > PRICE_MAX_AGE:
+        stats['misses'] += 1
+        _refresh_in_background()
+        raise PriceUnavailable('no {} price younger than {}s'.format(fiat, PRICE_MAX_AGE))
+    if age > PRICE_REFRESH_INTERVAL:
+        stats['stale_hits'] += 1
+        _refresh_in_background()
+    else:
+        stats['hits'] += 1
+    return price
+
+
+def get_stats():
+    prices_stats = dict(stats)
+    prices_stats['age'] = round(time.time() - _latest[0]) if _latest[0] else None
+    prices_stats['prices'] = {fiat: str(price) for fiat, price in _latest[1].items()}
+    return prices_stats
+
+
+def run_forever():
+    while True:
+        try:
+            fetched_at, _ = _load()
+            if time.time() - fetched_at >= PRICE_REFRESH_INTERVAL:
+                refresh()
+        except Exception as e:
+            logger.info("{}: Error refreshing the prices: {}".format(datetime.now(), e))
+        time.sleep(min(PRICE_REFRESH_INTERVAL, 15))
+
+
+def start():
+    """
+    Keep the prices fresh from this process.
+    """
+    global _thread
+    if _thread is not None and _thread.is_alive():
+        return
+    _thread = threading.Thread(target=run_forever, name='prices', daemon=True)
+    _thread.start()
@@ -1,16 +1,24 @@
-from bitcoinrpc.authproxy import AuthServiceProxy, JSONRPCException
+from bitcoinrpc.authproxy import AuthServiceProxy, EncodeDecimal, HTTP_TIMEOUT, JSONRPCException
 import configparser
+import itertools
+import json
 import logging
 import os
+import threading
 import uuid
 import re
 from datetime import datetime
 from decimal import Decimal
 
+import requests
 from logging.handlers import TimedRotatingFileHandler
 
+import modules.balance_cache
 import modules.db
+import modules.ledger
+import modules.page_cache
 import modules.translations as translations
+import modules.users
 
 # Set logging info
 logger = logging.getLogger("rpc_log")
@@ -43,7 +51,121 @@ CURRENCY_SYMBOL = config.get(CURRENCY, 'currency_symbol')
 # Constants
 RE_EMOJI = re.compile('[\U00010000-\U0010ffff\U000026A1]', flags=re.UNICODE)
 
-rpc = AuthServiceProxy("http://%s:%s@%s:%s"%(WALLET_USERNAME, WALLET_PASSWORD, WALLET_IP, WALLET_PORT))
+RPC_URL = "http://%s:%s@%s:%s"%(WALLET_USERNAME, WALLET_PASSWORD, WALLET_IP, WALLET_PORT)
+
+
+class LocalProxy(object):
+    """
+    AuthServiceProxy keeps a single HTTP connection, which is neither thread nor fork safe.  Give each thread of each
+    process its own proxy.
+    """
+    def __init__(self, service_url):
+        self._service_url = service_url
+        self._local = threading.local()
+
+    def _proxy(self):
+        if getattr(self._local, 'pid', None) != os.getpid():
+            self._local.proxy = AuthServiceProxy(self._service_url)
+            self._local.pid = os.getpid()
+        return self._local.proxy
+
+    def __getattr__(self, name):
+        return getattr(self._proxy(), name)
+
+
+rpc = LocalProxy(RPC_URL)
+
+# Codes of the errors raised by the client rather than returned by the wallet
+CLIENT_ERROR_CODES = (-342, -343)
+
+
+def is_rejected(e):
+    """
+    Check if a wallet call failed with a JSON-RPC error response, i.e. the wallet refused it.  Timeouts and other
+    transport errors leave the outcome of the call unknown.
+    """
+    if not isinstance(e, JSONRPCException):
+        return False
+    error = getattr(e, 'error', None) or {}
+    return error.get('code') not in CLIENT_ERROR_CODES
+
+
+class BatchCall(object):
+    """
+    One call of a Batch.  result raises the JSONRPCException of this call only.
+    """
+    def __init__(self, call_id, method, params):
+        self.id = call_id
+        self.method = method
+        self.params = params
+        self.response = None
+        self.error = None
+
+    @property
+    def result(self):
+        if self.error is not None:
+            raise JSONRPCException(self.error)
+        return self.response
+
+
+class Batch(object):
+    """
+    Collect several wallet calls and send them in a single JSON-RPC batch request.
+
+        batch = rpc.Batch()
+        height = batch.add('getblockcount')
+        balance = batch.add('getbalance', account, 1)
+        batch.execute()
+        height.result, balance.result
+    """
+    _ids = itertools.count(1)
+    _local = threading.local()
+
+    def __init__(self):
+        self.calls = []
+
+    def add(self, method, *params):
+        call = BatchCall(next(Batch._ids), method, list(params))
+        self.calls.append(call)
+        return call
+
+    def _session(self):
+        if getattr(Batch._local, 'pid', None) != os.getpid():
+            Batch._local.session = requests.Session()
+            Batch._local.session.auth = (WALLET_USERNAME, WALLET_PASSWORD)
+            Batch._local.pid = os.getpid()
+        return Batch._local.session
+
+    def execute(self):
+        if not self.calls:
+            return []
+        batch_data = [{"jsonrpc": "2.0", "method": call.method, "params": call.params, "id": call.id}
+                      for call in self.calls]
+        response = self._session().post("http://{}:{}/".format(WALLET_IP, WALLET_PORT),
+                                        data=json.dumps(batch_data, default=EncodeDecimal),
+                                        headers={'Content-type': 'application/json'},
+                                        timeout=HTTP_TIMEOUT)
+        try:
+            responses = json.loads(response.text, parse_float=Decimal)
+        except ValueError:
+            raise JSONRPCException({'code': -342, 'message': 'non-JSON HTTP response with \'{} {}\' from server'
+                                   .format(response.status_code, response.reason)})
+        if not isinstance(responses, list):
+            # The whole batch was rejected
+            raise JSONRPCException(responses.get('error') or {'code': -343, 'message': 'invalid batch response'})
+
+        by_id = {item.get('id'): item for item in responses}
+        for call in self.calls:
+            item = by_id.get(call.id)
+            if item is None:
+                call.error = {'code': -343, 'message': 'missing JSON-RPC result'}
+            elif item.get('error') is not None:
+                call.error = item['error']
+            else:
+                call.response = item.get('result')
+        logger.info("{}: batch of {} calls: {}".format(datetime.now(), len(self.calls),
+                                                       [call.method for call in self.calls]))
+        return self.calls
 
 
 def strip_emoji(text):
@@ -56,14 +178,47 @@ def strip_emoji(text):
 
 def get_account_balance(account_name):
     """
-    Get the current balance of an account
+    Get the current balance of an account, as maintained by the ledger and the wallet indexer.  Balances are cached
+    in Redis and dropped as soon as a change to the funds of the account is committed.
+    """
+    return modules.balance_cache.get(account_name)
+
+def get_wallet_balance_at_height(account_name, min_confirmation):
+    """
+    Get the balance the wallet holds for an account and the block height it was computed at.  The height is read
+    before and after the balance in the same batch, height is None if a block arrived in between.
+    """
+    batch = Batch()
+    height_before = batch.add('getblockcount')
+    balance = batch.add('getbalance', account_name, min_confirmation)
+    height_after = batch.add('getblockcount')
+    batch.execute()
+    if height_before.result != height_after.result:
+        return balance.result, None
+    return balance.result, height_before.result
+
+def get_block_count():
+    return rpc.getblockcount()
+
+def get_block_hash(height):
+    return rpc.getblockhash(height)
+
+def list_since_block(block_hash, target_confirmations):
+    """
+    List wallet transactions in blocks after block_hash, plus the last target_confirmations blocks, along with the
+    current block height
     """
-    unconfirmed_balance = rpc.getbalance(account_name, 1)
-    confirmed_balance = rpc.getbalance(account_name, int(MIN_TX_CONFIRMATION))
-    return {
-        "balance": confirmed_balance,
-        "pending": unconfirmed_balance - confirmed_balance,
-    }
+    batch = Batch()
+    since_block = batch.add('listsinceblock', block_hash, target_confirmations)
+    height = batch.add('getblockcount')
+    batch.execute()
+    return since_block.result, height.result
+
+def get_transaction_fee(tx_id):
+    """
+    Get the fee paid by a wallet transaction, as a positive amount
+    """
+    return -Decimal(rpc.gettransaction(tx_id).get('fee', 0))
 
 def validate_address(address):
     """
@@ -91,6 +246,27 @@ def generate_new_account():
                 "address": address,
             }
 
+def generate_new_accounts(count):
+    """
+    Generate several new accounts, pipelining the getnewaddress calls in a single batch request.  Addresses the wallet
+    failed to generate are left out.
+    """
+    batch = Batch()
+    calls = [(account_name, batch.add('getnewaddress', account_name))
+             for account_name in (str(uuid.uuid1()).replace("-", "") for _ in range(count))]
+    batch.execute()
+
+    accounts = []
+    for account_name, call in calls:
+        if call.error is not None:
+            logger.info("{}: getnewaddress failed for {}: {}".format(datetime.now(), account_name, call.error))
+            continue
+        accounts.append({
+            "account": account_name,
+            "address": call.result,
+        })
+    return accounts
+
 def send_tip(message, users_to_tip, tip_index):
     """
     Process tip for specified user
@@ -110,20 +286,19 @@ def send_tip(message, users_to_tip, tip_index):
             logger.info("{}: User tried to tip themself").format(datetime.now())
             return
 
-        # Check if the receiver has an account
-        receiver_account_get = ("SELECT account FROM users where user_id = {} and users.from_app = '{}'"
-                                .format(int(users_to_tip[tip_index]['receiver_id']), message['from_app']))
-        receiver_account_data = modules.db.get_db_data(receiver_account_get)
+        # Check if the receiver has an account, set_tip_list already loaded their context
+        receiver_context = modules.users.get(users_to_tip[tip_index]['receiver_id'], message['from_app'])
 
-        # If they don't, check reserve accounts and assign one.
-        if not receiver_account_data:
-            receiver_account_info = modules.db.create_account(users_to_tip[tip_index]['receiver_id'], message['from_app'], users_to_tip[tip_index]['receiver_screen_name'], 0)
-            users_to_tip[tip_index]['receiver_account'] = receiver_account_info["account"]
+        # If they don't, open a ledger-only account.  They get an address once they register.
+        if not receiver_context.exists:
+            modules.users.create_account(receiver_context, users_to_tip[tip_index]['receiver_screen_name'], 0,
+                                         with_address=False)
+            users_to_tip[tip_index]['receiver_account'] = receiver_context.account
             logger.info("{}: Sender sent to a new receiving account.  Created  account {}"
                         .format(datetime.now(), users_to_tip[tip_index]['receiver_account']))
 
         else:
-            users_to_tip[tip_index]['receiver_account'] = receiver_account_data[0][0]
+            users_to_tip[tip_index]['receiver_account'] = receiver_context.account
 
         # Send the tip
         if message['from_app'] == 'telegram':
@@ -136,33 +311,33 @@ def send_tip(message, users_to_tip, tip_index):
         logger.info("{}: {} - To: {}".format(datetime.now(), message['tip_id'], users_to_tip[tip_index]['receiver_account']))
         logger.info("{}: {} - amount: {:8f}".format(datetime.now(), message['tip_id'], message['tip_amount_raw']))
 
+        # Move the funds and record the tip in a single DB transaction
+        message['text'] = strip_emoji(message['text'])
         try:
-            move(message['sender_account'], users_to_tip[tip_index]['receiver_account'], float("{:8f}".format(message['tip_amount_raw'])))
-        except:
+            modules.ledger.transfer(message['tip_id'], 'tip', message['sender_account'],
+                                    users_to_tip[tip_index]['receiver_account'], message['tip_amount_raw'],
+                                    modules.db.get_tip_statements(message, users_to_tip, tip_index))
+        except modules.ledger.DuplicateEntry:
+            # The job is being retried and this tip already went through
+            logger.info("{}: {} - Tip already sent".format(datetime.now(), message['tip_id']))
+            return
+        except Exception as e:
+            logger.info("{}: {} - Error processing tip: {}".format(datetime.now(), message['tip_id'], e))
             modules.social.send_reply(message, 'There was an error processing one of your tips.  '
                                             'Please reach out to the admin with this code: {}'
                                         .format(message['tip_id']))
             return
+        modules.page_cache.invalidate()
 
-
-        # Update the DB
-        message['text'] = strip_emoji(message['text'])
-        modules.db.set_db_data_tip(message, users_to_tip, tip_index)
-
-        # Get receiver's new balance
+        # Notify the receiver
         try:
-            logger.info("{}: Checking to receive new tip")
-
-            balance_return = get_account_balance(users_to_tip[tip_index]['receiver_account'])
-            users_to_tip[tip_index]['balance'] = balance_return['balance']
-
             modules.social.send_dm(users_to_tip[tip_index]['receiver_id'],
                                 translations.receiver_tip_text[users_to_tip[tip_index]['receiver_language']]
                                 .format(message['sender_screen_name'], message['tip_amount_raw'],
                                         CURRENCY_SYMBOL, CURRENCY_NAME, URL), message['from_app'])
 
         except Exception as e:
-            logger.info("{}: ERROR IN RECEIVING NEW TIP - POSSIBLE NEW ACCOUNT NOT REGISTERED WITH DPOW: {}"
+            logger.info("{}: ERROR NOTIFYING THE RECEIVER OF A NEW TIP: {}"
                          .format(datetime.now(), e))
 
         logger.info("{}: tip sent to {}".format(datetime.now(), users_to_tip[tip_index]['receiver_screen_name']))
@@ -172,3 +347,10 @@ def move(from_account, to_account, amount):
 
 def send_from(from_account, to_address, amount):
     return rpc.sendfrom(from_account, to_address, float("{:8f}".format(amount)))
+
+def send_to_address(to_address, amount):
+    return rpc.sendtoaddress(to_address, float("{:8f}".format(amount)))
+
+def send_many(from_account, amounts):
+    return rpc.sendmany(from_account, {address: float("{:8f}".format(amount)) for address, amount in amounts.items()})
+
@@ -5,16 +5,23 @@ import os
 from datetime import datetime
 from decimal import Decimal
 
-import telegram
 import tweepy
-from TwitterAPI import TwitterAPI
+from requests_oauthlib import OAuth1
 from logging.handlers import TimedRotatingFileHandler
 
 
 import modules.rpc as rpc
+import modules.commands
+import modules.chat_members
 import modules.currency
 import modules.db
+import modules.http
+import modules.identity
+import modules.outbox
+import modules.prices
+import modules.tip_parser
 import modules.translations as translations
+import modules.users
 
 # Set Log File
 logger = logging.getLogger("social_log")
@@ -40,8 +47,9 @@ CONSUMER_SECRET = config.get(CURRENCY, 'consumer_secret')
 ACCESS_TOKEN = config.get(CURRENCY, 'access_token')
 ACCESS_TOKEN_SECRET = config.get(CURRENCY, 'access_token_secret')
 
-# Secondary API for non-tweepy supported requests
-twitterAPI = TwitterAPI(CONSUMER_KEY, CONSUMER_SECRET, ACCESS_TOKEN, ACCESS_TOKEN_SECRET)
+# Signs the Twitter calls made with the shared HTTP client
+twitter_auth = OAuth1(CONSUMER_KEY, CONSUMER_SECRET, ACCESS_TOKEN, ACCESS_TOKEN_SECRET)
+TWITTER_API_URL = 'https://api.twitter.com/1.1'
 
 # Telegram API
 TELEGRAM_KEY = config.get(CURRENCY, 'telegram_key')
@@ -60,12 +68,10 @@ TELEGRAM_URI = config.get('routes', 'telegram_uri')
 # Connect to Twitter
 auth = tweepy.OAuthHandler(CONSUMER_KEY, CONSUMER_SECRET)
 auth.set_access_token(ACCESS_TOKEN, ACCESS_TOKEN_SECRET)
-api = tweepy.API(auth)
+api = tweepy.API(auth, timeout=modules.http.HTTP_READ_TIMEOUT)
 
-# Connect to Telegram
-if TELEGRAM_KEY != 'none':
-    print(TELEGRAM_KEY)
-    telegram_bot = telegram.Bot(token=TELEGRAM_KEY)
+# Telegram Bot API, called with the shared HTTP client
+TELEGRAM_API_URL = 'https://api.telegram.org/bot{}'.format(TELEGRAM_KEY)
 
 
 
@@ -73,59 +79,32 @@ def get_language(message):
     """
     Set the language for messaging the user
     """
-    get_language_call = "SELECT language_code FROM languages WHERE user_id = %s AND languages.from_app = %s"
-    language_values = [message['sender_id'], message['from_app']]
-    language_return = modules.db.get_db_data_new(get_language_call, language_values)
-    # If there is no record, create a new one with default EN language
-    try:
-        message['language'] = language_return[0][0]
-    except Exception as e:
+    sender_context = modules.users.for_sender(message)
+    if not sender_context.exists:
+        # Create an account for the user
+        modules.users.create_account(sender_context, message['sender_screen_name'], with_address=False)
+    if sender_context.language is None:
         logger.info("{}: There was no language entry, setting default".format(datetime.now()))
-        # Check if the user has an account - if not, create one
-        no_lang_call = ("SELECT account, register FROM users WHERE user_id = {} AND users.from_app = '{}'"
-                         .format(message['sender_id'], message['from_app']))
-        data = modules.db.get_db_data(no_lang_call)
-
-        if not data:
-            # Create an account for the user
-            modules.db.create_account(message['sender_id'], message['from_app'], message['sender_screen_name'])
-        message['language'] = 'en'
+    message['language'] = sender_context.language or 'en'
 
 
 def get_receiver_language(user_id, from_app):
     """
     Set the language for the receiver of the tip
     """
-    get_language_call = ("SELECT language_code FROM languages WHERE user_id = %s "
-                         "AND languages.from_app = %s")
-    language_values = [user_id, from_app]
-    language_return = modules.db.get_db_data_new(get_language_call, language_values)
-    try:
-        return language_return[0][0]
-    except Exception as e:
-        logger.info("{}: There was no language entry for the receiver, setting default".format(datetime.now()))
-        return 'en'
+    return modules.users.get(user_id, from_app).language or 'en'
 
 
 def check_mute(user_id, from_app):
     """
     Check to see if the bot is muted by the message receiver
     """
-    get_mute_call = ("SELECT mute FROM users WHERE user_id = %s "
-                     "AND from_app = %s")
-    mute_values = [user_id, from_app]
-    mute_return = modules.db.get_db_data_new(get_mute_call, mute_values)
-
-    try:
-        return False if mute_return[0][0] == 0 else True
-    except Exception as e:
-        logger.info("{}: No mute value found - returning False".format(datetime.now()))
-        return False
+    return modules.users.get(user_id, from_app).mute == 1
 
 
 def send_dm(receiver, message, from_app):
     """
-    Send the provided message to the provided receiver
+    Queue the provided message for the provided receiver, the outbox workers deliver it
     """
     if receiver == BOT_ID_TWITTER:
         logger.info("{}: Bot should not be messaging itself.".format(datetime.now()))
@@ -135,6 +114,13 @@ def send_dm(receiver, message, from_app):
         logger.info("{}: User has muted bot.".format(datetime.now()))
         return
 
+    modules.outbox.add(from_app, modules.outbox.DM, receiver, message)
+
+
+def post_dm(receiver, message, from_app):
+    """
+    Send the provided message to the provided receiver right away and return the API response.
+    """
     if from_app == 'twitter':
         data = {
             'event': {
@@ -148,17 +134,16 @@ def send_dm(receiver, message, from_app):
             }
         }
 
-        r = twitterAPI.request('direct_messages/events/new', json.dumps(data))
+        r = modules.http.post('{}/direct_messages/events/new.json'.format(TWITTER_API_URL), data=json.dumps(data),
+                              headers={'Content-Type': 'application/json'}, auth=twitter_auth)
 
         if r.status_code != 200:
             logger.info('Send DM - Twitter ERROR: {} : {}'.format(r.status_code, r.text))
+        return r
 
     elif from_app == 'telegram':
-        try:
-            telegram_bot.sendMessage(chat_id=receiver, text=message)
-        except Exception as e:
-            logger.info("{}: Send DM - Telegram ERROR: {}".format(datetime.now(), e))
-            pass
+        return telegram_call('sendMessage', chat_id=receiver, text=message)
+
 
 def set_message_info(status, message):
     """
@@ -182,52 +167,40 @@ def set_message_info(status, message):
 
         if status.get('truncated') is False:
             dm_text = status.get('text')
+            entities = status.get('entities', {})
         else:
             dm_text = status.get('extended_tweet', {}).get('full_text')
+            entities = status.get('extended_tweet', {}).get('entities', status.get('entities', {}))
+        message['mentions'] = get_payload_mentions(entities)
 
-        dm_text = dm_text.replace('\n', ' ')
-        dm_text = dm_text.lower()
-
-        message['text'] = dm_text.split(" ")
+        message['text'] = modules.tip_parser.tokenize(dm_text)
         modules.social.get_language(message)
 
     return message
 
 
-def check_message_action(message):
+def get_payload_mentions(entities):
     """
-    Check to see if there are any key action values mentioned in the tweet.
+    Map the lowercase screen names mentioned in a tweet to (id, screen_name), from the entities of the payload.
     """
-    if message['from_app'] == 'telegram':
-        try:
-            check_for_ntb = message['text'].index("{}".format(BOT_NAME_TELEGRAM.lower()))
-        except ValueError:
-            message['action'] = None
-            return message
-    try:
-        message['action_index'] = None
-
-        tip_commands = modules.translations.coin_tip_commands[message['language']]
-        if message['language'] != 'en':
-            english_commands = modules.translations.coin_tip_commands['en']
-            for command in english_commands:
-                tip_commands.append(command)
+    mentions = {}
+    for user_mention in entities.get('user_mentions', []):
+        if user_mention.get('screen_name') and user_mention.get('id') is not None:
+            mentions[user_mention['screen_name'].lower()] = (user_mention['id'], user_mention['screen_name'])
+    return mentions
 
-        logger.info("tip commands: {}".format(tip_commands))
-
-        for command in tip_commands:
-            if command in message['text']:
-                message['action_index'] = message['text'].index(command)
-        if message['action_index'] is None:
-            message['action'] = None
-            return message
 
-    except ValueError:
+def check_message_action(message):
+    """
+    Parse the tip out of the message.  The TipIntent is kept in message['tip_intent'] for the next steps.
+    """
+    if message['from_app'] == 'telegram' and BOT_NAME_TELEGRAM.lower() not in message['text']:
         message['action'] = None
         return message
 
-    message['action'] = message['text'][message['action_index']].lower()
-    message['starting_point'] = message['action_index'] + 1
+    message['tip_intent'] = modules.tip_parser.parse(message['text'], message['language'],
+                                                     message.get('sender_screen_name'))
+    message['action'] = message['tip_intent'].command
 
     return message
 
@@ -236,28 +209,28 @@ def validate_tip_amount(message):
     """
     Validate the tweet includes an amount to tip, and if that tip amount is greater than the minimum tip amount.
     """
-    # Set tip commands
-    tip_commands = modules.translations.coin_tip_commands[message['language']]
-    if message['language'] != 'en':
-        english_commands = modules.translations.coin_tip_commands['en']
-        for command in english_commands:
-            logger.info("commad: {}".format(command))
-            tip_commands.append(command)
-
     logger.info("{}: in validate_tip_amount".format(datetime.now()))
+    tip_intent = message['tip_intent']
+    if tip_intent.error == modules.tip_parser.NO_AMOUNT:
+        logger.info("{}: No tip amount". format(datetime.now()))
+        message['tip_amount'] = -1
+        return message
+
     try:
-        if not message['text'][message['starting_point']][0].isdigit() and message['text'][message['starting_point']][0] != '.':
-            symbol = message['text'][message['starting_point']][0]
-            fiat_amount = message['text'][message['starting_point']][1:]
-            message['tip_amount'] = Decimal(modules.currency.get_fiat_conversion(symbol, fiat_amount))
+        if tip_intent.error is not None:
+            raise ValueError(tip_intent.error)
+        if tip_intent.fiat_symbol is not None:
+            message['tip_amount'] = Decimal(modules.currency.get_fiat_conversion(tip_intent.fiat_symbol,
+                                                                                 tip_intent.fiat_amount))
 
             if message['tip_amount'] == -1:
                 send_reply(message, translations.unsupported_fiat[message['language']])
                 return message
         else:
-            message['tip_amount'] = Decimal(message['text'][message['starting_point']])
-    except IndexError as e:
-        logger.info("{}: Index out of range". format(datetime.now()))
+            message['tip_amount'] = tip_intent.amount
+    except modules.prices.PriceUnavailable:
+        logger.info("{}: No recent price for a fiat tip".format(datetime.now()))
+        send_reply(message, translations.price_unavailable[message['language']].format(CURRENCY_SYMBOL))
         message['tip_amount'] = -1
         return message
     except Exception:
@@ -266,7 +239,8 @@ def validate_tip_amount(message):
             bot_name = BOT_NAME_TWITTER
         else:
             bot_name = BOT_NAME_TELEGRAM
-        send_reply(message, translations.not_a_number_text[message['language']].format(bot_name, tip_commands[0]))
+        send_reply(message, translations.not_a_number_text[message['language']].format(
+            bot_name, modules.commands.tip_command(message['language'])))
 
         message['tip_amount'] = -1
         return message
@@ -305,18 +279,6 @@ def validate_tip_amount(message):
     return message
 
 
-def check_invalid_chars(user):
-    """
-    Check user for invalid ending characters
-    """
-    invalid_ending_chars = ['.', '!', '?', ',']
-
-    if user[-1:] in invalid_ending_chars:
-        return user[:-1]
-
-    return user
-
-
 def set_tip_list(message, users_to_tip, request_json):
     """
     Loop through the message starting after the tip amount and identify any users that were tagged for a tip.  Add the
@@ -324,134 +286,100 @@ def set_tip_list(message, users_to_tip, request_json):
     """
     logger.info("{}: in set_tip_list.".format(datetime.now()))
 
-    # Identify the first user to string multi tips.  Once a non-user is mentioned, end the user list
-
-    first_user_flag = False
-
     if message['from_app'] == 'twitter':
-        for t_index in range(message['starting_point'] + 1, len(message['text'])):
-            if first_user_flag and len(message['text'][t_index]) > 0 and str(message['text'][t_index][0]) != "@":
-                logger.info("users identified, regular text breaking the loop: {}".format(message['text'][t_index][0]))
-                break
-            if len(message['text'][t_index]) > 0 and (
-                    str(message['text'][t_index][0]) == "@" and str(message['text'][t_index]).lower() != (
-                    "@" + str(message['sender_screen_name']).lower())):
-                if not first_user_flag:
-                    first_user_flag = True
-                message['text'][t_index] = check_invalid_chars(message['text'][t_index])
-                try:
-                    user_info = api.get_user(message['text'][t_index])
-                except tweepy.TweepError as e:
-                    logger.info("{}: The user sent a !tip command with a mistyped user: {}".format(
-                        datetime.now(), message['text'][t_index]))
-                    logger.info("{}: Tip List Tweep error: {}".format(datetime.now(), e))
-                    users_to_tip.clear()
-                    return message, users_to_tip
-
-                receiver_language = get_receiver_language(user_info.id, message['from_app'])
-
-                user_dict = {'receiver_id': user_info.id, 'receiver_screen_name': user_info.screen_name,
-                             'receiver_account': None, 'receiver_register': None,
-                             'receiver_language': receiver_language}
-                users_to_tip.append(user_dict)
-                logger.info("{}: Users_to_tip: {}".format(datetime.now(), users_to_tip))
+        payload_mentions = message.get('mentions', {})
+        # Look up the mentions the payload entities do not describe, all in one go
+        looked_up = modules.identity.get_users(screen_names=[mention for mention in message['tip_intent'].mentions
+                                                             if mention not in payload_mentions])
+        for mention in message['tip_intent'].mentions:
+            if mention in payload_mentions:
+                receiver_id, receiver_screen_name = payload_mentions[mention]
+            elif looked_up.get(mention) is not None:
+                receiver_id, receiver_screen_name = looked_up[mention]['id'], looked_up[mention]['screen_name']
+            else:
+                logger.info("{}: The user sent a !tip command with a mistyped user: {}".format(datetime.now(),
+                                                                                              mention))
+                users_to_tip.clear()
+                return message, users_to_tip
+
+            user_dict = {'receiver_id': receiver_id, 'receiver_screen_name': receiver_screen_name,
+                         'receiver_account': None, 'receiver_register': None,
+                         'receiver_language': None}
+            users_to_tip.append(user_dict)
+            logger.info("{}: Users_to_tip: {}".format(datetime.now(), users_to_tip))
 
     if message['from_app'] == 'telegram':
         logger.info("trying to set tiplist in telegram: {}".format(message))
 
+        members = message.get('chat_members')
+        if members is None:
+            members = get_chat_members(message, request_json)
+
         if 'reply_to_message' in request_json['message']:
             if len(users_to_tip) == 0:
-                check_user_call = ("SELECT member_id, member_name FROM telegram_chat_members "
-                                   "WHERE chat_id = {} and member_id = '{}'".format(message['chat_id'],
-                                                                                    request_json['message']
-                                                                                    ['reply_to_message']['from']['id']))
-
-                user_check_data = modules.db.get_db_data(check_user_call)
-                if user_check_data:
-                    receiver_id = user_check_data[0][0]
-                    receiver_screen_name = user_check_data[0][1]
+                reply_from = request_json['message']['reply_to_message']['from']
+                member = members.get(str(reply_from['id']))
+                if member:
+                    receiver_id, receiver_screen_name = member
 
-                    receiver_language = get_receiver_language(receiver_id, message['from_app'])
                     user_dict = {'receiver_id': receiver_id, 'receiver_screen_name': receiver_screen_name,
                                  'receiver_account': None, 'receiver_register': None,
-                                 'receiver_language': receiver_language}
+                                 'receiver_language': None}
                     users_to_tip.append(user_dict)
                 else:
                     logger.info("User not found in DB: chat ID:{} - member name:{}".
-                                 format(message['chat_id'], request_json['message']['reply_to_message']['from']
-                                                                        ['first_name']))
+                                 format(message['chat_id'], reply_from['first_name']))
                     send_reply(message, translations.missing_user_message[message['language']]
-                               .format(request_json['message']['reply_to_message']['from']['first_name']))
+                               .format(reply_from['first_name']))
                     users_to_tip.clear()
                     return message, users_to_tip
         else:
-            for t_index in range(message['starting_point'] + 1, len(message['text'])):
-                if first_user_flag and len(message['text'][t_index]) > 0 and str(message['text'][t_index][0]) != "@":
-                    logger.info("users identified, regular text breaking the loop: {}".format(message['text'][t_index][0]))
-                    break
-                if len(message['text'][t_index]) > 0:
-                    if (str(message['text'][t_index][0]) == "@" and len(message['text'][t_index]) > 1 and message['text'][t_index][1] != ' ' 
-                            and str(message['text'][t_index]).lower() != ("@" + str(message['sender_screen_name']).lower())):
-                        message['text'][t_index] = check_invalid_chars(message['text'][t_index])
-                        check_user_call = ("SELECT member_id, member_name FROM telegram_chat_members "
-                                           "WHERE chat_id = {} and member_name = '{}'".format(message['chat_id'],
-                                                                                              message['text'][t_index][1:]))
-
-                        user_check_data = modules.db.get_db_data(check_user_call)
-                        if user_check_data:
-                            receiver_id = user_check_data[0][0]
-                            receiver_screen_name = user_check_data[0][1]
-                            duplicate_user = False
-
-                            for u_index in range(0, len(users_to_tip)):
-                                if users_to_tip[u_index]['receiver_id'] == receiver_id:
-                                    duplicate_user = True
-
-                            if not duplicate_user:
-                                if not first_user_flag:
-                                    first_user_flag = True
-                                logger.info("User tipped via searching the string for mentions")
-                                receiver_language = get_receiver_language(receiver_id, message['from_app'])
-                                user_dict = {'receiver_id': receiver_id, 'receiver_screen_name': receiver_screen_name,
-                                             'receiver_account': None, 'receiver_register': None,
-                                             'receiver_language': receiver_language}
-                                users_to_tip.append(user_dict)
-                        else:
-                            logger.info("User not found in DB: chat ID:{} - member name:{}".
-                                         format(message['chat_id'], message['text'][t_index][1:]))
-                            send_reply(message, translations.missing_user_message[message['language']]
-                                       .format(message['text'][t_index]))
-                            users_to_tip.clear()
-                            return message, users_to_tip
-            try:
-                text_mentions = request_json['message']['entities']
-                for mention in text_mentions:
-                    if mention['type'] == 'text_mention':
-                        check_user_call = ("SELECT member_id, member_name FROM telegram_chat_members "
-                                           "WHERE chat_id = {} and member_id = '{}'".format(message['chat_id'],
-                                                                                            mention['user']['id']))
-
-                        user_check_data = modules.db.get_db_data(check_user_call)
-                        if user_check_data:
-                            receiver_id = user_check_data[0][0]
-                            receiver_screen_name = user_check_data[0][1]
-                            logger.info("telegram user added via mention list.")
-                            logger.info("mention: {}".format(mention))
-                            receiver_language = get_receiver_language(receiver_id, message['from_app'])
-
-                            user_dict = {'receiver_id': receiver_id, 'receiver_screen_name': receiver_screen_name,
-                                         'receiver_account': None, 'receiver_register': None,
-                                         'receiver_language': receiver_language}
-                            users_to_tip.append(user_dict)
-                        else:
-                            logger.info("User not found in DB: chat ID:{} - member name:{}".
-                                         format(message['chat_id'], mention['user']['first_name']))
-                            send_reply(message, translations.missing_user_message[message['language']]
-                                       .format(mention['user']['first_name']))
-                            users_to_tip.clear()
-                            return message, users_to_tip
-            except:
-                pass
+            for mention in message['tip_intent'].mentions:
+                member = members.get(mention)
+                if member:
+                    receiver_id, receiver_screen_name = member
+                    duplicate_user = False
+
+                    for u_index in range(0, len(users_to_tip)):
+                        if users_to_tip[u_index]['receiver_id'] == receiver_id:
+                            duplicate_user = True
+
+                    if not duplicate_user:
+                        logger.info("User tipped via searching the string for mentions")
+                        user_dict = {'receiver_id': receiver_id, 'receiver_screen_name': receiver_screen_name,
+                                     'receiver_account': None, 'receiver_register': None,
+                                     'receiver_language': None}
+                        users_to_tip.append(user_dict)
+                else:
+                    logger.info("User not found in DB: chat ID:{} - member name:{}".
+                                 format(message['chat_id'], mention))
+                    send_reply(message, translations.missing_user_message[message['language']]
+                               .format('@' + mention))
+                    users_to_tip.clear()
+                    return message, users_to_tip
+            for mention in request_json['message'].get('entities', []):
+                if mention.get('type') == 'text_mention':
+                    member = members.get(str(mention['user']['id']))
+                    if member:
+                        receiver_id, receiver_screen_name = member
+                        logger.info("telegram user added via mention list.")
+                        logger.info("mention: {}".format(mention))
+                        user_dict = {'receiver_id': receiver_id, 'receiver_screen_name': receiver_screen_name,
+                                     'receiver_account': None, 'receiver_register': None,
+                                     'receiver_language': None}
+                        users_to_tip.append(user_dict)
+                    else:
+                        logger.info("User not found in DB: chat ID:{} - member name:{}".
+                                     format(message['chat_id'], mention['user']['first_name']))
+                        send_reply(message, translations.missing_user_message[message['language']]
+                                   .format(mention['user']['first_name']))
+                        users_to_tip.clear()
+                        return message, users_to_tip
+
+    # Load every receiver with a single query, the tip reuses their context
+    receiver_contexts = modules.users.load_many([user['receiver_id'] for user in users_to_tip], message['from_app'])
+    for user in users_to_tip:
+        user['receiver_language'] = receiver_contexts[str(user['receiver_id'])].language or 'en'
 
     logger.info("{}: Users_to_tip: {}".format(datetime.now(), users_to_tip))
     message['total_tip_amount'] = message['tip_amount']
@@ -468,24 +396,18 @@ def validate_sender(message):
     logger.info("{}: validating sender".format(datetime.now()))
     logger.info("sender id: {}".format(message['sender_id']))
     logger.info("from_app: {}".format(message['from_app']))
-    db_call = "SELECT account, register FROM users where user_id = {} AND users.from_app = '{}'".format(message['sender_id'],
-                                                                                                      message['from_app'])
-    sender_account_info = modules.db.get_db_data(db_call)
+    sender_context = modules.users.for_sender(message)
 
-    if not sender_account_info:
+    if not sender_context.exists:
         send_reply(message, translations.no_account_text[message['language']])
 
         logger.info("{}: User tried to send a tip without an account.".format(datetime.now()))
         message['sender_account'] = None
         return message
 
-    message['sender_account'] = sender_account_info[0][0]
-    message['sender_register'] = sender_account_info[0][1]
-
-    if message['sender_register'] != 1:
-        db_call = "UPDATE users SET register = 1 WHERE user_id = %s AND users.from_app = %s"
-        db_values = [message['sender_id'], message['from_app']]
-        modules.db.set_db_data(db_call, db_values)
+    message['sender_account'] = sender_context.account
+    message['sender_register'] = sender_context.register
+    modules.users.mark_registered(sender_context)
 
     message['sender_balance_raw'] = rpc.get_account_balance(message['sender_account'])
     message['sender_balance'] = message['sender_balance_raw']['balance']
@@ -511,47 +433,61 @@ def validate_total_tip_amount(message):
 
 
 def send_reply(message, text):
+    """
+    Queue a reply to the message, the outbox workers deliver it
+    """
     if check_mute(message['sender_id'], message['from_app']):
         logger.info("{}: User has muted bot.".format(datetime.now()))
         return
     
     if message['from_app'] == 'twitter':
         text = '@{} '.format(message['sender_screen_name']) + text
-        try:
-            api.update_status(text, message['id'])
-        except tweepy.TweepError as e:
-            logger.info("{}: Send Reply Tweepy Error: {}".format(datetime.now(), e))
+        modules.outbox.add('twitter', modules.outbox.REPLY, message['sender_id'], text, message['id'])
 
     elif message['from_app'] == 'telegram':
-        try:
-            telegram_bot.sendMessage(chat_id=message['chat_id'], reply_to_message_id=message['id'], text=text)
-        except Exception as e:
-            logger.info("{}: Send reply telegram error3 {}".format(datetime.now(), e))
+        modules.outbox.add('telegram', modules.outbox.REPLY, message['chat_id'], text, message['id'])
+
+
+def post_reply(receiver, reply_to, text, from_app):
+    """
+    Send a reply right away and return the API response.
+    """
+    if from_app == 'twitter':
+        r = modules.http.post('{}/statuses/update.json'.format(TWITTER_API_URL),
+                              data={'status': text, 'in_reply_to_status_id': reply_to}, auth=twitter_auth)
+        if r.status_code != 200:
+            logger.info("{}: Send Reply Twitter Error: {} : {}".format(datetime.now(), r.status_code, r.text))
+        return r
+
+    elif from_app == 'telegram':
+        return telegram_call('sendMessage', chat_id=receiver, reply_to_message_id=reply_to, text=text)
+
+
+def telegram_call(method, **params):
+    """
+    Call a method of the Telegram Bot API.
+    """
+    r = modules.http.post('{}/{}'.format(TELEGRAM_API_URL, method), json=params)
+    if r.status_code != 200:
+        logger.info("{}: Telegram {} ERROR: {} : {}".format(datetime.now(), method, r.status_code, r.text))
+    return r
+
 
 def check_telegram_member(chat_id, chat_name, member_id, member_name):
-    check_user_call = ("SELECT member_id, member_name FROM telegram_chat_members "
-                       "WHERE chat_id = {} and member_id = {}".format(chat_id,
-                                                                      member_id))
-    user_check_data = modules.db.get_db_data(check_user_call)
-
-    if not user_check_data:
-        logger.info("{}: User {}-{} not found in DB, inserting".format(datetime.now(), chat_id, member_name))
-        new_chat_member_call = ("INSERT INTO telegram_chat_members (chat_id, chat_name, member_id, member_name) "
-                                "VALUES (%s, %s, %s, %s)")
-        new_chat_member_values = [chat_id, chat_name, member_id, member_name]
-        modules.db.set_db_data(new_chat_member_call, new_chat_member_values)
-
-    elif user_check_data[0][1] != member_name:
-        logger.info("Member ID {} name incorrect in DB.  Stored value: {}  Updating to {}"
-                     .format(member_id, user_check_data[0][1], member_name))
-
-        update_name_call = ("UPDATE telegram_chat_members "
-                            "SET member_name = %s "
-                            "WHERE member_id = %s")
-        update_name_values = [member_name, member_id]
-        modules.db.set_db_data(update_name_call, update_name_values)
-
-    return
+    modules.chat_members.seen(chat_id, chat_name, member_id, member_name)
+
+
+def get_chat_members(message, request_json):
+    """
+    Resolve every member a Telegram group tip can go to, the mentioned usernames, the author of the replied message
+    and the text mentions, with the membership index.
+    """
+    member_ids = [mention['user']['id'] for mention in request_json['message'].get('entities', [])
+                  if mention.get('type') == 'text_mention']
+    if 'reply_to_message' in request_json['message']:
+        member_ids.append(request_json['message']['reply_to_message']['from']['id'])
+    return modules.chat_members.resolve(message['chat_id'], message['tip_intent'].mentions, member_ids)
+
 
 def send_account_message(account_text, message, account):
     """
@@ -569,7 +505,7 @@ def send_account_message(account_text, message, account):
 
 def telegram_set_webhook():
     try:
-        response = telegram_bot.setWebhook('{}/{}'.format(BASE_URL, TELEGRAM_URI))
+        response = telegram_call('setWebhook', url='{}/{}'.format(BASE_URL, TELEGRAM_URI)).json()['ok']
         if response:
             return "Webhook setup successfully"
         else:
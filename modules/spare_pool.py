@@ -0,0 +1,164 @@
+import configparser
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+from logging.handlers import TimedRotatingFileHandler
+
+import modules.db
+import modules.rpc as rpc
+
+# Set logging info
+logger = logging.getLogger("spare_pool_log")
+logger.setLevel(logging.INFO)
+handler = TimedRotatingFileHandler('{}/logs/{:%Y-%m-%d}-spare-pool.log'.format(os.getcwd(), datetime.now()),
+                                   when="d",
+                                   interval=1,
+                                   backupCount=5)
+logger.addHandler(handler)
+
+# Read config and parse constants
+config = configparser.ConfigParser()
+config.read('{}/webhookconfig.ini'.format(os.getcwd()))
+
+# Pool watermarks: refill once the pool drops below LOW, up to HIGH
+SPARE_POOL_LOW = config.getint('main', 'spare_pool_low', fallback=20)
+SPARE_POOL_HIGH = config.getint('main', 'spare_pool_high', fallback=100)
+SPARE_POOL_BATCH = config.getint('main', 'spare_pool_batch', fallback=50)
+SPARE_POOL_INTERVAL = config.getint('main', 'spare_pool_interval', fallback=30)
+
+REFILL_LOCK = 'spare_pool_refill'
+
+stats = {
+    'claimed': 0,
+    'claim_fallbacks': 0,
+    'generated': 0,
+    'last_refill_count': 0,
+    'last_refill_seconds': 0,
+    'last_refill_rate': 0,
+    'last_refill_at': None,
+}
+
+_thread = None
+
+
+def get_depth():
+    """
+    Number of unclaimed accounts waiting in the pool.
+    """
+    depth_call = "SELECT count(*) FROM spare_accounts"
+    return int(modules.db.get_db_data(depth_call)[0][0])
+
+
+def get_stats():
+    """
+    Pool depth from the DB, plus the refill and claim counters of this process.
+    """
+    pool_stats = dict(stats)
+    pool_stats['depth'] = get_depth()
+    pool_stats['low'] = SPARE_POOL_LOW
+    pool_stats['high'] = SPARE_POOL_HIGH
+    return pool_stats
+
+
+def claim():
+    """
+    Atomically remove one account from the pool and return it.  If the pool is empty, generate one on the spot.
+    """
+    claim_call = "DELETE FROM spare_accounts LIMIT 1 RETURNING account, address"
+    with modules.db.connection() as db:
+        db_cursor = db.cursor()
+        db_cursor.execute(claim_call)
+        claimed = db_cursor.fetchall()
+        db_cursor.close()
+
+    if claimed:
+        stats['claimed'] += 1
+        return {
+            "account": claimed[0][0],
+            "address": claimed[0][1],
+        }
+
+    logger.info("{}: Spare account pool is empty, generating an account synchronously".format(datetime.now()))
+    stats['claim_fallbacks'] += 1
+    return rpc.generate_new_account()
+
+
+def add_accounts(accounts):
+    """
+    Insert a list of generated accounts into the pool in a single statement.
+    """
+    insert_call = "INSERT INTO spare_accounts (account, address) VALUES (%s, %s)"
+    insert_values = [(account["account"], account["address"]) for account in accounts]
+    with modules.db.connection() as db:
+        db_cursor = db.cursor()
+        db_cursor.executemany(insert_call, insert_values)
+        db_cursor.close()
+
+
+def refill():
+    """
+    Top the pool up to SPARE_POOL_HIGH if it has dropped below SPARE_POOL_LOW.  Only one process refills at a time.
+    """
+    with modules.db.connection() as db:
+        db_cursor = db.cursor()
+        db_cursor.execute("SELECT GET_LOCK(%s, 0)", [REFILL_LOCK])
+        locked = db_cursor.fetchall()[0][0] == 1
+        if not locked:
+            db_cursor.close()
+            return 0
+        try:
+            db_cursor.execute("SELECT count(*) FROM spare_accounts")
+            depth = int(db_cursor.fetchall()[0][0])
+            if depth >= SPARE_POOL_LOW:
+                return 0
+
+            missing = SPARE_POOL_HIGH - depth
+            start = time.monotonic()
+            generated = 0
+            while generated < missing:
+                requested = min(SPARE_POOL_BATCH, missing - generated)
+                accounts = rpc.generate_new_accounts(requested)
+                if accounts:
+                    add_accounts(accounts)
+                    generated += len(accounts)
+                if len(accounts) < requested:
+                    # The wallet refused part of the batch (keypool exhausted, wallet locked...), try again next run
+                    logger.info("{}: Wallet generated {} of {} accounts, stopping the refill"
+                                .format(datetime.now(), len(accounts), requested))
+                    break
+            elapsed = time.monotonic() - start
+
+            stats['generated'] += generated
+            stats['last_refill_count'] = generated
+            stats['last_refill_seconds'] = round(elapsed, 3)
+            stats['last_refill_rate'] = round(generated / elapsed, 2) if elapsed > 0 else generated
+            stats['last_refill_at'] = datetime.now().isoformat()
+            logger.info("{}: Spare pool refilled from {} to {} accounts in {:.2f}s ({} accounts/s)"
+                        .format(datetime.now(), depth, depth + generated, elapsed, stats['last_refill_rate']))
+            return generated
+        finally:
+            db_cursor.execute("SELECT RELEASE_LOCK(%s)", [REFILL_LOCK])
+            db_cursor.fetchall()
+            db_cursor.close()
+
+
+def run_forever():
+    while True:
+        try:
+            refill()
+        except Exception as e:
+            logger.info("{}: Error refilling spare pool: {}".format(datetime.now(), e))
+        time.sleep(SPARE_POOL_INTERVAL)
+
+
+def start():
+    """
+    Start the background replenisher for this process.
+    """
+    global _thread
+    if _thread is not None and _thread.is_alive():
+        return
+    _thread = threading.Thread(target=run_forever, name='spare-pool', daemon=True)
+    _thread.start()
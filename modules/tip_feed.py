@@ -0,0 +1,48 @@
+from decimal import Decimal
+
+import modules.db
+import modules.users
+
+# Tips are copied to tip_feed when they are recorded, with the names and addresses the dashboard shows, so the recent
+# tips are read from the (timestamp, id) index without joining users.
+FEED_INSERT = ("INSERT INTO tip_feed (tip_id, from_app, sender_id, sender_name, sender_address, receiver_id, "
+               "receiver_name, receiver_address, amount) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)")
+
+FEED_BACKFILL = ("INSERT INTO tip_feed (tip_id, from_app, sender_id, sender_name, sender_address, receiver_id, "
+                 "receiver_name, receiver_address, amount, timestamp) "
+                 "SELECT t.tx_id, t.from_app, t.sender_id, s.user_name, s.address, t.receiver_id, r.user_name, "
+                 "r.address, t.amount, t.timestamp FROM tip_list AS t "
+                 "LEFT JOIN users AS s ON s.user_id = t.sender_id AND s.from_app = t.from_app "
+                 "LEFT JOIN users AS r ON r.user_id = t.receiver_id AND r.from_app = t.from_app "
+                 "WHERE t.processed = 2 AND t.from_app IS NOT NULL AND t.timestamp IS NOT NULL "
+                 "ORDER BY t.timestamp, t.dm_id")
+
+FEED_PAGE_SIZE = 50
+
+
+def get_statement(message, users_to_tip, t_index):
+    """
+    (sql, values) adding a tip to the feed, to run in the transaction inserting it with TIP_LIST_INSERT.
+    """
+    receiver = users_to_tip[t_index]
+    sender_context = modules.users.for_sender(message)
+    receiver_context = modules.users.get(receiver['receiver_id'], message['from_app'])
+    return (FEED_INSERT, [message['tip_id'], message['from_app'], message['sender_id'],
+                          message.get('sender_screen_name'), sender_context.address, receiver['receiver_id'],
+                          receiver['receiver_screen_name'], receiver_context.address,
+                          Decimal(message['tip_amount'])])
+
+
+def get_page(before_ts=None, before_id=None, limit=FEED_PAGE_SIZE):
+    """
+    Tips older than (before_ts, before_id), newest first, as (sender_name, receiver_name, amount, sender_address,
+    receiver_address, from_app, timestamp, id).  The last row of a page is the cursor of the next one.
+    """
+    columns = ("SELECT sender_name, receiver_name, amount, sender_address, receiver_address, from_app, timestamp, id "
+               "FROM tip_feed ")
+    if before_ts is None or before_id is None:
+        feed_call = columns + "ORDER BY timestamp DESC, id DESC LIMIT %s"
+        return modules.db.get_db_data_new(feed_call, [limit])
+    feed_call = (columns + "WHERE timestamp < %s OR (timestamp = %s AND id < %s) "
+                           "ORDER BY timestamp DESC, id DESC LIMIT %s")
+    return modules.db.get_db_data_new(feed_call, [before_ts, before_ts, before_id, limit])
@@ -0,0 +1,70 @@
+from collections import namedtuple
+from decimal import Decimal, InvalidOperation
+
+import modules.commands
+
+# Error codes of a TipIntent
+NO_COMMAND = 'no_command'
+NO_AMOUNT = 'no_amount'
+NOT_A_NUMBER = 'not_a_number'
+
+TRAILING_PUNCTUATION = '.!?,;:'
+
+# command:      the tip command as typed, None if the text has none
+# amount:       Decimal amount of crypto, None for fiat tips
+# fiat_symbol:  currency symbol of a fiat tip, e.g. '$'
+# fiat_amount:  Decimal amount of fiat
+# mentions:     tuple of the mentioned screen names without '@', in order and without duplicates
+# error:        one of the error codes above, None if the tip is well formed
+TipIntent = namedtuple('TipIntent', ['command', 'amount', 'fiat_symbol', 'fiat_amount', 'mentions', 'error'])
+
+
+def tokenize(text):
+    """
+    Split a message into lowercase tokens, with full-width exclamation marks folded to '!'.
+    """
+    return text.replace('！', '!').lower().split()
+
+
+def parse_amount(token):
+    """
+    Parse the token following the command into (amount, fiat_symbol, fiat_amount, error).
+    """
+    token = token.rstrip(TRAILING_PUNCTUATION) if len(token) > 1 else token
+    try:
+        if token[0].isdigit() or token[0] == '.':
+            return Decimal(token), None, None, None
+        return None, token[0], Decimal(token[1:]), None
+    except InvalidOperation:
+        return None, None, None, NOT_A_NUMBER
+
+
+def parse(text, language, sender_screen_name=None):
+    """
+    Walk the tokens of a tweet or chat message once and extract the tip it asks for.  The mention list starts with the
+    first mention after the amount and ends at the first word that is not a mention.  The sender is never a mention.
+    text can be a string or a list of tokens from tokenize.
+    """
+    tokens = tokenize(text) if isinstance(text, str) else text
+    sender = sender_screen_name.lower() if sender_screen_name else None
+    tip_tokens = modules.commands.tip_tokens(language)
+
+    if tip_tokens.isdisjoint(tokens):
+        return TipIntent(None, None, None, None, (), NO_COMMAND)
+    for position, command in enumerate(tokens):
+        if command in tip_tokens:
+            break
+    if position + 1 == len(tokens):
+        return TipIntent(command, None, None, None, (), NO_AMOUNT)
+
+    mentions = []
+    for token in tokens[position + 2:]:
+        if token[0] == '@':
+            mention = token[1:].rstrip(TRAILING_PUNCTUATION)
+            if mention and mention != sender and mention not in mentions:
+                mentions.append(mention)
+        elif mentions:
+            break
+
+    amount, fiat_symbol, fiat_amount, error = parse_amount(tokens[position + 1])
+    return TipIntent(command, amount, fiat_symbol, fiat_amount, tuple(mentions), error)
@@ -0,0 +1,125 @@
+import logging
+import os
+from datetime import datetime
+from logging.handlers import TimedRotatingFileHandler
+
+import modules.db
+
+# Set logging info
+logger = logging.getLogger("tip_stats_log")
+logger.setLevel(logging.INFO)
+handler = TimedRotatingFileHandler('{}/logs/{:%Y-%m-%d}-tip_stats.log'.format(os.getcwd(), datetime.now()),
+                                   when="d",
+                                   interval=1,
+                                   backupCount=5)
+logger.addHandler(handler)
+
+# Rollups updated with every tip_list insert.  The largest tip columns are assigned before largest_amount, as MySQL
+# evaluates the assignments in order.
+TIP_TOTALS_UPSERT = ("INSERT INTO tip_totals (from_app, total_amount, tip_count, largest_amount, largest_sender_id, "
+                     "largest_ts) VALUES (%s, %s, 1, %s, %s, now()) "
+                     "ON DUPLICATE KEY UPDATE "
+                     "largest_sender_id = IF(VALUES(largest_amount) >= largest_amount, VALUES(largest_sender_id), "
+                     "largest_sender_id), "
+                     "largest_ts = IF(VALUES(largest_amount) >= largest_amount, VALUES(largest_ts), largest_ts), "
+                     "largest_amount = GREATEST(largest_amount, VALUES(largest_amount)), "
+                     "total_amount = total_amount + VALUES(total_amount), "
+                     "tip_count = tip_count + 1")
+
+TIPPER_TOTALS_UPSERT = ("INSERT INTO tipper_totals (sender_id, from_app, total_amount, tip_count) "
+                        "VALUES (%s, %s, %s, 1) "
+                        "ON DUPLICATE KEY UPDATE total_amount = total_amount + VALUES(total_amount), "
+                        "tip_count = tip_count + 1")
+
+TIP_BUCKETS_UPSERT = ("INSERT INTO tip_buckets (bucket, bucket_start, from_app, total_amount, tip_count) "
+                      "VALUES ('hour', DATE_FORMAT(now(), '%%Y-%%m-%%d %%H:00:00'), %s, %s, 1), "
+                      "('day', CURDATE(), %s, %s, 1) "
+                      "ON DUPLICATE KEY UPDATE total_amount = total_amount + VALUES(total_amount), "
+                      "tip_count = tip_count + 1")
+
+# Recompute every rollup from tip_list.  Run in a single transaction, tips recorded meanwhile wait for it.
+REBUILD_STATEMENTS = [
+    "DELETE FROM tip_totals",
+    "INSERT INTO tip_totals (from_app, total_amount, tip_count, largest_amount, largest_sender_id, largest_ts) "
+    "SELECT t.from_app, SUM(t.amount), COUNT(*), MAX(t.amount), "
+    "(SELECT l.sender_id FROM tip_list AS l WHERE l.processed = 2 AND l.from_app = t.from_app "
+    "ORDER BY l.amount DESC, l.timestamp DESC LIMIT 1), "
+    "(SELECT l.timestamp FROM tip_list AS l WHERE l.processed = 2 AND l.from_app = t.from_app "
+    "ORDER BY l.amount DESC, l.timestamp DESC LIMIT 1) "
+    "FROM tip_list AS t WHERE t.processed = 2 AND t.from_app IS NOT NULL GROUP BY t.from_app",
+    "DELETE FROM tipper_totals",
+    "INSERT INTO tipper_totals (sender_id, from_app, total_amount, tip_count) "
+    "SELECT sender_id, from_app, SUM(amount), COUNT(*) FROM tip_list "
+    "WHERE processed = 2 AND from_app IS NOT NULL GROUP BY sender_id, from_app",
+    "DELETE FROM tip_buckets",
+    "INSERT INTO tip_buckets (bucket, bucket_start, from_app, total_amount, tip_count) "
+    "SELECT 'hour', DATE_FORMAT(timestamp, '%Y-%m-%d %H:00:00'), from_app, SUM(amount), COUNT(*) FROM tip_list "
+    "WHERE processed = 2 AND from_app IS NOT NULL AND timestamp IS NOT NULL GROUP BY 2, 3",
+    "INSERT INTO tip_buckets (bucket, bucket_start, from_app, total_amount, tip_count) "
+    "SELECT 'day', DATE(timestamp), from_app, SUM(amount), COUNT(*) FROM tip_list "
+    "WHERE processed = 2 AND from_app IS NOT NULL AND timestamp IS NOT NULL GROUP BY 2, 3",
+]
+
+
+def get_statements(tip_list_values):
+    """
+    (sql, values) pairs updating the rollups for a tip, to run in the transaction inserting it with TIP_LIST_INSERT.
+    """
+    sender_id, from_app, amount = tip_list_values[2], tip_list_values[4], tip_list_values[6]
+    return [
+        (TIP_TOTALS_UPSERT, [from_app, amount, amount, sender_id]),
+        (TIPPER_TOTALS_UPSERT, [sender_id, from_app, amount]),
+        (TIP_BUCKETS_UPSERT, [from_app, amount, from_app, amount]),
+    ]
+
+
+def rebuild():
+    """
+    Backfill the rollups from tip_list.
+    """
+    with modules.db.transaction() as db_cursor:
+        for statement in REBUILD_STATEMENTS:
+            db_cursor.execute(statement)
+    logger.info("{}: Rebuilt the tip statistics".format(datetime.now()))
+
+
+def get_platform_totals():
+    """
+    (from_app, total_amount, tip_count) per platform, largest total first.
+    """
+    totals_call = "SELECT from_app, total_amount, tip_count FROM tip_totals ORDER BY total_amount DESC"
+    return modules.db.get_db_data(totals_call)
+
+
+def get_top_tippers(limit=50):
+    """
+    (screen_name, total_tips, address, from_app) of the senders who tipped the most.
+    """
+    tippers_call = ("SELECT users.user_name, tipper_totals.total_amount, users.address, tipper_totals.from_app "
+                    "FROM tipper_totals JOIN users ON users.user_id = tipper_totals.sender_id "
+                    "AND users.from_app = tipper_totals.from_app "
+                    "WHERE users.user_name IS NOT NULL "
+                    "ORDER BY tipper_totals.total_amount DESC LIMIT %s")
+    return modules.db.get_db_data_new(tippers_call, [limit])
+
+
+def get_largest_tip():
+    """
+    (user_name, amount, address, from_app, timestamp) of the largest tip, the latest one if several are as large.
+    """
+    largest_call = ("SELECT users.user_name, tip_totals.largest_amount, users.address, tip_totals.from_app, "
+                    "tip_totals.largest_ts "
+                    "FROM tip_totals JOIN users ON users.user_id = tip_totals.largest_sender_id "
+                    "AND users.from_app = tip_totals.from_app "
+                    "WHERE users.user_name IS NOT NULL "
+                    "ORDER BY tip_totals.largest_amount DESC, tip_totals.largest_ts DESC LIMIT 1")
+    return modules.db.get_db_data(largest_call)
+
+
+def get_buckets(bucket, since):
+    """
+    (bucket_start, from_app, total_amount, tip_count) of the 'hour' or 'day' buckets starting at or after since.
+    """
+    buckets_call = ("SELECT bucket_start, from_app, total_amount, tip_count FROM tip_buckets "
+                    "WHERE bucket = %s AND bucket_start >= %s ORDER BY bucket_start, from_app")
+    return modules.db.get_db_data_new(buckets_call, [bucket, since])
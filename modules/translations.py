@@ -1152,6 +1152,28 @@ withdraw_text = {
           'برداشت کرده‌اید. می توانید تراکنش را در اینجا چک نمائید:\n'
           '{2}tx.dws?{3}.html'
 }
+withdraw_failed_text = {
+    'en': 'There was an error processing your withdrawal.  Your balance has been refunded, please try again later.',
+    'es': 'Hubo un error al procesar tu retiro.  Tu saldo ha sido reembolsado, por favor inténtalo de nuevo más tarde.',
+    'nl': 'Er is een fout opgetreden bij het verwerken van jouw opname.  Je saldo is teruggestort, probeer het later opnieuw.',
+    'ja': 'There was an error processing your withdrawal.  Your balance has been refunded, please try again later.',
+    'zh-t': 'There was an error processing your withdrawal.  Your balance has been refunded, please try again later.',
+    'zh-s': 'There was an error processing your withdrawal.  Your balance has been refunded, please try again later.',
+    'fr': 'Une erreur est survenue lors du traitement de votre retrait.  Votre solde a été remboursé, veuillez réessayer plus tard.',
+    'pt': 'Ocorreu um erro ao processar o teu levantamento.  O teu saldo foi reembolsado, tenta novamente mais tarde.',
+    'th': 'There was an error processing your withdrawal.  Your balance has been refunded, please try again later.',
+    'de': 'Bei der Bearbeitung deiner Auszahlung ist ein Fehler aufgetreten.  Dein Guthaben wurde erstattet, bitte versuche es später erneut.',
+    'id': 'There was an error processing your withdrawal.  Your balance has been refunded, please try again later.',
+    'vt': 'There was an error processing your withdrawal.  Your balance has been refunded, please try again later.',
+    'ru': 'There was an error processing your withdrawal.  Your balance has been refunded, please try again later.',
+    'sv': 'There was an error processing your withdrawal.  Your balance has been refunded, please try again later.',
+    'it': 'Si è verificato un errore durante l\'elaborazione del tuo prelievo.  Il tuo saldo è stato rimborsato, riprova più tardi.',
+    'tr': 'There was an error processing your withdrawal.  Your balance has been refunded, please try again later.',
+    'pt-br': 'Ocorreu um erro ao processar sua retirada.  Seu saldo foi reembolsado, tente novamente mais tarde.',
+    'bg': 'There was an error processing your withdrawal.  Your balance has been refunded, please try again later.',
+    'fa': 'There was an error processing your withdrawal.  Your balance has been refunded, please try again later.'
+}
+
 # 26
 incorrect_withdraw_text = {
     'en': 'I didn\'t understand your withdraw request.  Please resend with !withdraw <optional:amount> <account>.  '
@@ -1605,6 +1627,28 @@ unsupported_fiat = {
     'fa': 'You have either entered an invalid amount or an unsupported fiat symbol.  Please reformat and send again.'
 }
 
+price_unavailable = {
+    'en': 'The exchange rate is not available right now, so fiat tips cannot be sent.  Please tip in {} or try again later.',
+    'es': 'The exchange rate is not available right now, so fiat tips cannot be sent.  Please tip in {} or try again later.',
+    'nl': 'The exchange rate is not available right now, so fiat tips cannot be sent.  Please tip in {} or try again later.',
+    'ja': 'The exchange rate is not available right now, so fiat tips cannot be sent.  Please tip in {} or try again later.',
+    'zh-t': 'The exchange rate is not available right now, so fiat tips cannot be sent.  Please tip in {} or try again later.',
+    'zh-s': 'The exchange rate is not available right now, so fiat tips cannot be sent.  Please tip in {} or try again later.',
+    'fr': 'The exchange rate is not available right now, so fiat tips cannot be sent.  Please tip in {} or try again later.',
+    'pt': 'The exchange rate is not available right now, so fiat tips cannot be sent.  Please tip in {} or try again later.',
+    'th': 'The exchange rate is not available right now, so fiat tips cannot be sent.  Please tip in {} or try again later.',
+    'de': 'The exchange rate is not available right now, so fiat tips cannot be sent.  Please tip in {} or try again later.',
+    'id': 'The exchange rate is not available right now, so fiat tips cannot be sent.  Please tip in {} or try again later.',
+    'vt': 'The exchange rate is not available right now, so fiat tips cannot be sent.  Please tip in {} or try again later.',
+    'ru': 'The exchange rate is not available right now, so fiat tips cannot be sent.  Please tip in {} or try again later.',
+    'sv': 'The exchange rate is not available right now, so fiat tips cannot be sent.  Please tip in {} or try again later.',
+    'it': 'The exchange rate is not available right now, so fiat tips cannot be sent.  Please tip in {} or try again later.',
+    'tr': 'The exchange rate is not available right now, so fiat tips cannot be sent.  Please tip in {} or try again later.',
+    'pt-br': 'The exchange rate is not available right now, so fiat tips cannot be sent.  Please tip in {} or try again later.',
+    'bg': 'The exchange rate is not available right now, so fiat tips cannot be sent.  Please tip in {} or try again later.',
+    'fa': 'The exchange rate is not available right now, so fiat tips cannot be sent.  Please tip in {} or try again later.'
+}
+
 # 41
 mute = {
     'en': 'You have muted the bot.  You will no longer receive messages.  To unmute, send !unmute or /unmute.',
@@ -1672,6 +1716,17 @@ language_list = (
     # 'Vietnamese - Tiếng Việt\n'
 )
 
+deposit_received_text = {
+    'en': 'Your deposit of {0:.8f} {1} has been confirmed and added to your balance.  Send !balance to see your new balance.',
+    'es': 'Tu depósito de {0:.8f} {1} ha sido confirmado y añadido a tu saldo.  Envía !balance para ver tu nuevo saldo.',
+    'nl': 'Je storting van {0:.8f} {1} is bevestigd en toegevoegd aan je saldo.  Stuur !balance om je nieuwe saldo te zien.',
+    'fr': 'Votre dépôt de {0:.8f} {1} a été confirmé et ajouté à votre solde.  Envoyez !balance pour voir votre nouveau solde.',
+    'pt': 'O teu depósito de {0:.8f} {1} foi confirmado e adicionado ao teu saldo.  Envia !balance para veres o teu novo saldo.',
+    'de': 'Deine Einzahlung von {0:.8f} {1} wurde bestätigt und deinem Guthaben gutgeschrieben.  Sende !balance, um dein neues Guthaben zu sehen.',
+    'it': 'Il tuo deposito di {0:.8f} {1} è stato confermato e aggiunto al tuo saldo.  Invia !balance per vedere il tuo nuovo saldo.',
+    'pt-br': 'Seu depósito de {0:.8f} {1} foi confirmado e adicionado ao seu saldo.  Envie !balance para ver seu novo saldo.'
+}
+
 balance_commands = {
     'en': ['!balance', '!bal', '!b', '/balance', '/bal', '/b'],
     'es': [
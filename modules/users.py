@@ -0,0 +1,123 @@
+import threading
+
+import modules.db
+
+USER_CONTEXT_SELECT = ("SELECT users.user_id, users.account, users.address, users.register, users.mute, "
+                       "languages.language_code, donation_info.donation_percent "
+                       "FROM users "
+                       "LEFT JOIN languages ON languages.user_id = users.user_id "
+                       "AND languages.from_app = users.from_app "
+                       "LEFT JOIN donation_info ON donation_info.user_id = users.user_id "
+                       "AND donation_info.from_app = users.from_app "
+                       "WHERE users.from_app = %s AND users.user_id IN ({})")
+
+# Contexts loaded during the current request or job, so each user row is read once
+_local = threading.local()
+
+
+class UserContext:
+    """
+    Everything the bot needs to know about a user to handle a request.  account is None when the user has no account.
+    """
+
+    def __init__(self, user_id, from_app, account=None, address=None, register=0, mute=0, language=None,
+                 donation_percent=None):
+        self.user_id = user_id
+        self.from_app = from_app
+        self.account = account
+        self.address = address
+        self.register = register
+        self.mute = mute
+        self.language = language
+        self.donation_percent = donation_percent
+
+    @property
+    def exists(self):
+        return self.account is not None
+
+    def __repr__(self):
+        return "UserContext({}, {}, account={}, register={}, mute={}, language={})".format(
+            self.user_id, self.from_app, self.account, self.register, self.mute, self.language)
+
+
+def _contexts():
+    contexts = getattr(_local, 'contexts', None)
+    if contexts is None:
+        contexts = _local.contexts = {}
+    return contexts
+
+
+def _key(user_id, from_app):
+    return str(user_id), from_app
+
+
+def reset():
+    """
+    Forget the contexts of the previous request.
+    """
+    _local.contexts = {}
+
+
+def remember(context):
+    _contexts()[_key(context.user_id, context.from_app)] = context
+
+
+def load_many(user_ids, from_app):
+    """
+    Get the contexts of several users of an app, reading the ones not loaded yet with a single query.  Returns a dict
+    keyed by str(user_id).
+    """
+    contexts = _contexts()
+    missing = list({str(user_id) for user_id in user_ids if _key(user_id, from_app) not in contexts})
+    if missing:
+        context_call = USER_CONTEXT_SELECT.format(', '.join(['%s'] * len(missing)))
+        for row in modules.db.get_db_data_new(context_call, [from_app] + missing):
+            contexts[_key(row[0], from_app)] = UserContext(row[0], from_app, row[1], row[2], row[3], row[4], row[5],
+                                                           row[6])
+        for user_id in missing:
+            contexts.setdefault(_key(user_id, from_app), UserContext(user_id, from_app))
+    return {str(user_id): contexts[_key(user_id, from_app)] for user_id in user_ids}
+
+
+def get(user_id, from_app):
+    return load_many([user_id], from_app)[str(user_id)]
+
+
+def for_sender(message):
+    """
+    Context of the sender of a message, kept in message['sender_context'] so it travels with queued jobs.
+    """
+    context = message.get('sender_context')
+    if context is None:
+        context = message['sender_context'] = get(message['sender_id'], message['from_app'])
+    else:
+        remember(context)
+    return context
+
+
+def create_account(context, username, register=1, mute=0, with_address=True):
+    """
+    Create the account of a user without one and update the context.
+    """
+    account = modules.db.create_account(context.user_id, context.from_app, username, register, mute, with_address)
+    context.account = account['account']
+    context.address = account['address']
+    context.register = register
+    context.mute = mute
+    return account
+
+
+def mark_registered(context):
+    if context.register == 0:
+        register_call = "UPDATE users SET register = 1 WHERE user_id = %s AND users.from_app = %s AND register = 0"
+        modules.db.set_db_data(register_call, [context.user_id, context.from_app])
+        context.register = 1
+
+
+def bind_address(context):
+    """
+    Address of the user, binding one from the spare pool if the account was created without one.
+    """
+    if context.address is None:
+        context.address = modules.db.bind_address(context.user_id, context.from_app)
+    return context.address
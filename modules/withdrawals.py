@@ -0,0 +1,218 @@
+import configparser
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime
+from decimal import Decimal
+from logging.handlers import TimedRotatingFileHandler
+
+import modules.balance_cache
+import modules.db
+import modules.jobs
+import modules.ledger
+import modules.rpc as rpc
+import modules.social
+import modules.translations as translations
+
+# Set logging info
+logger = logging.getLogger("withdrawals_log")
+logger.setLevel(logging.INFO)
+handler = TimedRotatingFileHandler('{}/logs/{:%Y-%m-%d}-withdrawals.log'.format(os.getcwd(), datetime.now()),
+                                   when="d",
+                                   interval=1,
+                                   backupCount=5)
+logger.addHandler(handler)
+
+# Read config and parse constants
+config = configparser.ConfigParser()
+config.read('{}/webhookconfig.ini'.format(os.getcwd()))
+
+# Check the currency of the bot
+CURRENCY = config.get('main', 'currency')
+CURRENCY_SYMBOL = config.get(CURRENCY, 'currency_symbol')
+EXPLORER = config.get('routes', '{}_explorer'.format(CURRENCY))
+
+# Withdrawals are queued and settled together once the oldest one waited WINDOW seconds or SIZE are queued.
+# A window of 0 disables the queue.
+WITHDRAW_BATCH_WINDOW = config.getint('main', 'withdraw_batch_window', fallback=0)
+WITHDRAW_BATCH_SIZE = config.getint('main', 'withdraw_batch_size', fallback=20)
+WITHDRAW_ACCOUNT = config.get('main', 'withdraw_account', fallback='')
+
+# Ledger account holding the funds of queued withdrawals until they are settled
+RESERVE_ACCOUNT = 'ledger:withdrawals'
+SETTLE_LOCK = 'withdrawal_settlement'
+
+stats = {
+    'queued': 0,
+    'batches': 0,
+    'settled': 0,
+    'failed': 0,
+    'unknown': 0,
+}
+
+_thread = None
+
+
+def is_enabled():
+    return WITHDRAW_BATCH_WINDOW > 0
+
+
+def enqueue(ref, message, account, address, amount):
+    """
+    Reserve the amount on the ledger and queue the withdrawal for the next sendmany.
+    """
+    queue_call = ("INSERT INTO withdrawal_queue (ref, account, address, amount, user_id, from_app, language) "
+                  "VALUES (%s, %s, %s, %s, %s, %s, %s)")
+    queue_values = [ref, account, address, modules.ledger.to_amount(amount), message['sender_id'],
+                    message['from_app'], message['language']]
+    modules.ledger.transfer(ref, 'withdraw-reserve', account, RESERVE_ACCOUNT, amount,
+                            [(queue_call, queue_values)])
+    stats['queued'] += 1
+    logger.info("{}: Withdraw {} of {} queued for {}".format(datetime.now(), ref, amount, address))
+
+
+def get_due_batch():
+    """
+    Get the queued withdrawals if the batch is full or its window has elapsed.
+    """
+    queued_call = ("SELECT id, ref, account, address, amount, user_id, from_app, language, "
+                   "TIMESTAMPDIFF(SECOND, created_ts, now()) FROM withdrawal_queue "
+                   "WHERE status = 'queued' ORDER BY id LIMIT %s")
+    queued = modules.db.get_db_data_new(queued_call, [WITHDRAW_BATCH_SIZE])
+    if not queued:
+        return []
+    if len(queued) >= WITHDRAW_BATCH_SIZE or max(row[8] for row in queued) >= WITHDRAW_BATCH_WINDOW:
+        return queued
+    return []
+
+
+def claim(batch):
+    """
+    Mark the withdrawals of the batch as being sent, in one transaction, so a later run never pays them again whatever
+    happens to this one.  Returns the rows that were still queued.
+    """
+    placeholders = ', '.join(['%s'] * len(batch))
+    with modules.db.transaction() as db_cursor:
+        db_cursor.execute("SELECT id FROM withdrawal_queue WHERE id IN ({}) AND status = 'queued' FOR UPDATE"
+                          .format(placeholders), [row[0] for row in batch])
+        claimed = {row[0] for row in db_cursor.fetchall()}
+        if claimed:
+            db_cursor.execute("UPDATE withdrawal_queue SET status = 'sending' WHERE id IN ({})"
+                              .format(', '.join(['%s'] * len(claimed))), list(claimed))
+    return [row for row in batch if row[0] in claimed]
+
+
+def settle(batch):
+    """
+    Pay every withdrawal of the batch with a single sendmany and split the network fee between them.
+
+    The batch is claimed before sendmany runs.  It is refunded only if the wallet refuses the sendmany.  If the outcome
+    is unknown, e.g. the call timed out after the wallet broadcast the transaction, the withdrawals stay 'sending' until
+    they are reconciled with the wallet by hand.
+    """
+    batch = claim(batch)
+    if not batch:
+        return None
+    ids = [row[0] for row in batch]
+    placeholders = ', '.join(['%s'] * len(ids))
+    accounts = {row[2] for row in batch}
+
+    outputs = defaultdict(Decimal)
+    for row in batch:
+        outputs[row[3]] += row[4]
+
+    try:
+        send_hash = rpc.send_many(WITHDRAW_ACCOUNT, dict(outputs))
+    except Exception as e:
+        if not rpc.is_rejected(e):
+            stats['unknown'] += len(batch)
+            logger.error("{}: ALERT: outcome of the sendmany of withdrawals {} is unknown, they are left 'sending'.  "
+                         "Reconcile them with the wallet: {}".format(datetime.now(), ids, e))
+            return None
+        logger.info("{}: sendmany refused, refunding {} withdrawals: {}".format(datetime.now(), len(batch), e))
+        with modules.db.transaction() as db_cursor:
+            for row in batch:
+                modules.ledger.post(db_cursor, '{}:refund'.format(row[1]), 'withdraw-refund', RESERVE_ACCOUNT,
+                                    row[2], row[4], check_funds=False)
+            db_cursor.execute("UPDATE withdrawal_queue SET status = 'failed', settled_ts = now() WHERE id IN ({})"
+                              .format(placeholders), ids)
+        modules.balance_cache.invalidate(*accounts)
+        for row in batch:
+            modules.jobs.enqueue(modules.social.send_dm, row[5], translations.withdraw_failed_text[row[7]], row[6])
+        stats['failed'] += len(batch)
+        return None
+
+    try:
+        fee_share = modules.ledger.to_amount(rpc.get_transaction_fee(send_hash) / len(batch))
+    except Exception as e:
+        logger.info("{}: Could not read the fee of {}: {}".format(datetime.now(), send_hash, e))
+        fee_share = 0
+
+    try:
+        with modules.db.transaction() as db_cursor:
+            for row in batch:
+                modules.ledger.post(db_cursor, '{}:settle'.format(row[1]), 'withdraw', RESERVE_ACCOUNT,
+                                    modules.ledger.WALLET_ACCOUNT, row[4], check_funds=False)
+                if fee_share > 0:
+                    modules.ledger.post(db_cursor, '{}:fee'.format(row[1]), 'fee', row[2],
+                                        modules.ledger.FEES_ACCOUNT, fee_share, check_funds=False)
+            db_cursor.execute("UPDATE withdrawal_queue SET status = 'sent', tx_id = %s, settled_ts = now() "
+                              "WHERE id IN ({})".format(placeholders), [send_hash] + ids)
+    except Exception as e:
+        logger.error("{}: ALERT: withdrawals {} were paid in {} but could not be settled on the ledger, they are left "
+                     "'sending': {}".format(datetime.now(), ids, send_hash, e))
+        raise
+    modules.balance_cache.invalidate(*accounts)
+
+    for row in batch:
+        modules.jobs.enqueue(modules.social.send_dm, row[5], translations.withdraw_text[row[7]]
+                             .format(row[4], CURRENCY_SYMBOL, EXPLORER, send_hash), row[6])
+
+    stats['batches'] += 1
+    stats['settled'] += len(batch)
+    logger.info("{}: Settled {} withdrawals in {}".format(datetime.now(), len(batch), send_hash))
+    return send_hash
+
+
+def settle_due():
+    """
+    Settle the queue if a batch is due.  Only one process settles at a time.
+    """
+    with modules.db.connection() as db:
+        db_cursor = db.cursor()
+        db_cursor.execute("SELECT GET_LOCK(%s, 0)", [SETTLE_LOCK])
+        locked = db_cursor.fetchall()[0][0] == 1
+        if not locked:
+            db_cursor.close()
+            return None
+        try:
+            batch = get_due_batch()
+            if batch:
+                return settle(batch)
+            return None
+        finally:
+            db_cursor.execute("SELECT RELEASE_LOCK(%s)", [SETTLE_LOCK])
+            db_cursor.fetchall()
+            db_cursor.close()
+
+
+def run_forever():
+    while True:
+        try:
+            settle_due()
+        except Exception as e:
+            logger.info("{}: Error settling withdrawals: {}".format(datetime.now(), e))
+        time.sleep(min(WITHDRAW_BATCH_WINDOW, 5))
+
+
+def start():
+    """
+    Start the settlement loop for this process, if the withdrawal queue is enabled.
+    """
+    global _thread
+    if not is_enabled() or (_thread is not None and _thread.is_alive()):
+        return
+    _thread = threading.Thread(target=run_forever, name='withdrawals', daemon=True)
+    _thread.start()
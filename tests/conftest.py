@@ -0,0 +1,55 @@
+import os
+import sys
+import tempfile
+
+# The modules read webhookconfig.ini and open their logs relative to the working directory when they are imported, so
+# the tests run from a directory holding a config of their own.
+TEST_CONFIG = """
+[main]
+host = localhost
+user = tipbot
+password = tipbot
+bot_status = active
+currency = vericoin
+redis_url = redis://localhost:6379/15
+job_queue = tipbot-tests
+
+[vericoin]
+currency_name = Vericoin
+currency_symbol = VRC
+consumer_key = key
+consumer_secret = secret
+access_token = token
+access_token_secret = secret
+telegram_key = key
+schema = tipbot
+bot_id_twitter = 1
+bot_id_telegram = 2
+bot_name_telegram = tipbot
+bot_name_twitter = tipbot
+bot_account = donations
+wallet_ip = 127.0.0.1
+wallet_port = 58683
+wallet_username = vrc
+wallet_password = vrc
+min_tip = 1
+min_tx_confirmation = 10
+
+[routes]
+twitter_uri = twitter
+telegram_uri = telegram
+telegram_set_uri = telegram_set
+base_url = https://tipbot.example.com
+vericoin_url = https://www.vericoin.info
+vericoin_explorer = https://chainz.cryptoid.info/vrc/
+"""
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_DIR not in sys.path:
+    sys.path.insert(0, REPO_DIR)
+
+_workdir = tempfile.mkdtemp(prefix='tipbot-tests-')
+os.makedirs(os.path.join(_workdir, 'logs'))
+with open(os.path.join(_workdir, 'webhookconfig.ini'), 'w') as config_file:
+    config_file.write(TEST_CONFIG)
+os.chdir(_workdir)
@@ -0,0 +1,58 @@
+import pytest
+
+pytest.importorskip('MySQLdb')
+
+import modules.chat_members
+
+
+@pytest.fixture
+def table(monkeypatch):
+    rows = {}
+
+    def get_db_data_new(sql, values):
+        chat_id, keys = values[0], values[1:]
+        return [(member_id, member_name) for (row_chat_id, member_id), member_name in rows.items()
+                if row_chat_id == chat_id and (member_name.lower() in keys or member_id in keys)]
+
+    monkeypatch.setattr(modules.db, 'get_db_data_new', get_db_data_new)
+    modules.chat_members._chats.clear()
+    modules.chat_members._member_chats.clear()
+    modules.chat_members._pending.clear()
+    yield rows
+    modules.chat_members._pending.clear()
+
+
+def test_resolve_reads_the_table(table):
+    table[(1, 10)] = 'Alice'
+
+    assert modules.chat_members.resolve(1, ['alice', 'bob'], [10]) == {'alice': (10, 'Alice'), 'bob': None,
+                                                                      '10': (10, 'Alice')}
+
+
+def test_resolve_sees_a_leave_of_another_process(table):
+    table[(1, 10)] = 'Alice'
+    assert modules.chat_members.resolve(1, ['alice'])['alice'] == (10, 'Alice')
+
+    # Another process removed the member and flushed
+    del table[(1, 10)]
+
+    assert modules.chat_members.resolve(1, ['alice'])['alice'] is None
+    assert 10 not in modules.chat_members._chats[1]['by_id']
+
+
+def test_resolve_sees_a_username_taken_over(table):
+    table[(1, 10)] = 'Alice'
+    modules.chat_members.resolve(1, ['alice'])
+
+    table[(1, 10)] = 'Alice_old'
+    table[(1, 11)] = 'Alice'
+
+    assert modules.chat_members.resolve(1, ['alice'])['alice'] == (11, 'Alice')
+
+
+def test_unwritten_changes_override_the_table(table):
+    table[(1, 10)] = 'Alice'
+    modules.chat_members.remove(1, 10)
+    modules.chat_members.add(1, 'chat', 11, 'Bob')
+
+    assert modules.chat_members.resolve(1, ['alice', 'bob']) == {'alice': None, 'bob': (11, 'Bob')}
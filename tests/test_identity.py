@@ -0,0 +1,74 @@
+from types import SimpleNamespace
+
+import pytest
+import redis
+
+pytest.importorskip('MySQLdb')
+tweepy = pytest.importorskip('tweepy')
+fakeredis = pytest.importorskip('fakeredis')
+
+import modules.identity
+import modules.jobs
+
+
+class FakeApi(object):
+    def __init__(self, users):
+        self.users = users
+        self.calls = []
+        self.error = None
+
+    def lookup_users(self, user_ids=None, screen_names=None):
+        self.calls.append((user_ids, screen_names))
+        if self.error is not None:
+            raise self.error
+        return [user for user in self.users
+                if user.id_str in (user_ids or []) or user.screen_name.lower() in (screen_names or [])]
+
+
+def broken(*args, **kwargs):
+    raise redis.ConnectionError('Redis is down')
+
+
+@pytest.fixture
+def api(monkeypatch):
+    api = FakeApi([SimpleNamespace(id=1, id_str='1', screen_name='Alice', name='Alice A')])
+    monkeypatch.setattr(modules.identity.modules.social, 'api', api, raising=False)
+    connection = fakeredis.FakeRedis()
+    modules.jobs.set_connection(connection)
+    yield api
+    modules.jobs.set_connection(None)
+
+
+def test_lookup_is_shared_through_redis(api):
+    assert modules.identity.get_user(screen_name='@alice')['id_str'] == '1'
+    # Cached under the id as well
+    assert modules.identity.get_user(user_id=1)['screen_name'] == 'Alice'
+
+    assert len(api.calls) == 1
+    assert modules.identity.get_stats()['hits'] == 1
+
+
+def test_missing_handle_is_negatively_cached(api):
+    assert modules.identity.get_users(screen_names=['alice', 'nobody']) == {
+        'alice': {'id': 1, 'id_str': '1', 'screen_name': 'Alice', 'name': 'Alice A'}, 'nobody': None}
+    assert modules.identity.get_user(screen_name='nobody') is None
+
+    assert len(api.calls) == 1
+    assert modules.identity.get_stats()['negative_hits'] == 1
+    assert modules.jobs.get_connection().ttl('identities:screen_name:nobody') <= modules.identity.IDENTITY_NEGATIVE_TTL
+
+
+@pytest.mark.skipif(not hasattr(tweepy, 'TweepError'), reason='needs the tweepy 3 TweepError')
+def test_expired_user_is_not_served_when_the_lookup_fails(api):
+    modules.identity.get_user(screen_name='alice')
+    modules.jobs.get_connection().delete('identities:screen_name:alice')
+    api.error = tweepy.TweepError('Over capacity')
+
+    assert modules.identity.get_user(screen_name='alice') is None
+    assert modules.identity.get_stats()['upstream_errors'] == 1
+
+
+def test_lookup_without_redis(api):
+    modules.jobs.set_connection(SimpleNamespace(mget=broken, pipeline=broken, hgetall=broken))
+
+    assert modules.identity.get_user(screen_name='alice')['id_str'] == '1'
@@ -0,0 +1,115 @@
+import pytest
+
+fakeredis = pytest.importorskip('fakeredis')
+rq = pytest.importorskip('rq')
+
+from rq.registry import FailedJobRegistry, ScheduledJobRegistry
+
+import modules.jobs
+
+results = []
+
+
+def record(value):
+    results.append(value)
+    return value
+
+
+def fail():
+    raise ValueError('job failed')
+
+
+@pytest.fixture(autouse=True)
+def connection():
+    connection = fakeredis.FakeRedis()
+    modules.jobs.set_connection(connection)
+    del results[:]
+    yield connection
+    modules.jobs.set_connection(None)
+
+
+def run_queue():
+    # Runs the jobs in this process, the workers of `flask workers` fork a child for each job
+    worker = rq.SimpleWorker([modules.jobs.get_queue()], connection=modules.jobs.get_connection())
+    worker.work(burst=True)
+
+
+def test_enqueue_runs_the_job():
+    job = modules.jobs.enqueue(record, 'tip')
+
+    assert modules.jobs.get_queue().count == 1
+    run_queue()
+    assert results == ['tip']
+    assert job.get_status(refresh=True) == 'finished'
+
+
+def test_enqueue_many_queues_every_call():
+    jobs = modules.jobs.enqueue_many([(record, ('a',)), (record, ('b',)), (record, ('c',))])
+
+    assert len(jobs) == 3
+    assert modules.jobs.get_queue().count == 3
+    run_queue()
+    assert results == ['a', 'b', 'c']
+
+
+def test_enqueue_many_without_calls():
+    assert modules.jobs.enqueue_many([]) == []
+    assert modules.jobs.get_queue().count == 0
+
+
+@pytest.mark.parametrize('retries, intervals', [
+    (1, [10]),
+    (2, [10, 60]),
+    (3, [10, 60, 300]),
+])
+def test_retry_intervals(retries, intervals):
+    job = modules.jobs.enqueue(record, 'tip', retries=retries)
+
+    assert job.retries_left == retries
+    assert job.retry_intervals == intervals
+
+
+def test_no_retry():
+    assert modules.jobs._retry(0) is None
+
+
+def test_failing_job_is_retried_later():
+    job = modules.jobs.enqueue(fail, retries=1)
+
+    run_queue()
+
+    queue = modules.jobs.get_queue()
+    assert job.id in ScheduledJobRegistry(queue=queue).get_job_ids()
+    assert job.id not in FailedJobRegistry(queue=queue).get_job_ids()
+
+
+def test_failing_job_without_retries_is_a_dead_letter():
+    job = modules.jobs.enqueue(fail, retries=0)
+
+    run_queue()
+
+    assert modules.jobs.get_dead_letters() == [job.id]
+    assert modules.jobs.get_stats()['dead_letters'] == 1
+    assert modules.jobs.requeue_dead_letters() == 1
+    assert modules.jobs.get_dead_letters() == []
+    assert modules.jobs.get_queue().count == 1
+
+
+def test_lock_is_released_by_its_owner(connection):
+    token = modules.jobs.acquire_lock('lock', 30)
+
+    assert token is not None
+    assert modules.jobs.acquire_lock('lock', 30) is None
+    modules.jobs.release_lock('lock', token)
+    assert connection.get('lock') is None
+
+
+def test_expired_lock_taken_over_is_kept(connection):
+    token = modules.jobs.acquire_lock('lock', 30)
+    # The lock expired and another process took it
+    connection.delete('lock')
+    other_token = modules.jobs.acquire_lock('lock', 30)
+
+    modules.jobs.release_lock('lock', token)
+
+    assert connection.get('lock') == other_token.encode('utf-8')
@@ -0,0 +1,149 @@
+import copy
+import socket
+from contextlib import contextmanager
+from decimal import Decimal
+
+import pytest
+
+MySQLdb = pytest.importorskip('MySQLdb')
+JSONRPCException = pytest.importorskip('bitcoinrpc.authproxy').JSONRPCException
+fakeredis = pytest.importorskip('fakeredis')
+
+import modules.balance_cache
+import modules.jobs
+import modules.ledger
+
+
+class FakeLedgerCursor(object):
+    """
+    In-memory ledger_accounts and ledger_entries, for the statements modules.ledger.post runs.
+    """
+
+    def __init__(self, balances=None):
+        self.balances = {account: Decimal(balance) for account, balance in (balances or {}).items()}
+        self.entries = {}
+        self.rowcount = 0
+
+    def execute(self, sql, values=None):
+        if sql.startswith("UPDATE ledger_accounts SET balance = balance - %s"):
+            amount, account, _ = values
+            if self.balances.get(account, Decimal(0)) >= amount:
+                self.balances[account] -= amount
+                self.rowcount = 1
+            else:
+                self.rowcount = 0
+        elif sql.startswith("INSERT INTO ledger_accounts"):
+            account, amount = values
+            self.balances[account] = self.balances.get(account, Decimal(0)) + amount
+            self.rowcount = 1
+        else:
+            raise AssertionError('Unexpected statement: {}'.format(sql))
+
+    def executemany(self, sql, rows):
+        assert sql.startswith("INSERT INTO ledger_entries")
+        for ref, kind, account, amount in rows:
+            if (ref, account) in self.entries:
+                raise MySQLdb.IntegrityError(1062, "Duplicate entry '{}-{}' for key 'ref_account_UNIQUE'"
+                                             .format(ref, account))
+        for ref, kind, account, amount in rows:
+            self.entries[(ref, account)] = (kind, amount)
+
+
+@pytest.fixture
+def ledger(monkeypatch):
+    cursor = FakeLedgerCursor({'alice': 10, 'bob': 0})
+    cursor.commits = []
+
+    @contextmanager
+    def transaction():
+        # Roll the fake tables back when the with block fails, as the DB would
+        saved = copy.deepcopy((cursor.balances, cursor.entries))
+        try:
+            yield cursor
+        except BaseException:
+            cursor.balances, cursor.entries = saved
+            raise
+        cursor.commits.append(modules.jobs.get_connection().get('balances:vericoin:alice:generation'))
+
+    def get_balance(account):
+        return {'balance': cursor.balances.get(account, Decimal(0)), 'pending': Decimal(0)}
+
+    monkeypatch.setattr(modules.db, 'transaction', transaction)
+    monkeypatch.setattr(modules.ledger, 'open_account', lambda account: None)
+    monkeypatch.setattr(modules.ledger, 'get_balance', get_balance)
+    modules.jobs.set_connection(fakeredis.FakeRedis())
+    yield cursor
+    modules.jobs.set_connection(None)
+
+
+def test_post_moves_the_amount(ledger):
+    modules.ledger.post(ledger, 'tip-1', 'tip', 'alice', 'bob', 4)
+
+    assert ledger.balances['alice'] == Decimal(6)
+    assert ledger.balances['bob'] == Decimal(4)
+    assert ledger.entries[('tip-1', 'alice')] == ('tip', Decimal(-4))
+    assert ledger.entries[('tip-1', 'bob')] == ('tip', Decimal(4))
+
+
+def test_post_refuses_to_overdraw(ledger):
+    with pytest.raises(modules.ledger.InsufficientFunds):
+        modules.ledger.post(ledger, 'tip-1', 'tip', 'alice', 'bob', 11)
+
+    assert ledger.balances['alice'] == Decimal(10)
+    assert not ledger.entries
+
+
+def test_transfer_rolls_back_when_funds_are_missing(ledger):
+    with pytest.raises(modules.ledger.InsufficientFunds):
+        modules.ledger.transfer('tip-1', 'tip', 'bob', 'alice', 1)
+
+    assert ledger.balances == {'alice': Decimal(10), 'bob': Decimal(0)}
+    assert not ledger.entries
+
+
+def test_transfer_refuses_a_repeated_ref(ledger):
+    modules.ledger.transfer('tip-1', 'tip', 'alice', 'bob', 4)
+
+    with pytest.raises(modules.ledger.DuplicateEntry):
+        modules.ledger.transfer('tip-1', 'tip', 'alice', 'bob', 4)
+
+    assert ledger.balances['alice'] == Decimal(6)
+    assert ledger.balances['bob'] == Decimal(4)
+
+
+def test_transfer_drops_the_cached_balances_once_committed(ledger):
+    assert modules.balance_cache.get('alice')['balance'] == Decimal(10)
+
+    modules.ledger.transfer('tip-1', 'tip', 'alice', 'bob', 4)
+
+    # The cached balance was still current when the transfer committed
+    assert ledger.commits == [None]
+    assert modules.balance_cache.get('alice')['balance'] == Decimal(6)
+    assert modules.balance_cache.get('bob')['balance'] == Decimal(4)
+
+
+def test_withdraw_refunds_when_the_wallet_refuses(ledger, monkeypatch):
+    def send_to_address(address, amount):
+        raise JSONRPCException({'code': -6, 'message': 'Insufficient funds'})
+
+    monkeypatch.setattr(modules.ledger.rpc, 'send_to_address', send_to_address)
+
+    with pytest.raises(JSONRPCException):
+        modules.ledger.withdraw('withdraw-1', 'alice', 'VAddress', 4)
+
+    assert ledger.balances['alice'] == Decimal(10)
+    assert ledger.balances[modules.ledger.WALLET_ACCOUNT] == Decimal(0)
+    assert ('withdraw-1:refund', 'alice') in ledger.entries
+
+
+def test_withdraw_keeps_the_debit_when_the_outcome_is_unknown(ledger, monkeypatch):
+    def send_to_address(address, amount):
+        raise socket.timeout('timed out')
+
+    monkeypatch.setattr(modules.ledger.rpc, 'send_to_address', send_to_address)
+
+    with pytest.raises(socket.timeout):
+        modules.ledger.withdraw('withdraw-1', 'alice', 'VAddress', 4)
+
+    assert ledger.balances['alice'] == Decimal(6)
+    assert ('withdraw-1:refund', 'alice') not in ledger.entries
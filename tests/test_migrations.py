@@ -0,0 +1,66 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+pytest.importorskip('MySQLdb')
+
+import modules.migrations
+from conftest import REPO_DIR
+
+
+class FakeCursor(object):
+    def __init__(self, count=0):
+        self.count = count
+        self.executed = []
+
+    def execute(self, sql, values=None):
+        self.executed.append(sql)
+
+    def fetchall(self):
+        return [(self.count,)]
+
+
+@pytest.mark.parametrize('module', ['modules.users', 'modules.tip_feed', 'modules.tip_stats', 'modules.migrations'])
+def test_module_imports_first(module):
+    # A fresh interpreter, so the module is the first one of the package imported
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([REPO_DIR] + sys.path))
+    subprocess.run([sys.executable, '-c', 'import {}'.format(module)], check=True, env=env)
+
+
+def test_versions_are_in_order():
+    versions = [version for version, _, _ in modules.migrations.get_migrations()]
+
+    assert versions == sorted(set(versions))
+    assert modules.migrations.latest_version() == versions[-1]
+
+
+def test_step_runs_its_statement():
+    cursor = FakeCursor()
+
+    modules.migrations.run_step(cursor, "ALTER TABLE users LOCK=NONE")
+
+    assert cursor.executed == ["ALTER TABLE users LOCK=NONE"]
+
+
+def test_checked_step_runs_when_not_applied():
+    cursor = FakeCursor(count=0)
+
+    modules.migrations.run_step(cursor, ("SELECT COUNT(*) FROM t", "ALTER TABLE t LOCK=NONE"))
+
+    assert cursor.executed == ["SELECT COUNT(*) FROM t", "ALTER TABLE t LOCK=NONE"]
+
+
+def test_checked_step_skipped_when_applied():
+    cursor = FakeCursor(count=1)
+
+    modules.migrations.run_step(cursor, ("SELECT COUNT(*) FROM t", "ALTER TABLE t LOCK=NONE"))
+
+    assert cursor.executed == ["SELECT COUNT(*) FROM t"]
+
+
+def test_primary_key_changes_are_checked():
+    steps = dict((version, steps) for version, _, steps in modules.migrations.get_migrations())[2]
+
+    assert all(isinstance(step, tuple) for step in steps)
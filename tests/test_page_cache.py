@@ -0,0 +1,66 @@
+import pytest
+
+fakeredis = pytest.importorskip('fakeredis')
+flask = pytest.importorskip('flask')
+
+import modules.jobs
+import modules.page_cache
+
+app = flask.Flask(__name__)
+
+
+@pytest.fixture
+def connection(monkeypatch):
+    connection = fakeredis.FakeRedis()
+    modules.jobs.set_connection(connection)
+    monkeypatch.setattr(modules.page_cache, 'RENDER_TIMEOUT', 1)
+    yield connection
+    modules.jobs.set_connection(None)
+
+
+def get_page(view):
+    with app.test_request_context('/'):
+        return modules.page_cache.get_page('index', view, (), {})
+
+
+def test_page_is_rendered_once(connection):
+    renders = []
+
+    def view():
+        renders.append(1)
+        return 'index'
+
+    assert get_page(view)['body'] == 'index'
+    assert get_page(view)['body'] == 'index'
+    assert len(renders) == 1
+
+
+def test_waiting_request_leaves_the_render_lock(connection):
+    with app.test_request_context('/'):
+        lock_key = modules.page_cache.get_key(connection, 'index', '') + ':render'
+    connection.set(lock_key, 'other')
+
+    # Another request is still rendering, this one gives up waiting and renders the page itself
+    assert get_page(lambda: 'index')['body'] == 'index'
+    assert connection.get(lock_key) == b'other'
+
+
+def test_rendering_request_releases_the_render_lock(connection):
+    get_page(lambda: 'index')
+
+    with app.test_request_context('/'):
+        lock_key = modules.page_cache.get_key(connection, 'index', '') + ':render'
+    assert connection.get(lock_key) is None
+
+
+def test_slow_render_leaves_the_lock_taken_over(connection):
+    with app.test_request_context('/'):
+        lock_key = modules.page_cache.get_key(connection, 'index', '') + ':render'
+
+    def view():
+        # The render outlasted the lock and another request took it
+        connection.set(lock_key, 'other')
+        return 'index'
+
+    assert get_page(view)['body'] == 'index'
+    assert connection.get(lock_key) == b'other'
@@ -0,0 +1,86 @@
+from contextlib import contextmanager
+
+import pytest
+
+pytest.importorskip('MySQLdb')
+
+import modules.spare_pool
+
+
+class FakePoolCursor(object):
+    def __init__(self, depth):
+        self.depth = depth
+        self.result = []
+
+    def execute(self, sql, values=None):
+        if sql.startswith("SELECT GET_LOCK") or sql.startswith("SELECT RELEASE_LOCK"):
+            self.result = [(1,)]
+        elif sql.startswith("SELECT count(*)"):
+            self.result = [(self.depth,)]
+        else:
+            raise AssertionError('Unexpected statement: {}'.format(sql))
+
+    def fetchall(self):
+        return self.result
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    cursor = FakePoolCursor(depth=0)
+    added = []
+
+    class FakeConnection(object):
+        def cursor(self):
+            return cursor
+
+    @contextmanager
+    def connection():
+        yield FakeConnection()
+
+    monkeypatch.setattr(modules.db, 'connection', connection)
+    monkeypatch.setattr(modules.spare_pool, 'add_accounts', added.extend)
+    monkeypatch.setattr(modules.spare_pool, 'SPARE_POOL_HIGH', 10)
+    monkeypatch.setattr(modules.spare_pool, 'SPARE_POOL_BATCH', 4)
+    return added
+
+
+def generated(count):
+    return [{'account': 'account{}'.format(i), 'address': 'address{}'.format(i)} for i in range(count)]
+
+
+def test_refill_tops_the_pool_up(pool, monkeypatch):
+    monkeypatch.setattr(modules.spare_pool.rpc, 'generate_new_accounts', generated)
+
+    assert modules.spare_pool.refill() == 10
+    assert len(pool) == 10
+
+
+def test_refill_stops_when_the_wallet_generates_nothing(pool, monkeypatch):
+    calls = []
+
+    def generate_new_accounts(count):
+        calls.append(count)
+        return []
+
+    monkeypatch.setattr(modules.spare_pool.rpc, 'generate_new_accounts', generate_new_accounts)
+
+    assert modules.spare_pool.refill() == 0
+    assert calls == [4]
+    assert pool == []
+
+
+def test_refill_stops_after_a_short_batch(pool, monkeypatch):
+    calls = []
+
+    def generate_new_accounts(count):
+        calls.append(count)
+        return generated(count - 1)
+
+    monkeypatch.setattr(modules.spare_pool.rpc, 'generate_new_accounts', generate_new_accounts)
+
+    assert modules.spare_pool.refill() == 3
+    assert calls == [4]
+    assert len(pool) == 3
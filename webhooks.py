@@ -14,15 +14,30 @@ from http import HTTPStatus
 from logging.handlers import TimedRotatingFileHandler
 
 import requests
-import telegram
 import tweepy
 from flask import Flask, render_template, request, Response, redirect, jsonify
 
+import modules.balance_cache
+import modules.chat_members
 import modules.db
+import modules.http
+import modules.identity
+import modules.indexer
+import modules.jobs
+import modules.migrations
 import modules.orchestration
+import modules.outbox
+import modules.page_cache
+import modules.prefilter
+import modules.prices
 import modules.rpc as rpc
 import modules.social
-import modules.translations as translations
+import modules.spare_pool
+import modules.tip_feed
+import modules.tip_parser
+import modules.tip_stats
+import modules.users
+import modules.withdrawals
 from modules.AccountActivity import ActivityAPI
 
 # Set Log File
@@ -84,15 +99,18 @@ app = Flask(__name__)
 # Connect to Twitter
 auth = tweepy.OAuthHandler(CONSUMER_KEY, CONSUMER_SECRET)
 auth.set_access_token(ACCESS_TOKEN, ACCESS_TOKEN_SECRET)
-api = ActivityAPI(auth)
+api = ActivityAPI(auth, timeout=modules.http.HTTP_READ_TIMEOUT)
 
-# Connect to Telegram
-if TELEGRAM_KEY != 'none':
-    telegram_bot = telegram.Bot(token=TELEGRAM_KEY)
+
+@app.before_request
+def reset_user_contexts():
+    # User contexts are only reused within a request
+    modules.users.reset()
 
 
 @app.route('/tutorial')
 @app.route('/tutorial.html')
+@modules.page_cache.cached('tutorial')
 def tutorial():
     tip_command = '!tip'
 
@@ -100,89 +118,52 @@ def tutorial():
 
 @app.route('/tippers')
 @app.route('/tippers.html')
+@modules.page_cache.cached('tippers')
 def tippers():
-    largest_tip = ("SELECT user_name, amount, address, a.from_app, timestamp "
-                   "FROM {0}.tip_list AS a, {0}.users AS b "
-                   "WHERE user_id = sender_id "
-                   "AND user_name IS NOT NULL "
-                   "AND processed = 2 "
-                   # "AND user_name != 'mitche50' "
-                   "AND amount = (select max(amount) "
-                   "FROM {0}.tip_list) "
-                   "ORDER BY timestamp DESC "
-                   "LIMIT 1;".format(DB_SCHEMA))
-
-    tippers_call = ("SELECT user_name AS 'screen_name', sum(amount) AS 'total_tips', address, b.from_app "
-                    "FROM {0}.tip_list AS a, {0}.users AS b "
-                    "WHERE user_id = sender_id "
-                    "AND user_name IS NOT NULL "
-                    "AND receiver_id IN (SELECT user_id FROM {0}.users) "
-                    "GROUP BY sender_id "
-                    "ORDER BY sum(amount) DESC "
-                    "LIMIT 50".format(DB_SCHEMA))
-
-    tipper_table = modules.db.get_db_data(tippers_call)
-    top_tipper = modules.db.get_db_data(largest_tip)
-    logger.info("tipper_call: {}".format(tippers_call))
-    logger.info("largest_tip: {}".format(largest_tip))
+    tipper_table = modules.tip_stats.get_top_tippers()
+    top_tipper = modules.tip_stats.get_largest_tip()
     top_tipper_date = top_tipper[0][4].date()
     return render_template('tippers.html', tipper_table=tipper_table, top_tipper=top_tipper,
                            top_tipper_date=top_tipper_date, currency=CURRENCY, currency_name=CURRENCY_NAME, currency_symbol=CURRENCY_SYMBOL, explorer=EXPLORER)
 
 
 @app.route('/tiplist')
+@modules.page_cache.cached('tiplist')
 def tip_list():
-    tip_list_call = ("SELECT DISTINCT t1.user_name AS 'Sender ID', t2.user_name AS 'Receiver ID', t1.amount, "
-                     "t1.address AS 'Sender Account', t2.address AS 'Receiver Account', t1.from_app, t1.timestamp "
-                     "FROM "
-                     "(SELECT user_name, amount, address, a.from_app, timestamp "
-                     "FROM {0}.tip_list AS a, {0}.users AS b "
-                     "WHERE user_id = sender_id "
-                     "AND user_name IS NOT NULL "
-                     "AND processed = 2 "
-                     # "AND user_name != 'mitche50' "
-                     "ORDER BY timestamp desc "
-                     "LIMIT 50) AS t1 "
-                     "JOIN "
-                     "(SELECT user_name, address, timestamp "
-                     "FROM {0}.tip_list, {0}.users "
-                     "WHERE user_id = receiver_id "
-                     "AND user_name IS NOT NULL "
-                     "AND processed = 2 "
-                     "ORDER BY timestamp DESC "
-                     "LIMIT 20) AS t2 "
-                     "ON t1.timestamp = t2.timestamp".format(DB_SCHEMA))
-    tip_list_table = modules.db.get_db_data(tip_list_call)
-    return render_template('tiplist.html', tip_list_table=tip_list_table, currency=CURRENCY, currency_name=CURRENCY_NAME, currency_symbol=CURRENCY_SYMBOL, explorer=EXPLORER)
+    # Keyset pagination: the page after a tip lists the tips older than it
+    try:
+        before_ts = datetime.strptime(request.args['before_ts'], '%Y-%m-%d %H:%M:%S')
+        before_id = int(request.args['before_id'])
+    except (KeyError, ValueError):
+        before_ts, before_id = None, None
+    tip_list_table = modules.tip_feed.get_page(before_ts, before_id)
+    if len(tip_list_table) == modules.tip_feed.FEED_PAGE_SIZE:
+        next_page = {'before_ts': '{:%Y-%m-%d %H:%M:%S}'.format(tip_list_table[-1][6]),
+                     'before_id': tip_list_table[-1][7]}
+    else:
+        next_page = None
+    return render_template('tiplist.html', tip_list_table=tip_list_table, next_page=next_page, currency=CURRENCY, currency_name=CURRENCY_NAME, currency_symbol=CURRENCY_SYMBOL, explorer=EXPLORER)
 
 
 @app.route('/')
 @app.route('/index')
 @app.route('/index.html')
+@modules.page_cache.cached('index')
 def index():
-    r = requests.get('https://api.coingecko.com/api/v3/simple/price?ids={}&vs_currencies=usd'.format(CURRENCY))
-    rx = r.json()
-    price = float(rx[CURRENCY]['usd'])
+    try:
+        price = float(modules.prices.get_price('usd'))
+    except modules.prices.PriceUnavailable:
+        price = 0
     tip_command = '!tip'
     if price > .01:
         price = round(price, 2)
 
-    total_tipped_coin = ("SELECT tip_list.from_app, sum(amount) AS total "
-                         "FROM {0}.tip_list "
-                         "WHERE receiver_id IN (SELECT user_id FROM {0}.users) "
-                         "GROUP BY from_app "
-                         "ORDER BY total DESC".format(DB_SCHEMA))
-
-    total_tipped_number = ("SELECT tip_list.from_app, count(from_app) AS notips "
-                           "FROM {0}.tip_list "
-                           "WHERE receiver_id IN (SELECT user_id FROM {0}.users)"
-                           "GROUP BY tip_list.from_app "
-                           "ORDER BY notips DESC".format(DB_SCHEMA))
-
-    total_tipped_coin_table = modules.db.get_db_data(total_tipped_coin)
-    total_tipped_number_table = modules.db.get_db_data(total_tipped_number)
+    platform_totals = modules.tip_stats.get_platform_totals()
+    total_tipped_coin_table = [(from_app, total_amount) for from_app, total_amount, _ in platform_totals]
+    total_tipped_number_table = sorted([(from_app, tip_count) for from_app, _, tip_count in platform_totals],
+                                       key=lambda row: row[1], reverse=True)
     try:
-        total_value_usd = round(Decimal(total_tipped_coin_table[0][1] + total_tipped_coin_table[1][1]) * Decimal(price), 2)
+        total_value_usd = round(sum(row[1] for row in total_tipped_coin_table) * Decimal(price), 2)
     except Exception as e:
         total_value_usd = 0
 
@@ -323,6 +304,27 @@ def twitterActivity():
   
     return '', 204
 
+@app.route('/stats', methods=["GET"])
+def internal_stats():
+    if request.remote_addr != "127.0.0.1":
+        return "nop", 403
+
+    return jsonify({
+        'spare_pool': modules.spare_pool.get_stats(),
+        'indexer': modules.indexer.stats,
+        'balance_cache': modules.balance_cache.get_stats(),
+        'withdrawals': modules.withdrawals.stats,
+        'jobs': modules.jobs.get_stats(),
+        'identity': modules.identity.get_stats(),
+        'prefilter': modules.prefilter.get_stats(),
+        'outbox': modules.outbox.get_stats(),
+        'http': modules.http.get_stats(),
+        'prices': modules.prices.get_stats(),
+        'chat_members': modules.chat_members.get_stats(),
+        'page_cache': modules.page_cache.get_stats(),
+    }), HTTPStatus.OK
+
+
 @app.route(TWITTER_URI, methods=["GET"])
 def webhook_challenge():
     # creates HMAC SHA-256 hash from incoming token and your consumer secret
@@ -348,15 +350,15 @@ def webhook_challenge():
 @app.route('/webhooks/twitter/getaccount/<screen_name>', methods=["GET"])
 def get_twitter_account(screen_name):
     try:
-        user = api.get_user(screen_name)
+        user = modules.identity.get_user(screen_name=screen_name)
 
         if user is not None:
             account_call = ("SELECT account, address FROM users "
-                            "WHERE user_id = '{}' AND users.from_app = 'twitter';".format(user.id_str))
+                            "WHERE user_id = '{}' AND users.from_app = 'twitter';".format(user['id_str']))
             account_return = modules.db.get_db_data(account_call)
             balance_return = rpc.get_account_balance(account_return[0][0])
             account_dict = {
-                'user_id': user.id_str,
+                'user_id': user['id_str'],
                 'address': account_return[0][1],
                 'balance': str(balance_return['balance']),
                 'pending': str(balance_return['pending'])
@@ -403,8 +405,8 @@ def refresh_balance(account):
         balance_return = rpc.get_account_balance(account_return[0][0])
 
         balance_dict = {
-            'balance': balance_return[0],
-            'pending': balance_return[1]
+            'balance': str(balance_return['balance']),
+            'pending': str(balance_return['pending'])
         }
         response = Response(json.dumps(balance_dict))
         response.headers['Access-Control-Allow-Credentials'] = True
@@ -421,7 +423,7 @@ def refresh_balance(account):
 def telegram_event():
     message = {
         # id:                     ID of the received tweet - Error logged through None value
-        # text:                   A list containing the text of the received tweet, split by ' '
+        # text:                   A list containing the tokens of the received tweet
         # sender_id:              Twitter ID of the user sending the tip
         # sender_screen_name:     Twitter Handle of the user sending the tip
         # sender_account:         coin account of sender - Error logged through None value
@@ -429,10 +431,8 @@ def telegram_event():
         # sender_balance_raw:     Amount of coin in sender's account, stored in raw
         # sender_balance:         Amount of coin in sender's account, stored in coin
 
-        # action_index:           Location of key action value *(currently !tip only)
         # action:                 Action found in the received tweet - Error logged through None value
-
-        # starting_point:         Location of action sent via tweet (currently !tip only)
+        # tip_intent:             TipIntent parsed from the text: command, amount, mentions and error code
 
         # tip_amount:             Value of tip to be sent to receiver(s) - Error logged through -1
         # tip_amount_text:        Value of the tip stored in a string to prevent formatting issues
@@ -510,13 +510,16 @@ def telegram_event():
                 message['chat_id'] = request_json['message']['chat']['id']
                 message['chat_name'] = request_json['message']['chat']['title']
 
+                # Every sender is recorded, so members who never tip can be tipped by username.  Known members
+                # are checked in memory.
                 modules.social.check_telegram_member(message['chat_id'], message['chat_name'], message['sender_id'],
                                                      message['sender_screen_name'])
 
-                message['text'] = request_json['message']['text']
-                message['text'] = message['text'].replace('\n', ' ')
-                message['text'] = message['text'].lower()
-                message['text'] = message['text'].split(' ')
+                # Drop chatter that cannot be a tip before touching the DB
+                if not modules.prefilter.accept_telegram_group(request_json['message']['text']):
+                    return '', HTTPStatus.OK
+
+                message['text'] = modules.tip_parser.tokenize(request_json['message']['text'])
                 modules.social.get_language(message)
 
                 message = modules.social.check_message_action(message)
@@ -533,25 +536,12 @@ def telegram_event():
                 logger.info("sender id: {}".format(message['sender_id']))
 
                 if message['action'] != -1 and str(message['sender_id']) != str(BOT_ID_TELEGRAM):
-                    new_pid = os.fork()
-                    if new_pid == 0:
-                        try:
-                            bot_status = config.get('main', 'bot_status')
-                            if bot_status == 'maintenance':
-                                modules.social.send_dm(message['sender_id'],
-                                                       translations.maintenance_text[message['language']],
-                                                       message['from_app'])
-                            else:
-                                modules.orchestration.tip_process(message, users_to_tip, request_json)
-                        except Exception as e:
-                            logger.info("Exception: {}".format(e))
-                            raise e
-
-                        os._exit(0)
-                    else:
-                        return '', HTTPStatus.OK
+                    # Receivers are resolved here, where the membership index is kept up to date
+                    message['chat_members'] = modules.social.get_chat_members(message, request_json)
+                    modules.jobs.enqueue(modules.orchestration.tip_job, message, users_to_tip, request_json)
+                    return '', HTTPStatus.OK
             elif 'new_chat_member' in request_json['message']:
-                logger.info("new member joined chat, adding to DB")
+                logger.info("new member joined chat, adding to index")
                 chat_id = request_json['message']['chat']['id']
                 chat_name = request_json['message']['chat']['title']
                 member_id = request_json['message']['new_chat_member']['id']
@@ -560,13 +550,7 @@ def telegram_event():
                 else:
                     member_name = None
 
-                new_chat_member_call = (
-                    "INSERT IGNORE INTO telegram_chat_members (chat_id, chat_name, member_id, member_name) "
-                    "VALUES (%s, %s, %s, %s)")
-                new_member_values = [chat_id, chat_name, member_id, member_name]
-                err = modules.db.set_db_data(new_chat_member_call, new_member_values)
-                if err is not None:
-                    return 'ok'
+                modules.chat_members.add(chat_id, chat_name, member_id, member_name)
 
             elif 'left_chat_member' in request_json['message']:
                 chat_id = request_json['message']['chat']['id']
@@ -576,28 +560,18 @@ def telegram_event():
                     member_name = request_json['message']['left_chat_member']['username']
                 else:
                     member_name = None
-                logger.info("member {}-{} left chat {}-{}, removing from DB.".format(member_id, member_name, chat_id,
+                logger.info("member {}-{} left chat {}-{}, removing from index.".format(member_id, member_name, chat_id,
                                                                                       chat_name))
 
-                remove_member_call = ("DELETE FROM telegram_chat_members "
-                                      "WHERE chat_id = %s AND member_id = %s")
-                remove_member_values = [chat_id, member_id]
-                err = modules.db.set_db_data(remove_member_call, remove_member_values)
-                if err is not None:
-                    return 'ok'
+                modules.chat_members.remove(chat_id, member_id)
 
             elif 'group_chat_created' in request_json['message']:
                 chat_id = request_json['message']['chat']['id']
                 chat_name = request_json['message']['chat']['title']
                 member_id = request_json['message']['from']['id']
                 member_name = request_json['message']['from']['username']
-                logger.info("member {} created chat {}, inserting creator into DB.".format(member_name, chat_name))
-                new_chat_call = ("INSERT IGNORE INTO telegram_chat_members (chat_id, chat_name, member_id, member_name) "
-                                 "VALUES (%s, %s, %s, %s)")
-                new_chat_values = [chat_id, chat_name, member_id, member_name]
-                err = modules.db.set_db_data(new_chat_call, new_chat_values)
-                if err is not None:
-                    return 'ok'
+                logger.info("member {} created chat {}, inserting creator into index.".format(member_name, chat_name))
+                modules.chat_members.add(chat_id, chat_name, member_id, member_name)
 
         else:
             logger.info("request: {}".format(request_json))
@@ -606,10 +580,6 @@ def telegram_event():
 
 @app.route(TWITTER_URI, methods=["POST"])
 def twitter_event_received():
-    message = {}
-    users_to_tip = []
-
-    message['from_app'] = 'twitter'
     request_json = request.get_json()
     auth_header = request.headers.get('X-Twitter-Webhooks-Signature')
     request_data = request.get_data()
@@ -641,115 +611,139 @@ def twitter_event_received():
         logger.info("auth header not provided, probable malicious access attempt from IP: {}".format(ip))
         return 'You are not allowed to access this webhook.', HTTPStatus.BAD_REQUEST
 
-    if 'direct_message_events' in request_json.keys():
-        """
-        User sent a DM to the bot.  Parse the DM, see if there is an action provided and perform it.
-        If no action is provided, reply with an error.
-        Each action spawns a child process that will handle the requested action and terminate after completion.
-        """
-        # DM received, process that
-        dm_object = request_json['direct_message_events'][0]
-        message_object = request_json['direct_message_events'][0].get('message_create', {})
-
-        message['sender_id'] = message_object.get('sender_id')
-        bot_ids = ['1263594761073483777']
+    # A delivery can carry several events of each type, every one of them is processed
+    handled = False
+    if request_json.get('direct_message_events'):
+        twitter_dm_events(request_json)
+        handled = True
+    if request_json.get('tweet_create_events'):
+        twitter_tweet_events(request_json)
+        handled = True
+    if request_json.get('follow_events'):
+        twitter_follow_events(request_json)
+        handled = True
+
+    if not handled:
+        # Event type not supported
+        return 'ok', HTTPStatus.OK
+    return '', HTTPStatus.OK
+
+
+def twitter_dm_events(request_json):
+    """
+    Users sent DMs to the bot.  Parse each DM, see if there is an action provided and perform it.
+    If no action is provided, reply with an error.
+    The DMs are recorded with one insert and their actions queued with one submission to the worker pool.
+    """
+    bot_ids = ['1263594761073483777']
+    payload_users = request_json.get('users', {})
+    messages = []
+    for dm_object in request_json['direct_message_events']:
+        message_object = dm_object.get('message_create', {})
+        message = {'from_app': 'twitter',
+                   'sender_id': message_object.get('sender_id'),
+                   'dm_id': dm_object.get('id'),
+                   'text': message_object.get('message_data', {}).get('text') or ''}
         if message['sender_id'] in bot_ids:
-            return "you are me"
-
-        # Retrieve user info
-        user_info = api.get_user(message['sender_id'])
-        message['sender_screen_name'] = user_info["screen_name"]
-        message['dm_id'] = dm_object.get('id')
-        message['text'] = message_object.get('message_data', {}).get('text')
+            continue
         message['dm_array'] = message['text'].split(" ")
         message['dm_action'] = message['dm_array'][0].lower()
+        messages.append(message)
+    if not messages:
+        return
+
+    # Retrieve user info from the users map of the payload, and look up the senders it is missing in one go
+    missing_ids = [message['sender_id'] for message in messages
+                   if not payload_users.get(message['sender_id'], {}).get('screen_name')]
+    looked_up = modules.identity.get_users(user_ids=missing_ids) if missing_ids else {}
+    for message in list(messages):
+        sender_info = payload_users.get(message['sender_id']) or looked_up.get(str(message['sender_id']))
+        if not sender_info or not sender_info.get('screen_name'):
+            logger.info("{}: Could not find the sender of DM {}".format(datetime.now(), message['dm_id']))
+            messages.remove(message)
+            continue
+        message['sender_screen_name'] = sender_info['screen_name']
+
+    # Update DB with the new DMs, redelivered DMs were handled already
+    new_dms = modules.db.record_dms([(message['dm_id'], message['sender_id'], message['text'])
+                                     for message in messages], 'twitter')
+    messages = [message for message in messages if str(message['dm_id']) in new_dms]
+
+    modules.users.load_many([message['sender_id'] for message in messages], 'twitter')
+    jobs = []
+    for message in messages:
         modules.social.get_language(message)
-
-        logger.info("Processing direct message.")
-
-        # Update DB with new DM
-        dm_insert_call = ("INSERT INTO dm_list (dm_id, processed, sender_id, dm_text, from_app) "
-                          "VALUES (%s, 0, %s, %s, 'twitter')")
-        dm_insert_values = [message['dm_id'], message['sender_id'], message['text']]
-        err = modules.db.set_db_data(dm_insert_call, dm_insert_values)
-        if err is not None:
-            return 'ok'
-
         logger.info("{}: action identified: {}".format(datetime.now(), message['dm_action']))
-        # Check for action on DM
-        modules.orchestration.parse_action(message)
-
-        return "ok", HTTPStatus.OK
-
-    elif 'tweet_create_events' in request_json.keys():
-        """
-        A tweet was received.  The bot will parse the tweet, see if there are any tips and process them.
-        Error handling will cover if the sender doesn't have an account, doesn't have enough to cover the tips,
-        sent to an invalid username, didn't send an amount to tip or didn't send a !tip command.
-        """
-
-        tweet_object = request_json['tweet_create_events'][0]
-        # tweet_log.info("{}: Tweet received: From - {} - Text - {}".format(datetime.now(), 
-        #                                                                tweet_object.get('user', {}).get('screen_name'),
-        #                                                                tweet_object.get('text')))
-
-        message = modules.social.set_message_info(tweet_object, message)
+        jobs.append(modules.orchestration.get_action_job(message))
+    logger.info("{}: Processing {} direct messages.".format(datetime.now(), len(jobs)))
+    modules.jobs.enqueue_many(jobs)
+
+
+def twitter_tweet_events(request_json):
+    """
+    Tweets were received.  The bot will parse each tweet, see if there are any tips and process them.
+    Error handling will cover if the sender doesn't have an account, doesn't have enough to cover the tips,
+    sent to an invalid username, didn't send an amount to tip or didn't send a !tip command.
+    """
+    # Drop tweets that cannot be a tip before touching the DB
+    tweet_objects = [tweet_object for tweet_object in request_json['tweet_create_events']
+                     if modules.prefilter.accept_tweet(tweet_object)]
+    if not tweet_objects:
+        return
+    # tweet_log.info("{}: Tweet received: From - {} - Text - {}".format(datetime.now(),
+    #                                                                tweet_object.get('user', {}).get('screen_name'),
+    #                                                                tweet_object.get('text')))
+
+    modules.users.load_many([tweet_object.get('user', {}).get('id_str') for tweet_object in tweet_objects], 'twitter')
+    jobs = []
+    for tweet_object in tweet_objects:
+        message = modules.social.set_message_info(tweet_object, {'from_app': 'twitter'})
         if message['id'] is None:
-            return 'ok', HTTPStatus.OK
+            continue
 
         message = modules.social.check_message_action(message)
         if message['action'] is None:
             logger.info("{}: Mention of veritip bot without a !tip command.".format(datetime.now()))
-            return 'ok', HTTPStatus.OK
+            continue
 
         message = modules.social.validate_tip_amount(message)
         if message['tip_amount'] <= 0:
-            return 'ok', HTTPStatus.OK
+            continue
 
         if message['action'] != -1 and str(message['sender_id']) != str(BOT_ID_TWITTER):
-            new_pid = os.fork()
-            if new_pid == 0:
-                try:
-                    bot_status = config.get('main', 'bot_status')
-                    if bot_status == 'maintenance':
-                        modules.social.send_dm(message['sender_id'],
-                                               translations.maintenance_text[message['language']],
-                                               message['from_app'])
-                    else:
-                        # Favoriting has been removed due to possible issues with Twitter automation rules.
-                        # api.create_favorite(message['id'])
-                        modules.orchestration.tip_process(message, users_to_tip, request_json)
-                except Exception as e:
-                    logger.info("Exception: {}".format(e))
-                    raise e
-
-                os._exit(0)
-            else:
-                return '', HTTPStatus.OK
+            # Favoriting has been removed due to possible issues with Twitter automation rules.
+            # api.create_favorite(message['id'])
+            jobs.append((modules.orchestration.tip_job, (message, [], {'tweet_create_events': [tweet_object]})))
 
         elif str(message['sender_id']) == str(BOT_ID_TWITTER):
             logger.info("{}: VeriTipBot sent a message.".format(datetime.now()))
 
-        return 'ok', HTTPStatus.OK
+    modules.jobs.enqueue_many(jobs)
+
 
-    elif 'follow_events' in request_json.keys():
-        """
-        New user followed the bot.  Send a welcome message.
-        """
-        logger.info("{}: New user followed, sending help message.".format(datetime.now()))
-        request_json = request.get_json()
-        follow_object = request_json['follow_events'][0]
+def twitter_follow_events(request_json):
+    """
+    New users followed the bot.  Send each of them a welcome message.
+    """
+    messages = []
+    for follow_object in request_json['follow_events']:
+        if follow_object.get('type', 'follow') != 'follow':
+            continue
         follow_source = follow_object.get('source', {})
-        message['sender_id'] = follow_source.get('id')
+        messages.append({'from_app': 'twitter',
+                         'sender_id': follow_source.get('id'),
+                         'sender_screen_name': follow_source.get('screen_name')})
+    if not messages:
+        return
+    logger.info("{}: {} new users followed, sending help message.".format(datetime.now(), len(messages)))
+
+    modules.users.load_many([message['sender_id'] for message in messages], 'twitter')
+    jobs = []
+    for message in messages:
         modules.social.get_language(message)
+        jobs.append((modules.orchestration.help_process, (message,)))
+    modules.jobs.enqueue_many(jobs)
 
-        modules.orchestration.help_process(message)
-
-        return 'ok', HTTPStatus.OK
-
-    else:
-        # Event type not supported
-        return 'ok', HTTPStatus.OK
 
 def start_runner():
     def start_loop():
@@ -769,14 +763,53 @@ def start_runner():
     thread.start()
 
 
+def start_background_tasks():
+    modules.spare_pool.start()
+    modules.indexer.start()
+    modules.withdrawals.start()
+    modules.outbox.start()
+    modules.prices.start()
+    modules.chat_members.start()
+
+
 @app.cli.command('initdb')
 def initdb_command():
     modules.db.db_init()
 
 
+@app.cli.command('check-queries')
+def check_queries_command():
+    full_scans = modules.migrations.check_hot_queries()
+    for name, table in full_scans:
+        print("Hot query '{}' scans all of {}".format(name, table))
+    if full_scans:
+        raise SystemExit(1)
+
+
+@app.cli.command('refresh-names')
+def refresh_names_command():
+    modules.identity.refresh_screen_names()
+
+
+@app.cli.command('requeue-outbox')
+def requeue_outbox_command():
+    modules.outbox.requeue_dead_letters()
+
+
+@app.cli.command('rebuild-tip-stats')
+def rebuild_tip_stats_command():
+    modules.tip_stats.rebuild()
+
+
+@app.cli.command('workers')
+def workers_command():
+    modules.jobs.run_workers()
+
+
 if __name__ == "__main__":
     modules.db.db_init()
     logger.info("db initialized from wsgi")
     modules.social.telegram_set_webhook()
     start_runner()
+    start_background_tasks()
     app.run(host='0.0.0.0', port=3003)
@@ -1,4 +1,6 @@
-from webhooks import app
+from webhooks import app, start_background_tasks
+
+start_background_tasks()
 
 if __name__ == "__main__":
     app.run()